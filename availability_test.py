@@ -0,0 +1,708 @@
+import requests
+import json
+from datetime import datetime, timedelta, timezone
+import uuid
+
+class AvailabilityTester:
+    def __init__(self, base_url="https://daylane-booking.preview.emergentagent.com"):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.token = None
+        self.tenant_id = None
+        self.tenant_slug = None
+        self.test_data = {}
+
+    def run_test(self, name, method, endpoint, expected_status, data=None, params=None, headers=None):
+        """Run a single API test"""
+        url = f"{self.api_url}/{endpoint}"
+        headers = {'Content-Type': 'application/json', **(headers or {})}
+
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+
+        print(f"\n🔍 {name}")
+        print(f"   {method} {url}")
+
+        try:
+            if method == 'GET':
+                response = requests.get(url, headers=headers, params=params, timeout=10)
+            elif method == 'POST':
+                response = requests.post(url, json=data, headers=headers, timeout=10)
+            elif method == 'PUT':
+                response = requests.put(url, json=data, headers=headers, timeout=10)
+            elif method == 'DELETE':
+                response = requests.delete(url, headers=headers, timeout=10)
+
+            success = response.status_code == expected_status
+
+            if success:
+                print(f"   ✅ Status: {response.status_code}")
+                try:
+                    response_data = response.json()
+                    return True, response_data
+                except:
+                    return True, {}
+            else:
+                print(f"   ❌ Expected {expected_status}, got {response.status_code}")
+                try:
+                    error_data = response.json()
+                    print(f"   Error: {error_data}")
+                except:
+                    print(f"   Error: {response.text}")
+                return False, {}
+
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+            return False, {}
+
+    def next_monday(self, weeks_ahead=1):
+        """Date string of a Monday in the future (staff work Monday-Friday by default)"""
+        today = datetime.now(timezone.utc).date()
+        monday = today + timedelta(days=(7 - today.weekday()) + 7 * (weeks_ahead - 1))
+        return monday.strftime("%Y-%m-%d")
+
+    def setup_test_environment(self):
+        """Setup test tenant, staff, and services"""
+        print("🚀 Setting up test environment...")
+
+        timestamp = datetime.now().strftime('%H%M%S')
+        tenant_data = {
+            "name": f"Availability Test Salon {timestamp}",
+            "slug": f"availability-test-{timestamp}",
+            "email": f"availability{timestamp}@example.com",
+            "password": "TestPass123!",
+            "phone": "+41 44 123 45 67"
+        }
+
+        success, response = self.run_test(
+            "Register Test Tenant", "POST", "auth/register", 200, tenant_data)
+
+        if success and 'access_token' in response:
+            self.token = response['access_token']
+            self.tenant_id = response['tenant']['id']
+            self.tenant_slug = response['tenant']['slug']
+            print(f"   ✅ Tenant registered: {response['tenant']['name']}")
+        else:
+            return False
+
+        staff_data = {"name": "Test Mitarbeiter", "color_tag": "#3B82F6"}
+        success, response = self.run_test(
+            "Create Test Staff", "POST", "staff", 200, staff_data)
+
+        if success:
+            self.test_data['staff_id'] = response['id']
+            print(f"   ✅ Staff created: {response['name']}")
+        else:
+            return False
+
+        # 45 minutes + 15 minutes buffer = one hour per booking
+        service_data = {
+            "name": "Haarschnitt",
+            "description": "Service for availability testing",
+            "duration_minutes": 45,
+            "price_chf": 60.0,
+            "buffer_minutes": 15
+        }
+        success, response = self.run_test(
+            "Create Test Service", "POST", "services", 200, service_data)
+
+        if success:
+            self.test_data['service_id'] = response['id']
+            print(f"   ✅ Service created: {response['name']}")
+            return True
+        else:
+            return False
+
+    def get_slot_times(self, date):
+        slots = self.get_slots(date)
+        if slots is None:
+            return None
+        return [slot['time'] for slot in slots]
+
+    def get_slots(self, date):
+        """Slots in the staff member's local time (Europe/Zurich by default)"""
+        success, response = self.run_test(
+            f"Availability for {date}", "GET", f"public/{self.tenant_slug}/availability", 200,
+            params={
+                "service_id": self.test_data['service_id'],
+                "staff_id": self.test_data['staff_id'],
+                "date": date
+            })
+        if not success:
+            return None
+        return response.get('slots', [])
+
+    def test_single_day_availability(self):
+        """Slots respect working hours, appointments incl. buffer and closures"""
+        print("\n📅 Testing single-day availability...")
+        monday = self.next_monday()
+
+        slots = self.get_slots(monday)
+        if slots is None:
+            return False
+
+        times = [slot['time'] for slot in slots]
+        if not times or times[0] != "09:00" or times[-1] != "16:00":
+            print(f"   ❌ Unexpected slots for empty day: {times}")
+            return False
+        print(f"   ✅ Empty day offers {len(times)} slots from {times[0]} to {times[-1]}")
+
+        # 09:00 Zurich time is 07:00 or 08:00 UTC depending on daylight saving time
+        first_start = datetime.fromisoformat(slots[0]['start_at'])
+        if first_start.utcoffset() != timedelta(0) or first_start.hour not in (7, 8):
+            print(f"   ❌ Slot start not converted to UTC: {slots[0]['start_at']}")
+            return False
+        print(f"   ✅ Local 09:00 starts at {slots[0]['start_at']}")
+
+        # Book 10:00 - 11:00 local time (duration + buffer)
+        appointment_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": slots[times.index("10:00")]['start_at'],
+            "customer_name": "Anna Müller"
+        }
+        success, _ = self.run_test(
+            "Book 10:00", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data)
+        if not success:
+            return False
+
+        slots = self.get_slot_times(monday)
+        if slots is None:
+            return False
+
+        blocked = [time for time in ["09:30", "10:00", "10:30"] if time in slots]
+        if blocked:
+            print(f"   ❌ Booked times still offered: {blocked}")
+            return False
+        if "09:00" not in slots or "11:00" not in slots:
+            print(f"   ❌ Adjacent free times missing: {slots}")
+            return False
+        print("   ✅ Booked hour and overlapping starts are excluded")
+
+        # Partial closure 12:00 - 13:00
+        closure_data = {"date": monday, "reason": "Mittagspause", "all_day": False, "start_time": "12:00", "end_time": "13:00"}
+        success, _ = self.run_test(
+            "Create partial closure", "POST", f"staff/{self.test_data['staff_id']}/closures", 200, closure_data)
+        if not success:
+            return False
+
+        slots = self.get_slot_times(monday)
+        if slots is None or "12:00" in slots or "11:30" in slots or "13:00" not in slots:
+            print(f"   ❌ Partial closure not respected: {slots}")
+            return False
+        print("   ✅ Partial closure respected")
+
+        # Weekends are not working days by default
+        sunday = (datetime.strptime(monday, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        slots = self.get_slot_times(sunday)
+        if slots != []:
+            print(f"   ❌ Sunday should have no slots: {slots}")
+            return False
+        print("   ✅ Non-working day has no slots")
+        return True
+
+    def test_range_availability(self):
+        """Range mode returns per-day counts and slots and enforces the window limit"""
+        print("\n🗓️ Testing range availability...")
+        monday = self.next_monday(weeks_ahead=2)
+        sunday = (datetime.strptime(monday, "%Y-%m-%d") + timedelta(days=6)).strftime("%Y-%m-%d")
+
+        success, response = self.run_test(
+            "Week counts for all staff", "GET", f"public/{self.tenant_slug}/availability/range", 200,
+            params={"service_id": self.test_data['service_id'], "from": monday, "to": sunday, "counts_only": "true"})
+        if not success:
+            return False
+
+        counts = [day['count'] for day in response.get('days', [])]
+        if len(counts) != 7 or counts[:5] != [15] * 5 or counts[5:] != [0, 0]:
+            print(f"   ❌ Unexpected week counts: {counts}")
+            return False
+        if any('slots' in staff for staff in response['days'][0]['staff'].values()):
+            print("   ❌ counts_only response should not contain slot lists")
+            return False
+        print(f"   ✅ Week counts: {counts}")
+
+        success, response = self.run_test(
+            "Single staff slot lists", "GET", f"public/{self.tenant_slug}/availability/range", 200,
+            params={"service_id": self.test_data['service_id'], "staff_id": self.test_data['staff_id'], "from": monday, "to": monday})
+        if not success:
+            return False
+        slots = response['days'][0]['staff'][self.test_data['staff_id']]['slots']
+        if len(slots) != 15 or slots[0]['time'] != "09:00":
+            print(f"   ❌ Unexpected slot list: {slots}")
+            return False
+        print("   ✅ Slot lists returned per staff member")
+
+        too_far = (datetime.strptime(monday, "%Y-%m-%d") + timedelta(days=60)).strftime("%Y-%m-%d")
+        success, _ = self.run_test(
+            "Range longer than 60 days", "GET", f"public/{self.tenant_slug}/availability/range", 400,
+            params={"service_id": self.test_data['service_id'], "from": monday, "to": too_far})
+        return success
+
+    def test_any_staff_booking(self):
+        """Availability without staff_id merges staff, booking without staff_id assigns one"""
+        print("\n👥 Testing any-staff availability and assignment...")
+        monday = self.next_monday(weeks_ahead=3)
+
+        success, response = self.run_test(
+            "Any-staff availability", "GET", f"public/{self.tenant_slug}/availability", 200,
+            params={"service_id": self.test_data['service_id'], "date": monday})
+        if not success:
+            return False
+
+        slots = response.get('slots', [])
+        if not slots or any(self.test_data['staff_id'] not in slot.get('staff_ids', []) for slot in slots):
+            print(f"   ❌ Slots should list the free staff: {slots[:3]}")
+            return False
+        print(f"   ✅ {len(slots)} merged slots with staff lists")
+
+        appointment_data = {
+            "service_id": self.test_data['service_id'],
+            "start_at": slots[0]['start_at'],
+            "customer_name": "Lukas Meier"
+        }
+        success, response = self.run_test(
+            "Book without staff preference", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data)
+        if not success:
+            return False
+        if response['appointment']['staff_id'] != self.test_data['staff_id']:
+            print(f"   ❌ Unexpected staff assigned: {response['appointment']['staff_id']}")
+            return False
+        print("   ✅ Free staff member assigned by the server")
+
+        # The only staff member is now busy at that time
+        success, _ = self.run_test(
+            "Book same time without staff preference", "POST", f"public/{self.tenant_slug}/appointments", 400, appointment_data)
+        return success
+
+    def test_next_available(self):
+        """Earliest slots are returned in chronological order and limited"""
+        print("\n⏩ Testing next available slots...")
+        success, response = self.run_test(
+            "Next 5 available slots", "GET", f"public/{self.tenant_slug}/next-available", 200,
+            params={"service_id": self.test_data['service_id'], "limit": 5})
+        if not success:
+            return False
+
+        slots = response.get('slots', [])
+        start_times = [slot['start_at'] for slot in slots]
+        if len(slots) != 5 or start_times != sorted(start_times):
+            print(f"   ❌ Expected 5 chronological slots: {start_times}")
+            return False
+        if start_times[0] < datetime.now(timezone.utc).isoformat():
+            print(f"   ❌ First slot lies in the past: {start_times[0]}")
+            return False
+        print(f"   ✅ First available: {slots[0]['date']} {slots[0]['time']}")
+
+        success, _ = self.run_test(
+            "Horizon too long", "GET", f"public/{self.tenant_slug}/next-available", 400,
+            params={"service_id": self.test_data['service_id'], "horizon_days": 1000})
+        return success
+
+    def test_slot_holds(self):
+        """A held slot is hidden from others and converted into the booking"""
+        print("\n⏳ Testing slot holds...")
+        monday = self.next_monday(weeks_ahead=5)
+        slots = self.get_slots(monday)
+        if not slots:
+            return False
+
+        hold_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": slots[0]['start_at']
+        }
+        success, hold = self.run_test(
+            "Hold first slot", "POST", f"public/{self.tenant_slug}/holds", 200, hold_data)
+        if not success:
+            return False
+
+        times = self.get_slot_times(monday)
+        if times is None or slots[0]['time'] in times:
+            print(f"   ❌ Held slot still offered: {times}")
+            return False
+        print("   ✅ Held slot hidden from availability")
+
+        success, _ = self.run_test(
+            "Second hold on same slot", "POST", f"public/{self.tenant_slug}/holds", 400, hold_data)
+        if not success:
+            return False
+
+        appointment_data = {**hold_data, "customer_name": "Petra Frei"}
+        success, _ = self.run_test(
+            "Book held slot without hold", "POST", f"public/{self.tenant_slug}/appointments", 400, appointment_data)
+        if not success:
+            return False
+
+        appointment_data["hold_id"] = hold['id']
+        success, response = self.run_test(
+            "Confirm hold", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data)
+        if not success:
+            return False
+        if datetime.fromisoformat(response['appointment']['start_at'].replace('Z', '+00:00')) != datetime.fromisoformat(slots[0]['start_at']):
+            print(f"   ❌ Appointment does not match the hold: {response['appointment']}")
+            return False
+        print("   ✅ Hold converted into appointment")
+
+        success, _ = self.run_test(
+            "Confirm hold twice", "POST", f"public/{self.tenant_slug}/appointments", 400, appointment_data)
+        if not success:
+            return False
+
+        # Released holds free the slot again
+        hold_data['start_at'] = next(slot['start_at'] for slot in slots if slot['time'] == "11:00")
+        success, hold = self.run_test(
+            "Hold 11:00", "POST", f"public/{self.tenant_slug}/holds", 200, hold_data)
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "Release hold", "DELETE", f"public/{self.tenant_slug}/holds/{hold['id']}", 200)
+        times = self.get_slot_times(monday)
+        if not success or times is None or "11:00" not in times:
+            print(f"   ❌ Released slot not offered again: {times}")
+            return False
+        print("   ✅ Released slot offered again")
+        return True
+
+    def test_slot_events(self):
+        """Open booking pages receive a slot event when an appointment is booked"""
+        print("\n📡 Testing slot change events...")
+        monday = self.next_monday(weeks_ahead=4)
+        slots = self.get_slots(monday)
+        if not slots:
+            return False
+
+        try:
+            stream = requests.get(f"{self.api_url}/public/{self.tenant_slug}/events", stream=True, timeout=10)
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+            return False
+        if stream.status_code != 200 or not stream.headers.get('content-type', '').startswith('text/event-stream'):
+            print(f"   ❌ Unexpected event stream response: {stream.status_code}")
+            return False
+        print("   ✅ Event stream opened")
+
+        appointment_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": slots[0]['start_at'],
+            "customer_name": "Sandra Keller"
+        }
+        success, _ = self.run_test(
+            "Book while stream is open", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data)
+        if not success:
+            stream.close()
+            return False
+
+        event_name = None
+        try:
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event_name = line[len("event: "):]
+                elif line.startswith("data: ") and event_name == "slots":
+                    event = json.loads(line[len("data: "):])
+                    if event['staff_id'] == self.test_data['staff_id'] and monday in event['dates']:
+                        print(f"   ✅ Slot event received: {event}")
+                        return True
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+        finally:
+            stream.close()
+
+        print("   ❌ No slot event received")
+        return False
+
+    def test_appointment_series(self):
+        """A fortnightly series blocks all its dates and skips conflicts on request"""
+        print("\n🔁 Testing appointment series...")
+        mondays = [self.next_monday(weeks_ahead=weeks) for weeks in (6, 8, 10, 12)]
+        first_slots = self.get_slots(mondays[0])
+        taken_slots = self.get_slots(mondays[1])
+        if not first_slots or not taken_slots:
+            return False
+
+        success, _ = self.run_test(
+            "Book single appointment on second date", "POST", "appointments", 200, {
+                "service_id": self.test_data['service_id'],
+                "staff_id": self.test_data['staff_id'],
+                "start_at": next(slot['start_at'] for slot in taken_slots if slot['time'] == "14:00"),
+                "customer_name": "Einzeltermin"
+            })
+        if not success:
+            return False
+
+        series_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": next(slot['start_at'] for slot in first_slots if slot['time'] == "14:00"),
+            "rule": {"interval_weeks": 2, "count": 4},
+            "customer_name": "Stammkundin Meier"
+        }
+        success, _ = self.run_test(
+            "Series with conflict", "POST", "appointment-series", 400, series_data)
+        if not success:
+            return False
+
+        series_data["skip_conflicts"] = True
+        success, series = self.run_test(
+            "Series skipping conflicts", "POST", "appointment-series", 200, series_data)
+        if not success:
+            return False
+        if series['exceptions'] != [mondays[1]]:
+            print(f"   ❌ Conflicting date not skipped: {series['exceptions']}")
+            return False
+        print("   ✅ Conflicting date skipped")
+
+        success, occurrences = self.run_test(
+            "Series occurrences", "GET", f"appointment-series/{series['id']}/occurrences", 200,
+            params={"from_date": mondays[0], "to_date": mondays[-1]})
+        if not success or [occurrence['date'] for occurrence in occurrences] != [mondays[0], mondays[2], mondays[3]]:
+            print(f"   ❌ Unexpected occurrences: {occurrences}")
+            return False
+
+        times = self.get_slot_times(mondays[2])
+        if times is None or "14:00" in times:
+            print(f"   ❌ Series occurrence still offered: {times}")
+            return False
+        print("   ✅ Series occurrence hidden from availability")
+
+        success, _ = self.run_test(
+            "Skip one occurrence", "POST", f"appointment-series/{series['id']}/skip", 200, {"date": mondays[2]})
+        times = self.get_slot_times(mondays[2])
+        if not success or times is None or "14:00" not in times:
+            print(f"   ❌ Skipped occurrence not offered again: {times}")
+            return False
+        print("   ✅ Skipped occurrence offered again")
+
+        success, _ = self.run_test(
+            "Delete series", "DELETE", f"appointment-series/{series['id']}", 200)
+        times = self.get_slot_times(mondays[3])
+        if not success or times is None or "14:00" not in times:
+            print(f"   ❌ Deleted series still blocks slots: {times}")
+            return False
+        print("   ✅ Deleted series frees its dates")
+        return True
+
+    def test_idempotent_booking(self):
+        """Retries with the same Idempotency-Key return the first booking"""
+        print("\n🔂 Testing idempotent booking...")
+        monday = self.next_monday(weeks_ahead=7)
+        slots = self.get_slots(monday)
+        if not slots:
+            return False
+
+        appointment_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": slots[0]['start_at'],
+            "customer_name": "Retry Kunde"
+        }
+        key = {"Idempotency-Key": str(uuid.uuid4())}
+        success, first = self.run_test(
+            "Book with key", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data, headers=key)
+        if not success:
+            return False
+        success, retry = self.run_test(
+            "Retry with same key", "POST", f"public/{self.tenant_slug}/appointments", 200, appointment_data, headers=key)
+        if not success or retry['appointment']['id'] != first['appointment']['id']:
+            print(f"   ❌ Retry created a different appointment: {retry}")
+            return False
+        print("   ✅ Retry answered with the first booking")
+
+        success, _ = self.run_test(
+            "Same key, different booking", "POST", f"public/{self.tenant_slug}/appointments", 422,
+            {**appointment_data, "customer_name": "Andere Kundin"}, headers=key)
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "New key for taken slot", "POST", f"public/{self.tenant_slug}/appointments", 400,
+            appointment_data, headers={"Idempotency-Key": str(uuid.uuid4())})
+        return success
+
+    def test_class_booking(self):
+        """A class service sells seats until its capacity is reached"""
+        print("\n👥 Testing class booking...")
+        success, service = self.run_test(
+            "Create class service", "POST", "services", 200,
+            {"name": "Yoga Kurs", "duration_minutes": 60, "price_chf": 25.0, "buffer_minutes": 0, "capacity": 2})
+        if not success:
+            return False
+
+        monday = self.next_monday(weeks_ahead=9)
+        params = {"service_id": service['id'], "staff_id": self.test_data['staff_id'], "date": monday}
+        success, response = self.run_test(
+            "Class availability", "GET", f"public/{self.tenant_slug}/availability", 200, params=params)
+        if not success or not response.get('slots'):
+            return False
+        slot = response['slots'][0]
+        if slot.get('seats_left') != 2:
+            print(f"   ❌ Expected 2 free seats, got {slot}")
+            return False
+
+        for name in ("Kursteilnehmerin A", "Kursteilnehmer B"):
+            success, _ = self.run_test(
+                f"Book seat for {name}", "POST", f"public/{self.tenant_slug}/appointments", 200,
+                {"service_id": service['id'], "staff_id": self.test_data['staff_id'],
+                 "start_at": slot['start_at'], "customer_name": name})
+            if not success:
+                return False
+
+        success, _ = self.run_test(
+            "Book seat in full class", "POST", f"public/{self.tenant_slug}/appointments", 400,
+            {"service_id": service['id'], "staff_id": self.test_data['staff_id'],
+             "start_at": slot['start_at'], "customer_name": "Zu spät"})
+        if not success:
+            return False
+
+        success, response = self.run_test(
+            "Class availability after booking", "GET", f"public/{self.tenant_slug}/availability", 200, params=params)
+        if not success or any(s['start_at'] == slot['start_at'] for s in response.get('slots', [])):
+            print("   ❌ Full class is still offered")
+            return False
+        print("   ✅ Class closed after the last seat")
+        return True
+
+    def test_service_chain(self):
+        """Two services booked back to back in one request"""
+        print("\n🔗 Testing service chain...")
+        success, color = self.run_test(
+            "Create second service", "POST", "services", 200,
+            {"name": "Färben", "duration_minutes": 30, "price_chf": 80.0, "buffer_minutes": 0})
+        if not success:
+            return False
+
+        monday = self.next_monday(weeks_ahead=11)
+        service_ids = [self.test_data['service_id'], color['id']]
+        params = {"service_ids": service_ids, "staff_id": self.test_data['staff_id'], "date": monday}
+        success, response = self.run_test(
+            "Chain availability", "GET", f"public/{self.tenant_slug}/availability/chain", 200, params=params)
+        if not success or not response.get('slots'):
+            return False
+        slot = response['slots'][0]
+        if response['slot_minutes'] != 90 or slot['steps'][1]['start_at'] != slot['steps'][0]['end_at']:
+            print(f"   ❌ Steps are not back to back: {slot}")
+            return False
+
+        success, response = self.run_test(
+            "Book chain", "POST", f"public/{self.tenant_slug}/appointments", 200,
+            {"service_ids": service_ids, "staff_id": self.test_data['staff_id'],
+             "start_at": slot['start_at'], "customer_name": "Schnitt und Farbe"})
+        if not success:
+            return False
+        parts = response.get('appointments', [])
+        if [part['service_id'] for part in parts] != service_ids or parts[0]['chain_id'] != parts[1]['chain_id']:
+            print(f"   ❌ Unexpected chain parts: {parts}")
+            return False
+        print(f"   ✅ Booked {parts[0]['start_at']} - {parts[1]['end_at']}")
+
+        slot_times = self.get_slot_times(monday)
+        if slot_times is None or slot['time'] in slot_times:
+            print("   ❌ Chain start is still offered")
+            return False
+        return True
+
+    def test_resource_requirements(self):
+        """A service needing a room is only offered while a room is free"""
+        print("\n🚪 Testing resource requirements...")
+        success, service = self.run_test(
+            "Create service needing a room", "POST", "services", 200,
+            {"name": "Massage", "duration_minutes": 60, "price_chf": 90.0, "buffer_minutes": 0, "required_resource_kinds": ["room"]})
+        if not success:
+            return False
+
+        monday = self.next_monday(weeks_ahead=13)
+        params = {"service_id": service['id'], "staff_id": self.test_data['staff_id'], "date": monday}
+        success, response = self.run_test(
+            "Availability without rooms", "GET", f"public/{self.tenant_slug}/availability", 200, params=params)
+        if not success or response['slots']:
+            print("   ❌ Slots offered without any room")
+            return False
+
+        success, room = self.run_test(
+            "Create room", "POST", "resources", 200, {"name": "Behandlungsraum 1", "kind": "room"})
+        if not success:
+            return False
+        success, response = self.run_test(
+            "Availability with a room", "GET", f"public/{self.tenant_slug}/availability", 200, params=params)
+        if not success or not response['slots']:
+            return False
+
+        success, response = self.run_test(
+            "Book service with room", "POST", f"public/{self.tenant_slug}/appointments", 200,
+            {"service_id": service['id'], "staff_id": self.test_data['staff_id'],
+             "start_at": response['slots'][0]['start_at'], "customer_name": "Raum Kundin"})
+        if not success or response['appointment']['resource_ids'] != [room['id']]:
+            print(f"   ❌ Room not booked with the appointment: {response}")
+            return False
+        print("   ✅ Room booked with the appointment")
+        return True
+
+    def test_availability_validation(self):
+        """Invalid input is rejected"""
+        print("\n🚫 Testing availability validation...")
+        params = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "date": "15.06.2025"
+        }
+        success_date, _ = self.run_test(
+            "Invalid date format", "GET", f"public/{self.tenant_slug}/availability", 400, params=params)
+
+        params["date"] = self.next_monday()
+        params["service_id"] = str(uuid.uuid4())
+        success_service, _ = self.run_test(
+            "Unknown service", "GET", f"public/{self.tenant_slug}/availability", 404, params=params)
+
+        success_slug, _ = self.run_test(
+            "Unknown salon", "GET", "public/does-not-exist-xyz/availability", 404, params=params)
+
+        return success_date and success_service and success_slug
+
+    def run_all_tests(self):
+        """Run all availability tests"""
+        print("🎯 AVAILABILITY ENGINE TESTING")
+        print("=" * 60)
+
+        if not self.setup_test_environment():
+            print("❌ Failed to setup test environment")
+            return False
+
+        tests = [
+            ("Single-Day Availability", self.test_single_day_availability),
+            ("Range Availability", self.test_range_availability),
+            ("Any-Staff Booking", self.test_any_staff_booking),
+            ("Next Available", self.test_next_available),
+            ("Slot Holds", self.test_slot_holds),
+            ("Slot Events", self.test_slot_events),
+            ("Appointment Series", self.test_appointment_series),
+            ("Idempotent Booking", self.test_idempotent_booking),
+            ("Class Booking", self.test_class_booking),
+            ("Service Chain", self.test_service_chain),
+            ("Resource Requirements", self.test_resource_requirements),
+            ("Availability Validation", self.test_availability_validation)
+        ]
+
+        results = {}
+        for test_name, test_func in tests:
+            print(f"\n{'='*20} {test_name} {'='*20}")
+            results[test_name] = test_func()
+
+        print(f"\n{'='*60}")
+        print("📊 AVAILABILITY TEST RESULTS")
+        print(f"{'='*60}")
+
+        all_passed = True
+        for test_name, passed in results.items():
+            status = "✅ PASSED" if passed else "❌ FAILED"
+            print(f"{test_name}: {status}")
+            if not passed:
+                all_passed = False
+
+        overall_status = "✅ ALL TESTS PASSED" if all_passed else "❌ SOME TESTS FAILED"
+        print(f"\nOverall Result: {overall_status}")
+
+        return all_passed
+
+if __name__ == "__main__":
+    tester = AvailabilityTester()
+    tester.run_all_tests()
@@ -0,0 +1,112 @@
+"""Benchmark: per-document cost of the model codecs vs. the former recursive helpers.
+
+Decodes and encodes 1,000 appointment documents as read from MongoDB. The former
+path (kept below for comparison) walked every document, parsed ISO strings and
+validated the model; the codec converts only the model's known fields.
+
+Usage: python bench_codecs.py [--repeat 5] [--documents 1000]
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# server.py reads these at import time; the benchmark never touches the database
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'daylane_benchmark')
+
+from bson import ObjectId
+from server import Appointment, from_mongo, to_mongo
+
+def legacy_prepare_for_mongo(data):
+    """Former write path: datetimes to ISO strings, recursively"""
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if isinstance(value, datetime):
+                result[key] = value.isoformat()
+            elif isinstance(value, dict):
+                result[key] = legacy_prepare_for_mongo(value)
+            elif isinstance(value, list):
+                result[key] = [legacy_prepare_for_mongo(item) if isinstance(item, dict) else item for item in value]
+            else:
+                result[key] = value
+        return result
+    return data
+
+def legacy_parse_from_mongo(item):
+    """Former read path: ISO strings of a fixed key list back to datetimes, recursively"""
+    if isinstance(item, dict):
+        result = {}
+        for key, value in item.items():
+            if key == '_id':
+                continue
+            elif key in ['created_at', 'trial_start', 'trial_end', 'start_at', 'end_at'] and isinstance(value, str):
+                try:
+                    result[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                except:
+                    result[key] = value
+            elif isinstance(value, dict):
+                result[key] = legacy_parse_from_mongo(value)
+            elif isinstance(value, list):
+                result[key] = [legacy_parse_from_mongo(item) if isinstance(item, dict) else item for item in value]
+            else:
+                result[key] = value
+        return result
+    return item
+
+def make_appointments(rng: random.Random, count: int):
+    start = datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)
+    appointments = []
+    for index in range(count):
+        start_at = start + timedelta(minutes=30 * index)
+        appointments.append(Appointment(
+            tenant_id="tenant",
+            service_id=str(uuid.UUID(int=rng.getrandbits(128))),
+            staff_id=str(uuid.UUID(int=rng.getrandbits(128))),
+            start_at=start_at,
+            end_at=start_at + timedelta(minutes=rng.choice([30, 45, 60])),
+            customer_name=f"Kunde {index}",
+            customer_email=f"kunde{index}@example.com",
+            customer_phone="+41 44 123 45 67",
+            notes=rng.choice([None, "Erstbesuch", "Allergie beachten"])
+        ))
+    return appointments
+
+def time_call(function, batches) -> float:
+    """Best wall time over the prepared batches in milliseconds (one run per batch)"""
+    best = float("inf")
+    for batch in batches:
+        started = time.perf_counter()
+        function(batch)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def run(repeat: int, documents: int):
+    appointments = make_appointments(random.Random(42), documents)
+    # What MongoDB returns: ISO strings before the datetime migration, BSON dates now
+    string_docs = [{"_id": ObjectId(), **legacy_prepare_for_mongo(appointment.dict())} for appointment in appointments]
+    date_docs = [{"_id": ObjectId(), **to_mongo(appointment)} for appointment in appointments]
+    if [from_mongo(Appointment, dict(doc)) for doc in date_docs] != [Appointment(**legacy_parse_from_mongo(doc)) for doc in string_docs]:
+        raise AssertionError("Decoded appointments differ")
+    
+    # Codecs convert documents in place, so every run gets fresh copies
+    copies = lambda docs: [[dict(doc) for doc in docs] for _ in range(repeat)]
+    rows = [
+        ("decode", "former", time_call(lambda docs: [Appointment(**legacy_parse_from_mongo(doc)) for doc in docs], copies(string_docs))),
+        ("decode", "codec", time_call(lambda docs: [from_mongo(Appointment, doc) for doc in docs], copies(date_docs))),
+        ("encode", "former", time_call(lambda items: [legacy_prepare_for_mongo(item.dict()) for item in items], [appointments] * repeat)),
+        ("encode", "codec", time_call(lambda items: [to_mongo(item) for item in items], [appointments] * repeat)),
+    ]
+    print(f"{'direction':<10} {'path':<8} {'ms per ' + str(documents):>12} {'us per doc':>11}")
+    for direction, path, ms in rows:
+        print(f"{direction:<10} {path:<8} {ms:>12.2f} {ms * 1000 / documents:>11.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--documents", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.repeat, args.documents)
@@ -0,0 +1,43 @@
+"""Create the declared MongoDB indexes, or check them against the database.
+
+Creating is idempotent; the API does the same at startup. The check lists declared
+indexes that are missing, indexes that exist but are not declared, and indexes
+without any recorded use since the last MongoDB restart.
+
+Usage: python manage_indexes.py [--check]
+"""
+import argparse
+import asyncio
+import sys
+
+from server import DECLARED_INDEXES, check_indexes, client, ensure_indexes
+
+async def create() -> int:
+    failed = await ensure_indexes()
+    for collection_name in DECLARED_INDEXES:
+        print(f"{collection_name:<24} {'failed' if collection_name in failed else 'ok'}")
+    return 1 if failed else 0
+
+async def check() -> int:
+    report = await check_indexes()
+    for entry in report["missing"]:
+        print(f"missing     {entry['collection']:<24} {', '.join(f'{field} {direction}' for field, direction in entry['keys'])}")
+    for entry in report["undeclared"]:
+        print(f"undeclared  {entry['collection']:<24} {entry['name']}")
+    for entry in report["unused"]:
+        print(f"unused      {entry['collection']:<24} {entry['name']} (no use since {entry['since']:%Y-%m-%d %H:%M})")
+    if not any(report.values()):
+        print("All declared indexes exist and are used")
+    return 1 if report["missing"] else 0
+
+async def run(check_only: bool) -> int:
+    try:
+        return await (check() if check_only else create())
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="Report missing, undeclared and unused indexes instead of creating")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.check)))
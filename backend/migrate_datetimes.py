@@ -0,0 +1,27 @@
+"""Convert datetimes stored as ISO strings by earlier versions to BSON dates.
+
+Runs in batches and records its progress per collection in the migrations
+collection, so an interrupted run resumes where it stopped; a finished
+collection is scanned again for strings written since (e.g. by old workers
+during a rolling deploy). The API migrates only collections never finished at
+startup; run this command ahead of a deploy and again once old workers are gone.
+
+Usage: python migrate_datetimes.py [--batch-size 500] [--collection appointments]
+"""
+import argparse
+import asyncio
+
+from server import DATETIME_FIELDS, DATETIME_MIGRATION_BATCH_SIZE, client, migrate_datetime_fields
+
+async def run(batch_size: int, collections):
+    for collection_name in collections:
+        converted = await migrate_datetime_fields(collection_name, DATETIME_FIELDS[collection_name], batch_size)
+        print(f"{collection_name:<28} {converted:>8} converted")
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=DATETIME_MIGRATION_BATCH_SIZE)
+    parser.add_argument("--collection", action="append", choices=sorted(DATETIME_FIELDS), help="Only this collection (repeatable)")
+    args = parser.parse_args()
+    asyncio.run(run(args.batch_size, args.collection or list(DATETIME_FIELDS)))
@@ -0,0 +1,35 @@
+"""Recount the monthly appointment counters and correct those that drifted.
+
+Counters changed by bookings while the recount runs are left alone and corrected
+by the next run. Run it from one scheduler (cron or a single worker), not from
+every API instance; with --interval it keeps running and recounts periodically.
+
+Usage: python reconcile_usage.py [--tenant TENANT_ID] [--interval 3600]
+"""
+import argparse
+import asyncio
+
+from server import client, logger, reconcile_usage_snapshots
+
+async def run(tenant_id, interval: int):
+    try:
+        while True:
+            try:
+                fixed = await reconcile_usage_snapshots(tenant_id)
+                print(f"{fixed} monthly counters updated")
+            except Exception as e:
+                if not interval:
+                    raise
+                logger.error(f"Usage reconcile failed: {str(e)}")
+            if not interval:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenant", help="Only this tenant")
+    parser.add_argument("--interval", type=int, default=0, help="Seconds between runs (default: run once)")
+    args = parser.parse_args()
+    asyncio.run(run(args.tenant, args.interval))
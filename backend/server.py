@@ -1,16 +1,36 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Request
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, status, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta, timezone
+from pymongo import IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Union, get_args, get_origin
+from datetime import datetime, date, timedelta, timezone
 from passlib.context import CryptContext
 import jwt
 import os
 import uuid
+import json
+import csv
+import codecs
+import hashlib
+import tempfile
+import time
+import asyncio
+import random
+import re
 import logging
+import smtplib
+from email.message import EmailMessage
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from pathlib import Path
 from enum import Enum
 
@@ -22,7 +42,8 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Datetimes are stored as BSON dates and read back as aware UTC datetimes
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 app = FastAPI(title="Daylane Booking API")
@@ -44,6 +65,13 @@ class AppointmentStatus(str, Enum):
     CONFIRMED = "confirmed"
     CANCELLED = "cancelled"
 
+class WaitlistStatus(str, Enum):
+    WAITING = "waiting"
+    OFFERED = "offered"  # A freed slot is held for the customer
+    BOOKED = "booked"
+    EXPIRED = "expired"
+    CANCELLED = "cancelled"
+
 # Data Models
 class Tenant(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -109,11 +137,13 @@ class Staff(BaseModel):
 class StaffCreate(BaseModel):
     name: str
     working_hours: Optional[WeeklySchedule] = None
+    timezone: Optional[str] = None
     color_tag: Optional[str] = "#3B82F6"
 
 class StaffUpdate(BaseModel):
     name: Optional[str] = None
     working_hours: Optional[WeeklySchedule] = None
+    timezone: Optional[str] = None
     color_tag: Optional[str] = None
     active: Optional[bool] = None
 
@@ -132,6 +162,8 @@ class Service(BaseModel):
     duration_minutes: int
     price_chf: float
     buffer_minutes: int = 0
+    capacity: int = 1  # Customers per time slot; above 1 the service is a class
+    required_resource_kinds: List[str] = []  # One free resource of each kind is booked with the service
     active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -141,6 +173,35 @@ class ServiceCreate(BaseModel):
     duration_minutes: int
     price_chf: float
     buffer_minutes: int = 0
+    capacity: int = 1
+    required_resource_kinds: List[str] = []
+
+class ServiceUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    duration_minutes: Optional[int] = None
+    price_chf: Optional[float] = None
+    buffer_minutes: Optional[int] = None
+    capacity: Optional[int] = None
+    required_resource_kinds: Optional[List[str]] = None
+    active: Optional[bool] = None
+
+class Resource(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tenant_id: str
+    name: str
+    kind: str  # e.g. "room" or "laser"; resources of one kind are interchangeable
+    active: bool = True
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ResourceCreate(BaseModel):
+    name: str
+    kind: str
+
+class ResourceUpdate(BaseModel):
+    name: Optional[str] = None
+    kind: Optional[str] = None
+    active: Optional[bool] = None
 
 class Appointment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -154,24 +215,139 @@ class Appointment(BaseModel):
     customer_phone: Optional[str] = None
     notes: Optional[str] = None
     status: AppointmentStatus = AppointmentStatus.CONFIRMED
+    session_id: Optional[str] = None  # Class session this appointment holds a seat in
+    chain_id: Optional[str] = None  # Shared by the parts of a multi-service booking
+    resource_ids: List[str] = []  # Rooms and equipment booked with the appointment
+    # Display fields copied from the service and staff member when the appointment is written
+    service_name: Optional[str] = None
+    price_chf: Optional[float] = None
+    duration_minutes: Optional[int] = None
+    staff_name: Optional[str] = None
+    staff_color: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class AppointmentChain(BaseModel):
+    chain_id: str
+    appointments: List[Appointment]  # One per service, in booking order
+
 class AppointmentCreate(BaseModel):
+    service_id: Optional[str] = None
+    service_ids: Optional[List[str]] = None  # Several services booked back to back, in this order
+    staff_id: Optional[str] = None  # None lets the server assign any free staff member
+    mixed_staff: bool = False  # Each service of service_ids may go to a different staff member
+    start_at: datetime
+    customer_name: str
+    customer_email: Optional[EmailStr] = None
+    customer_phone: Optional[str] = None
+    notes: Optional[str] = None
+    hold_id: Optional[str] = None  # Converts a slot hold into this appointment
+
+class SlotHold(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tenant_id: str
+    service_id: str
+    staff_id: str
+    start_at: datetime
+    end_at: datetime
+    resource_ids: List[str] = []
+    waitlist_entry_id: Optional[str] = None  # Set when the hold is a waitlist offer
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class SlotHoldCreate(BaseModel):
+    service_id: str
+    staff_id: Optional[str] = None
+    start_at: datetime
+
+class WaitlistEntry(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tenant_id: str
+    service_id: str
+    staff_id: Optional[str] = None  # None accepts any staff member
+    window_start: datetime
+    window_end: datetime
+    window_days: List[str] = []  # UTC dates the window touches, indexed for matching
+    customer_name: str
+    customer_email: EmailStr
+    customer_phone: Optional[str] = None
+    status: WaitlistStatus = WaitlistStatus.WAITING
+    hold_id: Optional[str] = None
+    offer_staff_id: Optional[str] = None
+    offer_start_at: Optional[datetime] = None
+    offer_expires_at: Optional[datetime] = None
+    appointment_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class WaitlistEntryCreate(BaseModel):
+    service_id: str
+    staff_id: Optional[str] = None
+    window_start: datetime
+    window_end: datetime
+    customer_name: str
+    customer_email: EmailStr
+    customer_phone: Optional[str] = None
+
+class RecurrenceRule(BaseModel):
+    interval_weeks: int = 1
+    count: Optional[int] = None  # Number of occurrences, or
+    until: Optional[str] = None  # Last possible date, format: "2026-12-31"
+
+class AppointmentSeries(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tenant_id: str
+    service_id: str
+    staff_id: str
+    start_at: datetime  # First occurrence
+    duration_minutes: int  # Booked length per occurrence including buffer
+    rule: RecurrenceRule
+    occurrence_count: int
+    last_end_at: datetime
+    exceptions: List[str] = []  # Skipped local dates, format: "2026-06-15"
+    customer_name: str
+    customer_email: Optional[EmailStr] = None
+    customer_phone: Optional[str] = None
+    notes: Optional[str] = None
+    status: AppointmentStatus = AppointmentStatus.CONFIRMED
+    # Display fields as on appointments; duration_minutes above is the booked length
+    service_name: Optional[str] = None
+    price_chf: Optional[float] = None
+    service_duration_minutes: Optional[int] = None
+    staff_name: Optional[str] = None
+    staff_color: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class AppointmentSeriesCreate(BaseModel):
     service_id: str
     staff_id: str
     start_at: datetime
+    rule: RecurrenceRule
     customer_name: str
     customer_email: Optional[EmailStr] = None
     customer_phone: Optional[str] = None
     notes: Optional[str] = None
+    skip_conflicts: bool = False  # Book the free dates and skip taken ones instead of failing
+
+class SeriesOccurrenceSkip(BaseModel):
+    date: str  # Format: "2026-06-15"
+
+class AppointmentImportRow(BaseModel):
+    service_id: str
+    staff_id: str
+    start_at: datetime  # Without offset: local time of the staff member
+    end_at: Optional[datetime] = None  # Default: service duration plus buffer
+    customer_name: str
+    customer_email: Optional[EmailStr] = None
+    customer_phone: Optional[str] = None
+    notes: Optional[str] = None
+    status: AppointmentStatus = AppointmentStatus.CONFIRMED
 
 class UsageSnapshot(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     tenant_id: str
     month: int
     year: int
-    staff_count: int
-    monthly_appointment_count: int
+    staff_count: int = 0
+    monthly_appointment_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PaymentTransaction(BaseModel):
@@ -188,102 +364,2506 @@ class PaymentTransaction(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-class CheckoutRequest(BaseModel):
-    package_id: str  # "starter" or "pro"
-    origin_url: str
+class CheckoutRequest(BaseModel):
+    package_id: str  # "starter" or "pro"
+    origin_url: str
+
+# Swiss CHF Plan Packages (Fixed server-side pricing)
+PLAN_PACKAGES = {
+    "starter": {
+        "name": "Starter Plan",
+        "amount": 29.00,
+        "currency": "CHF",
+        "plan_type": PlanType.STARTER,
+        "limits": {
+            "max_staff": 2,
+            "max_appointments_per_month": 200
+        }
+    },
+    "pro": {
+        "name": "Pro Plan", 
+        "amount": 59.00,
+        "currency": "CHF",
+        "plan_type": PlanType.PRO,
+        "limits": {
+            "max_staff": 3,
+            "max_appointments_per_month": 400
+        }
+    }
+}
+
+# Confirmed appointments per calendar month (the trial has no package)
+APPOINTMENT_LIMITS = {"trial": 30, "starter": 200, "pro": 400}
+
+# Utility functions
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.now(timezone.utc) + expires_delta
+    else:
+        expire = datetime.now(timezone.utc) + timedelta(hours=24)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return encoded_jwt
+
+async def get_current_tenant(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        tenant_id: str = payload.get("sub")
+        if tenant_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    tenant = await db.tenants.find_one({"id": tenant_id}, model_projection(Tenant))
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Tenant not found")
+    return from_mongo(Tenant, tenant)
+
+# Document codecs (one per model, built on first use)
+class ModelCodec:
+    """Converts between one Pydantic model and its MongoDB documents.
+
+    The model's fields are inspected once: decode then touches only the datetime,
+    enum and nested model fields of a document, in place, and builds the model with
+    model_construct instead of validating every field again. Documents are trusted
+    as written by encode.
+    """
+    def __init__(self, model):
+        self.model = model
+        # Reads that build the model fetch only its fields
+        self.projection = projection(*model.model_fields)
+        self.datetime_fields = []
+        self.enum_fields = []
+        self.nested_fields = []
+        for name, field in model.model_fields.items():
+            annotation = field.annotation
+            # Optional[X] is Union[X, None]
+            args = [arg for arg in get_args(annotation) if arg is not type(None)]
+            if get_origin(annotation) is Union and len(args) == 1:
+                annotation = args[0]
+            if annotation is datetime:
+                self.datetime_fields.append(name)
+            elif isinstance(annotation, type) and issubclass(annotation, Enum):
+                self.enum_fields.append((name, annotation))
+            elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+                self.nested_fields.append((name, model_codec(annotation)))
+    
+    def encode(self, instance) -> dict:
+        # Datetimes stay native (BSON dates), enums are str subclasses
+        return instance.model_dump()
+    
+    def decode(self, doc):
+        doc.pop("_id", None)
+        for name in self.datetime_fields:
+            if isinstance(doc.get(name), str):
+                # Written before the datetime migration
+                doc[name] = parse_datetime(doc[name])
+        for name, enum in self.enum_fields:
+            value = doc.get(name)
+            if value is not None:
+                doc[name] = enum(value)
+        for name, codec in self.nested_fields:
+            if isinstance(doc.get(name), dict):
+                doc[name] = codec.decode(doc[name])
+        return self.model.model_construct(**doc)
+
+model_codecs = {}
+
+def projection(*fields) -> dict:
+    """Find projection that returns only fields (never _id)"""
+    return {"_id": 0, **dict.fromkeys(fields, 1)}
+
+def model_codec(model) -> ModelCodec:
+    codec = model_codecs.get(model)
+    if codec is None:
+        codec = model_codecs[model] = ModelCodec(model)
+    return codec
+
+def model_projection(model) -> dict:
+    """Projection for reads that are decoded into model"""
+    return model_codec(model).projection
+
+def to_mongo(instance) -> dict:
+    """MongoDB document for a model instance"""
+    return model_codec(type(instance)).encode(instance)
+
+def from_mongo(model, doc):
+    """Model instance from a MongoDB document (the document is converted in place)"""
+    return model_codec(model).decode(doc)
+
+# Datetime migration (earlier versions stored datetimes as ISO strings)
+# Converted in place in _id order; the last converted _id per collection is kept in
+# migrations, so an interrupted run resumes where it stopped.
+DATETIME_FIELDS = {
+    "tenants": ["trial_start", "trial_end", "created_at"],
+    "staff": ["created_at"],
+    "special_closures": ["created_at"],
+    "services": ["created_at"],
+    "resources": ["created_at"],
+    "appointments": ["start_at", "end_at", "created_at"],
+    "appointment_series": ["start_at", "last_end_at", "created_at"],
+    "class_sessions": ["start_at", "end_at", "created_at"],
+    "slot_holds": ["start_at", "end_at", "created_at"],
+    "waitlist": ["window_start", "window_end", "offer_start_at", "offer_expires_at", "created_at"],
+    "payment_transactions": ["created_at", "updated_at"],
+    "usage_snapshots": ["created_at"],
+    "subscription_cancellations": ["cancelled_at"],
+}
+DATETIME_MIGRATION_BATCH_SIZE = 500
+
+async def migrate_datetime_fields(collection_name: str, fields, batch_size: int = DATETIME_MIGRATION_BATCH_SIZE, rescan: bool = True) -> int:
+    """Convert ISO string values of fields to BSON dates in one collection; returns documents converted.
+
+    Each document is updated only while its string values are unchanged, so a
+    concurrent write (which stores a date) is never overwritten with an older value.
+    With rescan a finished collection is scanned again for strings older workers
+    may have written during a rolling deploy; without it the completion marker
+    skips the scan. The checkpoint otherwise only lets an interrupted run resume.
+    """
+    checkpoint_id = f"bson_datetimes:{collection_name}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id})
+    if not rescan and checkpoint and checkpoint.get("completed_at"):
+        return 0
+    last_id = checkpoint.get("last_id") if checkpoint else None
+    
+    collection = db[collection_name]
+    string_filter = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    converted = 0
+    while True:
+        query = {**string_filter, "_id": {"$gt": last_id}} if last_id is not None else string_filter
+        docs = await collection.find(query, {field: 1 for field in fields}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        updates = []
+        for doc in docs:
+            strings = {field: doc[field] for field in fields if isinstance(doc.get(field), str)}
+            try:
+                values = {field: parse_datetime(value) for field, value in strings.items()}
+            except ValueError:
+                logger.warning(f"{collection_name} {doc['_id']}: unreadable datetime left unchanged")
+                continue
+            updates.append(UpdateOne({"_id": doc["_id"], **strings}, {"$set": values}))
+        if updates:
+            result = await collection.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+        last_id = docs[-1]["_id"]
+        await db.migrations.update_one({"_id": checkpoint_id}, {"$set": {"last_id": last_id}}, upsert=True)
+    
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}, "$unset": {"last_id": ""}},
+        upsert=True
+    )
+    return converted
+
+async def migrate_datetimes(batch_size: int = DATETIME_MIGRATION_BATCH_SIZE, rescan: bool = True):
+    """Run the datetime migration for every collection; returns {collection: documents converted}"""
+    return {
+        collection_name: await migrate_datetime_fields(collection_name, fields, batch_size, rescan)
+        for collection_name, fields in DATETIME_FIELDS.items()
+    }
+
+# Availability helpers
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MINUTES_PER_DAY = 24 * 60
+SLOT_STEP_MINUTES = 30
+MAX_AVAILABILITY_RANGE_DAYS = 60
+NEXT_AVAILABLE_FIRST_CHUNK_DAYS = 7
+MAX_NEXT_AVAILABLE_HORIZON_DAYS = 365
+DEFAULT_TIMEZONE = "Europe/Zurich"
+
+def parse_datetime(value) -> datetime:
+    """Parse a stored datetime (ISO string or datetime) into an aware UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def time_to_minutes(value: str) -> int:
+    """Convert a "09:00" time string to minutes after midnight"""
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+def minutes_to_time(value: int) -> str:
+    """Convert minutes after midnight to a "09:00" time string"""
+    return f"{value // 60:02d}:{value % 60:02d}"
+
+@lru_cache(maxsize=None)
+def get_zone(tz_name: str):
+    """ZoneInfo for a staff timezone, falling back to UTC for unknown names"""
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {tz_name!r}, using UTC")
+        return timezone.utc
+
+@lru_cache(maxsize=65536)
+def get_local_day(day: date, tz_name: str):
+    """UTC bounds of a local calendar day and whether its UTC offset is constant.
+
+    Cached per zone and date so that converting slot minutes on ordinary days is
+    plain datetime arithmetic; only DST transition days go through zoneinfo.
+    """
+    zone = get_zone(tz_name)
+    local_start = datetime(day.year, day.month, day.day, tzinfo=zone)
+    next_day = day + timedelta(days=1)
+    local_end = datetime(next_day.year, next_day.month, next_day.day, tzinfo=zone)
+    return (
+        local_start.astimezone(timezone.utc),
+        local_end.astimezone(timezone.utc),
+        local_start.utcoffset() == local_end.utcoffset()
+    )
+
+def get_day_bounds(day: date, tz_name: str = "UTC"):
+    """Return the [start, end) UTC datetimes of a local calendar day"""
+    day_start, day_end, _ = get_local_day(day, tz_name)
+    return day_start, day_end
+
+def to_local_minutes(instant: datetime, day: date, tz_name: str, round_up: bool = False) -> int:
+    """Wall-clock minutes of an instant relative to local midnight of day (may fall outside 0..1440)"""
+    day_start, _, constant_offset = get_local_day(day, tz_name)
+    if constant_offset:
+        seconds = int((instant - day_start).total_seconds())
+    else:
+        local = instant.astimezone(get_zone(tz_name))
+        seconds = (local.date() - day).days * 86400 + local.hour * 3600 + local.minute * 60 + local.second
+    return -(-seconds // 60) if round_up else seconds // 60
+
+def from_local_minutes(day: date, minutes: int, tz_name: str) -> datetime:
+    """UTC datetime of a wall-clock minute on a local day"""
+    day_start, _, constant_offset = get_local_day(day, tz_name)
+    if constant_offset:
+        return day_start + timedelta(minutes=minutes)
+    local = datetime(day.year, day.month, day.day) + timedelta(minutes=minutes)
+    return local.replace(tzinfo=get_zone(tz_name)).astimezone(timezone.utc)
+
+def get_local_today(tz_name: str) -> date:
+    return datetime.now(get_zone(tz_name)).date()
+
+def get_working_interval(working_hours: WeeklySchedule, day: date):
+    """Return the (start, end) working minutes of a staff member on a day, or None"""
+    working_day = getattr(working_hours, WEEKDAY_NAMES[day.weekday()])
+    if not working_day.is_working:
+        return None
+    start = time_to_minutes(working_day.start_time or "09:00")
+    end = time_to_minutes(working_day.end_time or "18:00")
+    if end <= start:
+        return None
+    return start, end
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(free, busy):
+    """Remove merged, sorted busy intervals from sorted free intervals"""
+    result = []
+    index = 0
+    for start, end in free:
+        # Skip busy intervals that end before this free interval starts
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        cursor = start
+        position = index
+        while position < len(busy) and busy[position][0] < end:
+            busy_start, busy_end = busy[position]
+            if busy_start > cursor:
+                result.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            position += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+def closure_interval(closure):
+    """Busy minute interval of a special closure within its day"""
+    if closure.get("all_day", True) or not closure.get("start_time") or not closure.get("end_time"):
+        return 0, MINUTES_PER_DAY
+    return time_to_minutes(closure["start_time"]), time_to_minutes(closure["end_time"])
+
+def split_by_day(start_at, end_at, tz_name: str = "UTC"):
+    """Split a datetime interval into (day, start_minute, end_minute) pieces per local calendar day"""
+    start_at = parse_datetime(start_at)
+    end_at = parse_datetime(end_at)
+    pieces = []
+    day = start_at.astimezone(get_zone(tz_name)).date()
+    while True:
+        day_start, day_end = get_day_bounds(day, tz_name)
+        if day_start >= end_at:
+            break
+        start = max(to_local_minutes(start_at, day, tz_name), 0)
+        end = min(to_local_minutes(end_at, day, tz_name, round_up=True), MINUTES_PER_DAY)
+        if start < end:
+            pieces.append((day, start, end))
+        day += timedelta(days=1)
+    return pieces
+
+def generate_slot_starts(free_intervals, slot_minutes: int, step: int, anchor: int, not_before: int = 0):
+    """Start minutes on the step grid (anchored at the working start) where slot_minutes fit"""
+    starts = []
+    for start, end in free_intervals:
+        start = max(start, not_before)
+        # First grid point at or after the interval start
+        offset = (start - anchor) % step
+        current = start if offset == 0 else start + step - offset
+        while current + slot_minutes <= end:
+            starts.append(current)
+            current += step
+    return starts
+
+def format_slots(day: date, starts, slot_minutes: int, tz_name: str = "UTC", capacity: int = 1, seats=None):
+    """Serialize slot start minutes of a local day for API responses.
+
+    For classes (capacity above 1) each slot also reports its free seats; seats maps
+    the starts of open sessions to their seats left.
+    """
+    slots = []
+    for start in starts:
+        slot = {
+            "time": minutes_to_time(start),
+            "start_at": from_local_minutes(day, start, tz_name).isoformat(),
+            "end_at": from_local_minutes(day, start + slot_minutes, tz_name).isoformat()
+        }
+        if capacity > 1:
+            slot["seats_left"] = (seats or {}).get(start, capacity)
+        slots.append(slot)
+    return slots
+
+def group_appointments_by_day(appointments, first_day: date, last_day: date, timezones):
+    """Bucket appointments by (staff_id, local day) for every day of the range they overlap"""
+    buckets = {}
+    for apt in appointments:
+        for day, _, _ in split_by_day(apt["start_at"], apt["end_at"], timezones.get(apt["staff_id"], DEFAULT_TIMEZONE)):
+            if first_day <= day <= last_day:
+                buckets.setdefault((apt["staff_id"], day), []).append(apt)
+    return buckets
+
+def group_closures_by_day(closures):
+    """Bucket special closures by (staff_id, "YYYY-MM-DD")"""
+    buckets = {}
+    for closure in closures:
+        buckets.setdefault((closure["staff_id"], closure["date"]), []).append(closure)
+    return buckets
+
+# Occupancy index
+OCCUPANCY_INDEX_MAX_AGE_SECONDS = int(os.environ.get('OCCUPANCY_INDEX_MAX_AGE_SECONDS', '300'))
+OCCUPANCY_INDEX_WARMUP_DAYS = int(os.environ.get('OCCUPANCY_INDEX_WARMUP_DAYS', '0'))
+OCCUPANCY_INDEX_MAX_ENTRIES = 50000
+
+class StaffDay:
+    """Occupied time of one staff member on one day as sorted minute intervals"""
+    __slots__ = ("working", "closures", "appointments", "free", "loaded_at")
+
+    def __init__(self, working, closures, appointments):
+        self.working = working              # (start, end) or None when not working
+        self.closures = sorted(closures)    # [(start, end, closure_id)]
+        self.appointments = sorted(appointments)  # [(start, end, appointment_id)]
+        self.free = None                    # derived free intervals, rebuilt on change
+        self.loaded_at = time.monotonic()
+
+    def free_intervals(self):
+        if self.free is None:
+            if self.working is None:
+                self.free = []
+            else:
+                busy = merge_intervals(
+                    [(start, end) for start, end, _ in self.closures] +
+                    [(start, end) for start, end, _ in self.appointments]
+                )
+                self.free = subtract_intervals([self.working], busy)
+        return self.free
+
+    def is_free(self, start: int, end: int) -> bool:
+        """Whether [start, end) lies inside one free interval (binary search)"""
+        free = self.free_intervals()
+        position = bisect_right(free, (start, float("inf"))) - 1
+        return position >= 0 and free[position][1] >= end
+
+class OccupancyIndex:
+    """In-process per-staff, per-day index of occupied time.
+
+    Days are loaded from MongoDB on first use and then updated in place by the write
+    endpoints. Entries expire after OCCUPANCY_INDEX_MAX_AGE_SECONDS so that writes
+    handled by other workers are picked up.
+    """
+
+    def __init__(self):
+        self.days = {}
+        self.timezones = {}  # (tenant_id, staff_id) -> timezone name of indexed staff
+
+    def get(self, tenant_id: str, staff_id: str, day: date) -> Optional[StaffDay]:
+        key = (tenant_id, staff_id, day)
+        entry = self.days.get(key)
+        if entry is not None and time.monotonic() - entry.loaded_at > OCCUPANCY_INDEX_MAX_AGE_SECONDS:
+            del self.days[key]
+            entry = None
+        return entry
+
+    def load_day(self, tenant_id: str, staff_id: str, day: date, tz_name: str, working_hours: WeeklySchedule, closures, appointments) -> StaffDay:
+        """Index one local staff day from its closures and (confirmed) appointment documents"""
+        if len(self.days) >= OCCUPANCY_INDEX_MAX_ENTRIES:
+            self.prune()
+        self.timezones[(tenant_id, staff_id)] = tz_name
+        appointment_entries = []
+        for apt in appointments:
+            for piece_day, start, end in split_by_day(apt["start_at"], apt["end_at"], tz_name):
+                if piece_day == day:
+                    appointment_entries.append((start, end, apt["id"]))
+        entry = StaffDay(
+            get_working_interval(working_hours, day),
+            [closure_interval(closure) + (closure["id"],) for closure in closures],
+            appointment_entries
+        )
+        self.days[(tenant_id, staff_id, day)] = entry
+        return entry
+
+    def prune(self):
+        """Drop expired entries, or everything if the index is still too large"""
+        now = time.monotonic()
+        self.days = {
+            key: entry for key, entry in self.days.items()
+            if now - entry.loaded_at <= OCCUPANCY_INDEX_MAX_AGE_SECONDS
+        }
+        if len(self.days) >= OCCUPANCY_INDEX_MAX_ENTRIES:
+            self.days = {}
+
+    def split(self, tenant_id: str, staff_id: str, start_at, end_at):
+        """Local day pieces of an interval for an indexed staff member ([] if never indexed)"""
+        tz_name = self.timezones.get((tenant_id, staff_id))
+        if tz_name is None:
+            return []
+        return split_by_day(start_at, end_at, tz_name)
+
+    def add_appointment(self, tenant_id: str, staff_id: str, appointment_id: str, start_at, end_at):
+        for day, start, end in self.split(tenant_id, staff_id, start_at, end_at):
+            entry = self.get(tenant_id, staff_id, day)
+            if entry is not None:
+                insort(entry.appointments, (start, end, appointment_id))
+                entry.free = None
+
+    def remove_appointment(self, tenant_id: str, staff_id: str, appointment_id: str, start_at, end_at):
+        for day, _, _ in self.split(tenant_id, staff_id, start_at, end_at):
+            entry = self.get(tenant_id, staff_id, day)
+            if entry is not None:
+                entry.appointments = [item for item in entry.appointments if item[2] != appointment_id]
+                entry.free = None
+
+    def add_closure(self, tenant_id: str, staff_id: str, closure):
+        entry = self.get(tenant_id, staff_id, datetime.strptime(closure["date"], "%Y-%m-%d").date())
+        if entry is not None:
+            insort(entry.closures, closure_interval(closure) + (closure["id"],))
+            entry.free = None
+
+    def remove_closure(self, tenant_id: str, staff_id: str, closure):
+        entry = self.get(tenant_id, staff_id, datetime.strptime(closure["date"], "%Y-%m-%d").date())
+        if entry is not None:
+            entry.closures = [item for item in entry.closures if item[2] != closure["id"]]
+            entry.free = None
+
+    def update_working_hours(self, tenant_id: str, staff_id: str, working_hours: WeeklySchedule):
+        for (entry_tenant_id, entry_staff_id, day), entry in self.days.items():
+            if entry_tenant_id == tenant_id and entry_staff_id == staff_id:
+                entry.working = get_working_interval(working_hours, day)
+                entry.free = None
+
+    def drop_staff(self, tenant_id: str, staff_id: str):
+        self.days = {key: entry for key, entry in self.days.items() if key[:2] != (tenant_id, staff_id)}
+        self.timezones.pop((tenant_id, staff_id), None)
+
+    def clear(self, tenant_id: Optional[str] = None):
+        if tenant_id is None:
+            self.days = {}
+            self.timezones = {}
+        else:
+            self.days = {key: entry for key, entry in self.days.items() if key[0] != tenant_id}
+            self.timezones = {key: tz_name for key, tz_name in self.timezones.items() if key[0] != tenant_id}
+
+occupancy_index = OccupancyIndex()
+
+def staff_timezone(staff_doc) -> str:
+    return staff_doc.get("timezone") or DEFAULT_TIMEZONE
+
+def validate_timezone(tz_name: str):
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Ungültige Zeitzone")
+
+async def ensure_staff_days(tenant_id: str, staff_docs, first_day: date, last_day: date):
+    """Indexed StaffDay entries keyed by (staff_id, day) for several staff over a date range.
+
+    Days missing from the occupancy index are loaded with one query each for appointments,
+    appointment series, slot holds and closures, regardless of how many staff and days
+    are missing. Series occurrences are expanded for the window only; active holds are
+    indexed like appointments until they expire.
+    """
+    entries = {}
+    missing_staff = {}
+    missing_days = []
+    for staff_doc in staff_docs:
+        day = first_day
+        while day <= last_day:
+            entry = occupancy_index.get(tenant_id, staff_doc["id"], day)
+            if entry is None:
+                missing_staff[staff_doc["id"]] = staff_doc
+                missing_days.append(day)
+            else:
+                entries[(staff_doc["id"], day)] = entry
+            day += timedelta(days=1)
+    
+    if not missing_staff:
+        return entries
+    
+    load_first, load_last = min(missing_days), max(missing_days)
+    timezones = {staff_id: staff_timezone(staff_doc) for staff_id, staff_doc in missing_staff.items()}
+    window_start = min(get_day_bounds(load_first, tz_name)[0] for tz_name in set(timezones.values()))
+    window_end = max(get_day_bounds(load_last, tz_name)[1] for tz_name in set(timezones.values()))
+    staff_ids = list(missing_staff)
+    
+    appointments = await db.appointments.find({
+        "tenant_id": tenant_id,
+        "staff_id": {"$in": staff_ids},
+        "status": "confirmed",
+        "start_at": {"$lt": window_end},
+        "end_at": {"$gt": window_start}
+    }, {"_id": 0, "id": 1, "staff_id": 1, "start_at": 1, "end_at": 1}).to_list(None)
+    
+    holds = await db.slot_holds.find({
+        "tenant_id": tenant_id,
+        "staff_id": {"$in": staff_ids},
+        "expires_at": {"$gt": datetime.now(timezone.utc)},
+        "start_at": {"$lt": window_end},
+        "end_at": {"$gt": window_start}
+    }, {"_id": 0, "id": 1, "staff_id": 1, "start_at": 1, "end_at": 1, "expires_at": 1, "resource_ids": 1}).to_list(None)
+    for hold in holds:
+        track_hold(tenant_id, hold)
+    
+    series_docs = await db.appointment_series.find({
+        "tenant_id": tenant_id,
+        "staff_id": {"$in": staff_ids},
+        "status": "confirmed",
+        "start_at": {"$lt": window_end},
+        "last_end_at": {"$gt": window_start}
+    }, {"_id": 0, "id": 1, "staff_id": 1, "start_at": 1, "duration_minutes": 1, "rule": 1, "occurrence_count": 1, "exceptions": 1}).to_list(None)
+    occurrences = [
+        series_occurrence_doc(series_doc, occurrence)
+        for series_doc in series_docs
+        for occurrence in series_occurrences(series_doc, timezones[series_doc["staff_id"]], window_start, window_end)
+    ]
+    
+    closures = await db.special_closures.find({
+        "tenant_id": tenant_id,
+        "staff_id": {"$in": staff_ids},
+        "date": {"$gte": load_first.isoformat(), "$lte": load_last.isoformat()}
+    }, {"_id": 0, "id": 1, "staff_id": 1, "date": 1, "all_day": 1, "start_time": 1, "end_time": 1}).to_list(None)
+    
+    appointments_by_day = group_appointments_by_day(appointments + occurrences + holds, load_first, load_last, timezones)
+    closures_by_day = group_closures_by_day(closures)
+    
+    for staff_id, staff_doc in missing_staff.items():
+        working_hours = WeeklySchedule(**staff_doc.get("working_hours", {}))
+        day = first_day
+        while day <= last_day:
+            if (staff_id, day) not in entries:
+                entries[(staff_id, day)] = occupancy_index.load_day(
+                    tenant_id,
+                    staff_id,
+                    day,
+                    timezones[staff_id],
+                    working_hours,
+                    closures_by_day.get((staff_id, day.isoformat()), []),
+                    appointments_by_day.get((staff_id, day), [])
+                )
+            day += timedelta(days=1)
+    return entries
+
+def compute_slot_starts(entry: StaffDay, slot_minutes: int, step: int):
+    """Bookable start minutes of an indexed staff day"""
+    if entry.working is None:
+        return []
+    return generate_slot_starts(entry.free_intervals(), slot_minutes, step, entry.working[0])
+
+# Availability cache
+AVAILABILITY_CACHE_MAX_ENTRIES = int(os.environ.get('AVAILABILITY_CACHE_MAX_ENTRIES', '20000'))
+AVAILABILITY_CACHE_TTL_SECONDS = int(os.environ.get('AVAILABILITY_CACHE_TTL_SECONDS', '60'))
+
+class AvailabilityCache:
+    """LRU cache with TTL for computed slot starts per (tenant, staff, service, day, step).
+
+    Entries hold the full-day slot list; past start times are filtered on read so a
+    cached day stays valid while the clock moves. Writes invalidate only the keys of
+    the affected staff day or service.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires_at, starts)
+        self.keys_by_staff_day = {}   # (tenant_id, staff_id, day) -> set of keys
+        self.keys_by_service = {}     # (tenant_id, service_id) -> set of keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if item[0] < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, starts):
+        tenant_id, staff_id, service_id, day, _ = key
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, starts)
+        self.keys_by_staff_day.setdefault((tenant_id, staff_id, day), set()).add(key)
+        self.keys_by_service.setdefault((tenant_id, service_id), set()).add(key)
+        while len(self.entries) > self.max_entries:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        if self.entries.pop(key, None) is None:
+            return
+        tenant_id, staff_id, service_id, day, _ = key
+        for index, index_key in ((self.keys_by_staff_day, (tenant_id, staff_id, day)), (self.keys_by_service, (tenant_id, service_id))):
+            keys = index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[index_key]
+
+    def _invalidate(self, keys):
+        for key in list(keys):
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_staff_day(self, tenant_id: str, staff_id: str, day: date):
+        self._invalidate(self.keys_by_staff_day.get((tenant_id, staff_id, day), ()))
+
+    def invalidate_staff(self, tenant_id: str, staff_id: str):
+        for index_key in [key for key in self.keys_by_staff_day if key[0] == tenant_id and key[1] == staff_id]:
+            self._invalidate(self.keys_by_staff_day.get(index_key, ()))
+
+    def invalidate_service(self, tenant_id: str, service_id: str):
+        self._invalidate(self.keys_by_service.get((tenant_id, service_id), ()))
+
+    def clear(self, tenant_id: Optional[str] = None):
+        for key in [key for key in self.entries if tenant_id is None or key[0] == tenant_id]:
+            self._remove(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+availability_cache = AvailabilityCache(AVAILABILITY_CACHE_MAX_ENTRIES, AVAILABILITY_CACHE_TTL_SECONDS)
+
+# Slot change events (server-sent events for open booking pages)
+SLOT_EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('SLOT_EVENTS_MAX_SUBSCRIBERS', '10000'))
+SLOT_EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('SLOT_EVENTS_KEEPALIVE_SECONDS', '25'))
+SLOT_EVENTS_QUEUE_SIZE = 100
+
+class SlotEventBroker:
+    """In-process pub/sub fanning slot invalidations out to the open booking pages of a tenant.
+
+    Publishing is synchronous, never blocks and never touches the database. Each
+    subscriber owns a bounded queue; one that falls behind gets a single "resync"
+    event instead of an unbounded backlog. Events only reach subscribers connected
+    to the same worker process.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}  # tenant_id -> set of queues
+        self.subscriber_count = 0
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self, tenant_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(tenant_id, set()).add(queue)
+        self.subscriber_count += 1
+        return queue
+
+    def unsubscribe(self, tenant_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(tenant_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        self.subscriber_count -= 1
+        if not queues:
+            del self.subscribers[tenant_id]
+
+    def publish(self, tenant_id: str, event: dict):
+        queues = self.subscribers.get(tenant_id)
+        if not queues:
+            return
+        self.published += 1
+        for queue in queues:
+            if queue.full():
+                # Replace the backlog of a slow subscriber with one full refresh
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                self.resyncs += 1
+            else:
+                queue.put_nowait(event)
+
+    def stats(self):
+        return {
+            "subscribers": self.subscriber_count,
+            "tenants": len(self.subscribers),
+            "published": self.published,
+            "resyncs": self.resyncs
+        }
+
+slot_event_broker = SlotEventBroker(SLOT_EVENTS_QUEUE_SIZE)
+
+def format_slot_events(events) -> str:
+    """Serialize queued events as one server-sent events chunk"""
+    return "".join(
+        f"event: {event['type']}\ndata: {json.dumps({key: value for key, value in event.items() if key != 'type'})}\n\n"
+        for event in events
+    )
+
+# Availability change hooks (keep the occupancy index, the cache and open booking pages in sync with writes)
+def invalidate_staff_days(tenant_id: str, staff_id: str, days):
+    days = sorted(set(days))
+    for day in days:
+        availability_cache.invalidate_staff_day(tenant_id, staff_id, day)
+    if days:
+        slot_event_broker.publish(tenant_id, {"type": "slots", "staff_id": staff_id, "dates": [day.isoformat() for day in days]})
+
+def appointment_days(tenant_id: str, staff_id: str, start_at, end_at):
+    tz_name = occupancy_index.timezones.get((tenant_id, staff_id), DEFAULT_TIMEZONE)
+    return [day for day, _, _ in split_by_day(start_at, end_at, tz_name)]
+
+def on_appointment_booked(tenant_id: str, staff_id: str, appointment_id: str, start_at, end_at):
+    occupancy_index.add_appointment(tenant_id, staff_id, appointment_id, start_at, end_at)
+    invalidate_staff_days(tenant_id, staff_id, appointment_days(tenant_id, staff_id, start_at, end_at))
+
+def on_appointment_released(tenant_id: str, staff_id: str, appointment_id: str, start_at, end_at):
+    occupancy_index.remove_appointment(tenant_id, staff_id, appointment_id, start_at, end_at)
+    invalidate_staff_days(tenant_id, staff_id, appointment_days(tenant_id, staff_id, start_at, end_at))
+
+def publish_resource_days(tenant_id: str, resource_ids, start_at, end_at):
+    # Resource occupancy is applied on read, so there is no cache to invalidate
+    if resource_ids:
+        days = sorted({day.isoformat() for day, _, _ in split_by_day(start_at, end_at, DEFAULT_TIMEZONE)})
+        slot_event_broker.publish(tenant_id, {"type": "resources", "resource_ids": list(resource_ids), "dates": days})
+
+def on_resources_booked(tenant_id: str, resource_ids, entry_id: str, start_at, end_at):
+    for resource_id in resource_ids:
+        occupancy_index.add_appointment(tenant_id, resource_id, entry_id, start_at, end_at)
+    publish_resource_days(tenant_id, resource_ids, start_at, end_at)
+
+def on_resources_released(tenant_id: str, resource_ids, entry_id: str, start_at, end_at):
+    for resource_id in resource_ids:
+        occupancy_index.remove_appointment(tenant_id, resource_id, entry_id, start_at, end_at)
+    publish_resource_days(tenant_id, resource_ids, start_at, end_at)
+
+def on_series_booked(tenant_id: str, staff_id: str, series_id: str, occurrences):
+    days = []
+    for day, start, end in occurrences:
+        occupancy_index.add_appointment(tenant_id, staff_id, series_occurrence_id(series_id, day), start, end)
+        days.extend(appointment_days(tenant_id, staff_id, start, end))
+    invalidate_staff_days(tenant_id, staff_id, days)
+
+def on_series_released(tenant_id: str, staff_id: str, series_id: str, occurrences):
+    days = []
+    for day, start, end in occurrences:
+        occupancy_index.remove_appointment(tenant_id, staff_id, series_occurrence_id(series_id, day), start, end)
+        days.extend(appointment_days(tenant_id, staff_id, start, end))
+    invalidate_staff_days(tenant_id, staff_id, days)
+
+def on_appointments_imported(tenant_id: str, staff_id: str):
+    # Imports touch many days at once, so indexed days are reloaded instead of patched
+    occupancy_index.drop_staff(tenant_id, staff_id)
+    availability_cache.invalidate_staff(tenant_id, staff_id)
+    slot_event_broker.publish(tenant_id, {"type": "staff", "staff_id": staff_id})
+
+def on_closure_added(tenant_id: str, staff_id: str, closure):
+    occupancy_index.add_closure(tenant_id, staff_id, closure)
+    invalidate_staff_days(tenant_id, staff_id, [datetime.strptime(closure["date"], "%Y-%m-%d").date()])
+
+def on_closure_removed(tenant_id: str, staff_id: str, closure):
+    occupancy_index.remove_closure(tenant_id, staff_id, closure)
+    invalidate_staff_days(tenant_id, staff_id, [datetime.strptime(closure["date"], "%Y-%m-%d").date()])
+
+def on_working_hours_changed(tenant_id: str, staff_id: str, working_hours: WeeklySchedule):
+    occupancy_index.update_working_hours(tenant_id, staff_id, working_hours)
+    availability_cache.invalidate_staff(tenant_id, staff_id)
+    slot_event_broker.publish(tenant_id, {"type": "staff", "staff_id": staff_id})
+
+def on_timezone_changed(tenant_id: str, staff_id: str, tz_name: str):
+    # Local day boundaries move, so indexed days are reloaded instead of patched
+    occupancy_index.drop_staff(tenant_id, staff_id)
+    occupancy_index.timezones[(tenant_id, staff_id)] = tz_name
+    availability_cache.invalidate_staff(tenant_id, staff_id)
+    slot_event_broker.publish(tenant_id, {"type": "staff", "staff_id": staff_id})
+
+def on_service_changed(tenant_id: str, service_id: str):
+    availability_cache.invalidate_service(tenant_id, service_id)
+    slot_event_broker.publish(tenant_id, {"type": "service", "service_id": service_id})
+
+# Slot holds (short reservations while a customer enters their details)
+SLOT_HOLD_TTL_SECONDS = int(os.environ.get('SLOT_HOLD_TTL_SECONDS', '300'))
+
+hold_expiry_handles = {}  # hold_id -> asyncio.TimerHandle that releases the hold from the index
+
+async def place_slot_hold(tenant_id: str, service: Service, staff_id: str, start_at: datetime, end_at: datetime, ttl_seconds: int, waitlist_entry_id: Optional[str] = None) -> SlotHold:
+    """Reserve the staff member (and required resources) under a hold expiring after ttl_seconds"""
+    hold = SlotHold(
+        tenant_id=tenant_id,
+        service_id=service.id,
+        staff_id=staff_id,
+        start_at=start_at,
+        end_at=end_at,
+        waitlist_entry_id=waitlist_entry_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    )
+    if not await reserve_interval(tenant_id, staff_id, start_at, end_at, hold.id, hold.expires_at):
+        raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+    try:
+        hold.resource_ids = await reserve_resources(tenant_id, service.required_resource_kinds, start_at, end_at, hold.id, hold.expires_at)
+    except HTTPException:
+        await release_interval(tenant_id, staff_id, start_at, end_at, hold.id)
+        raise
+    
+    hold_dict = to_mongo(hold)
+    await db.slot_holds.insert_one(hold_dict)
+    
+    on_appointment_booked(tenant_id, staff_id, hold.id, start_at, end_at)
+    on_resources_booked(tenant_id, hold.resource_ids, hold.id, start_at, end_at)
+    track_hold(tenant_id, hold_dict)
+    return hold
+
+def track_hold(tenant_id: str, hold):
+    """Release an indexed hold from this worker's index as soon as it expires.
+
+    MongoDB's TTL monitor deletes expired holds only about once a minute, so queries
+    also filter on expires_at; the timer keeps the index and open pages in step.
+    """
+    if hold["id"] in hold_expiry_handles:
+        return
+    delay = (parse_datetime(hold["expires_at"]) - datetime.now(timezone.utc)).total_seconds()
+    hold_expiry_handles[hold["id"]] = asyncio.get_running_loop().call_later(
+        max(delay, 0), expire_hold, tenant_id, hold["staff_id"], hold.get("resource_ids", []), hold["id"], hold["start_at"], hold["end_at"],
+        hold.get("waitlist_entry_id")
+    )
+
+def untrack_hold(hold_id: str):
+    handle = hold_expiry_handles.pop(hold_id, None)
+    if handle is not None:
+        handle.cancel()
+
+def expire_hold(tenant_id: str, staff_id: str, resource_ids, hold_id: str, start_at, end_at, waitlist_entry_id: Optional[str] = None):
+    hold_expiry_handles.pop(hold_id, None)
+    on_appointment_released(tenant_id, staff_id, hold_id, start_at, end_at)
+    on_resources_released(tenant_id, resource_ids, hold_id, start_at, end_at)
+    # The ledger already ignores expired entries; removing them keeps its documents small
+    run_in_background(release_booking(tenant_id, staff_id, resource_ids, start_at, end_at, hold_id))
+    if waitlist_entry_id:
+        # The ledger stops counting the hold at expiry, so the next customer can be offered it now
+        run_in_background(pass_on_waitlist_offer(tenant_id, waitlist_entry_id, hold_id, staff_id, start_at, end_at))
+
+async def drop_slot_hold(tenant_id: str, hold_id: str):
+    """Delete a hold and give its time back; returns the hold document, None if it is gone"""
+    hold_doc = await db.slot_holds.find_one_and_delete(
+        {"id": hold_id, "tenant_id": tenant_id},
+        projection={"_id": 0, "staff_id": 1, "resource_ids": 1, "start_at": 1, "end_at": 1, "waitlist_entry_id": 1}
+    )
+    if not hold_doc:
+        return None
+    
+    # A hold that was confirmed concurrently is an appointment entry by now and stays
+    resource_ids = hold_doc.get("resource_ids", [])
+    await release_booking(tenant_id, hold_doc["staff_id"], resource_ids, hold_doc["start_at"], hold_doc["end_at"], hold_id)
+    untrack_hold(hold_id)
+    on_appointment_released(tenant_id, hold_doc["staff_id"], hold_id, hold_doc["start_at"], hold_doc["end_at"])
+    on_resources_released(tenant_id, resource_ids, hold_id, hold_doc["start_at"], hold_doc["end_at"])
+    return hold_doc
+
+async def claim_slot_hold(tenant_id: str, hold_id: str, service_id: str, appointment_id: str) -> SlotHold:
+    """Turn an active hold into appointment_id with one conditional ledger update.
+
+    The ledger entry is converted only while the hold is unexpired, so the slot can
+    never be taken by someone else in between, and a hold can be confirmed once.
+    """
+    hold_doc = await db.slot_holds.find_one(
+        {"id": hold_id, "tenant_id": tenant_id, "service_id": service_id, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        model_projection(SlotHold)
+    )
+    if not hold_doc:
+        raise HTTPException(status_code=400, detail="Reservierung abgelaufen oder bereits verwendet")
+    resource_ids = hold_doc.get("resource_ids", [])
+    converted = await asyncio.gather(*[
+        convert_reservation(tenant_id, owner_id, hold_doc["start_at"], hold_doc["end_at"], hold_id, appointment_id)
+        for owner_id in [hold_doc["staff_id"], *resource_ids]
+    ])
+    if not all(converted):
+        # Expired in between: whatever was converted is given back with the hold
+        await release_booking(tenant_id, hold_doc["staff_id"], resource_ids, hold_doc["start_at"], hold_doc["end_at"], appointment_id)
+        raise HTTPException(status_code=400, detail="Reservierung abgelaufen oder bereits verwendet")
+    return from_mongo(SlotHold, hold_doc)
+
+# Reservation ledger (atomic conflict detection for appointments and holds)
+async def insert_reserved_appointment(appointment: Appointment):
+    """Store an appointment whose time and quota are already reserved, giving both back on failure"""
+    try:
+        await db.appointments.insert_one(to_mongo(appointment))
+    except Exception:
+        if appointment.session_id:
+            await release_class_seat(appointment.session_id)
+        else:
+            await release_booking(appointment.tenant_id, appointment.staff_id, appointment.resource_ids, appointment.start_at, appointment.end_at, appointment.id)
+        await release_appointment_quota(appointment.tenant_id, appointment.start_at)
+        raise
+
+def reservation_keys(tenant_id: str, staff_id: str, start_at, end_at):
+    """Ledger document ids (one per staff member and UTC day touched) and epoch-second bounds"""
+    start_at = parse_datetime(start_at)
+    end_at = parse_datetime(end_at)
+    keys = []
+    day = start_at.date()
+    while datetime(day.year, day.month, day.day, tzinfo=timezone.utc) < end_at:
+        keys.append(f"{tenant_id}:{staff_id}:{day.isoformat()}")
+        day += timedelta(days=1)
+    return keys, int(start_at.timestamp()), int(end_at.timestamp())
+
+async def push_reservation(key: str, tenant_id: str, staff_id: str, entry, ignore_id: Optional[str] = None, ignore_prefix: Optional[str] = None) -> bool:
+    """Append entry to one ledger document unless it overlaps a live entry (single update)"""
+    live_overlap = {
+        "s": {"$lt": entry["e"]},
+        "e": {"$gt": entry["s"]},
+        "$or": [{"x": None}, {"x": {"$gt": int(time.time())}}]
+    }
+    if ignore_id is not None:
+        live_overlap["id"] = {"$ne": ignore_id}
+    elif ignore_prefix is not None:
+        live_overlap["id"] = {"$not": {"$regex": f"^{re.escape(ignore_prefix)}"}}
+    for upsert in (True, False):
+        try:
+            result = await db.reservations.update_one(
+                {"_id": key, "intervals": {"$not": {"$elemMatch": live_overlap}}},
+                {"$push": {"intervals": entry}, "$setOnInsert": {"tenant_id": tenant_id, "staff_id": staff_id}},
+                upsert=upsert
+            )
+        except DuplicateKeyError:
+            # The document exists (conflict) or was just created by a concurrent request: check again
+            continue
+        return result.matched_count == 1 or result.upserted_id is not None
+    return False
+
+async def reserve_interval(tenant_id: str, staff_id: str, start_at, end_at, entry_id: str, expires_at=None, ignore_id: Optional[str] = None, ignore_prefix: Optional[str] = None) -> bool:
+    """Atomically reserve [start_at, end_at) for a staff member; False if it overlaps.
+
+    Each staff member and UTC day is one document holding its reserved intervals. The
+    overlap test and the insert are a single conditional update, so two requests for
+    the same time can never both succeed, and losers fail after one round trip.
+    Entries with an expiry (holds) stop counting once expired; ignore_id excludes an
+    entry from the overlap test (an appointment being moved), ignore_prefix all
+    entries whose id starts with it (a class session).
+    """
+    keys, start, end = reservation_keys(tenant_id, staff_id, start_at, end_at)
+    entry = {"s": start, "e": end, "id": entry_id}
+    if expires_at is not None:
+        entry["x"] = int(parse_datetime(expires_at).timestamp())
+    
+    reserved = []
+    for key in keys:
+        if not await push_reservation(key, tenant_id, staff_id, entry, ignore_id, ignore_prefix):
+            if reserved:
+                await db.reservations.update_many({"_id": {"$in": reserved}}, {"$pull": {"intervals": {"id": entry_id}}})
+            return False
+        reserved.append(key)
+    return True
+
+async def release_interval(tenant_id: str, staff_id: str, start_at, end_at, entry_id: str):
+    keys, _, _ = reservation_keys(tenant_id, staff_id, start_at, end_at)
+    await db.reservations.update_many({"_id": {"$in": keys}}, {"$pull": {"intervals": {"id": entry_id}}})
+
+async def relabel_reservation(tenant_id: str, staff_id: str, start_at, end_at, entry_id: str, new_id: str):
+    keys, _, _ = reservation_keys(tenant_id, staff_id, start_at, end_at)
+    await db.reservations.update_many({"_id": {"$in": keys}, "intervals.id": entry_id}, {"$set": {"intervals.$.id": new_id}})
+
+async def reserve_intervals(tenant_id: str, staff_id: str, entries):
+    """Reserve many (entry id, start, end) intervals of one staff member in one unordered bulk write.
+
+    Each operation is the same conditional update reserve_interval uses, so conflicts
+    are detected per entry in one round trip. Returns the ids of the entries that
+    could not be reserved; the others stay reserved.
+    """
+    updates = []  # (entry id, filter, update) per ledger day
+    now = int(time.time())
+    for entry_id, start_at, end_at in entries:
+        keys, start_second, end_second = reservation_keys(tenant_id, staff_id, start_at, end_at)
+        entry = {"s": start_second, "e": end_second, "id": entry_id}
+        live_overlap = {"s": {"$lt": end_second}, "e": {"$gt": start_second}, "$or": [{"x": None}, {"x": {"$gt": now}}]}
+        for key in keys:
+            updates.append((
+                entry_id,
+                {"_id": key, "intervals": {"$not": {"$elemMatch": live_overlap}}},
+                {"$push": {"intervals": entry}, "$setOnInsert": {"tenant_id": tenant_id, "staff_id": staff_id}}
+            ))
+    if not updates:
+        return []
+    
+    failed_updates = []
+    try:
+        await db.reservations.bulk_write([UpdateOne(query, update, upsert=True) for _, query, update in updates], ordered=False)
+    except BulkWriteError as e:
+        failed_updates = [updates[error["index"]] for error in e.details["writeErrors"]]
+    
+    # A duplicate key means a conflict or a document created concurrently; retry those once
+    retried = await asyncio.gather(*[db.reservations.update_one(query, update) for _, query, update in failed_updates])
+    failed_ids = {entry_id for (entry_id, _, _), result in zip(failed_updates, retried) if result.matched_count == 0}
+    
+    failed = [entry for entry in entries if entry[0] in failed_ids]
+    # An entry spanning two ledger days may be half reserved
+    await release_intervals(tenant_id, staff_id, failed)
+    return [entry_id for entry_id, _, _ in failed]
+
+async def release_intervals(tenant_id: str, staff_id: str, entries):
+    if not entries:
+        return
+    keys = set()
+    for _, start_at, end_at in entries:
+        keys.update(reservation_keys(tenant_id, staff_id, start_at, end_at)[0])
+    await db.reservations.update_many(
+        {"_id": {"$in": list(keys)}},
+        {"$pull": {"intervals": {"id": {"$in": [entry_id for entry_id, _, _ in entries]}}}}
+    )
+
+async def convert_reservation(tenant_id: str, staff_id: str, start_at, end_at, hold_id: str, appointment_id: str) -> bool:
+    """Re-label a live hold entry as a permanent appointment entry"""
+    keys, _, _ = reservation_keys(tenant_id, staff_id, start_at, end_at)
+    result = await db.reservations.update_many(
+        {"_id": {"$in": keys}, "intervals": {"$elemMatch": {"id": hold_id, "x": {"$gt": int(time.time())}}}},
+        {"$set": {"intervals.$.id": appointment_id}, "$unset": {"intervals.$.x": ""}}
+    )
+    return result.modified_count == len(keys)
+
+async def backfill_reservation_ledger():
+    """Record upcoming confirmed appointments written before the ledger existed (runs once)"""
+    if await db.migrations.find_one({"_id": "reservation_ledger"}):
+        return 0
+    since = datetime.now(timezone.utc) - timedelta(days=1)
+    recorded = 0
+    async for apt in db.appointments.find(
+        {"status": "confirmed", "end_at": {"$gt": since}},
+        {"_id": 0, "id": 1, "tenant_id": 1, "staff_id": 1, "start_at": 1, "end_at": 1}
+    ):
+        keys, start, end = reservation_keys(apt["tenant_id"], apt["staff_id"], apt["start_at"], apt["end_at"])
+        for key in keys:
+            try:
+                await db.reservations.update_one(
+                    {"_id": key, "intervals.id": {"$ne": apt["id"]}},
+                    {"$push": {"intervals": {"s": start, "e": end, "id": apt["id"]}}, "$setOnInsert": {"tenant_id": apt["tenant_id"], "staff_id": apt["staff_id"]}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # already recorded
+        recorded += 1
+    await db.migrations.update_one({"_id": "reservation_ledger"}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True)
+    return recorded
+
+# Monthly appointment quota (usage_snapshots hold one counter per tenant and month)
+def usage_month(start_at):
+    """(year, month) an appointment counts towards, in the business timezone"""
+    local = parse_datetime(start_at).astimezone(get_zone(DEFAULT_TIMEZONE))
+    return local.year, local.month
+
+async def consume_appointment_quota(tenant_id: str, plan: str, start_at, count: int = 1) -> bool:
+    """Count appointments against their month unless that would exceed the plan limit.
+
+    A single conditional $inc: the counter only moves while below the limit. The
+    unique (tenant_id, year, month) index turns an upsert against a full month into
+    a DuplicateKeyError instead of a second counter document.
+    """
+    if count > APPOINTMENT_LIMITS[plan]:
+        return False
+    year, month = usage_month(start_at)
+    for upsert in (True, False):
+        try:
+            result = await db.usage_snapshots.update_one(
+                {"tenant_id": tenant_id, "year": year, "month": month, "monthly_appointment_count": {"$lte": APPOINTMENT_LIMITS[plan] - count}},
+                {
+                    "$inc": {"monthly_appointment_count": count},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "staff_count": 0, "created_at": datetime.now(timezone.utc)}
+                },
+                upsert=upsert
+            )
+        except DuplicateKeyError:
+            # Limit reached, or the counter was created concurrently: check again
+            continue
+        return result.modified_count == 1 or result.upserted_id is not None
+    return False
+
+async def release_appointment_quota(tenant_id: str, start_at, count: int = 1):
+    year, month = usage_month(start_at)
+    await db.usage_snapshots.update_one(
+        {"tenant_id": tenant_id, "year": year, "month": month, "monthly_appointment_count": {"$gte": count}},
+        {"$inc": {"monthly_appointment_count": -count}}
+    )
+
+async def reconcile_usage_snapshots(tenant_id: Optional[str] = None) -> int:
+    """Recount confirmed appointments from last month onwards and fix drifted counters.
+
+    Counters are read before the scan and corrected by the difference with a
+    compare-and-set on the value read, so a booking or cancellation during the scan
+    is never lost: its counter is skipped and corrected by the next run. Returns the
+    number of counters that changed.
+    """
+    now = datetime.now(timezone.utc).astimezone(get_zone(DEFAULT_TIMEZONE))
+    first_year, first_month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    since = datetime(first_year, first_month, 1, tzinfo=get_zone(DEFAULT_TIMEZONE)).astimezone(timezone.utc)
+    
+    query = {"status": "confirmed", "start_at": {"$gte": since}}
+    counter_query = {"$or": [{"year": {"$gt": first_year}}, {"year": first_year, "month": {"$gte": first_month}}]}
+    series_query = {"status": "confirmed", "last_end_at": {"$gt": since}}
+    staff_query = {}
+    if tenant_id:
+        query["tenant_id"] = tenant_id
+        counter_query["tenant_id"] = tenant_id
+        series_query["tenant_id"] = tenant_id
+        staff_query["tenant_id"] = tenant_id
+    
+    # Counters without any appointments left go back to zero
+    counters = {}
+    counts = {}
+    async for counter in db.usage_snapshots.find(counter_query, projection("tenant_id", "year", "month", "monthly_appointment_count", "staff_count")):
+        key = (counter["tenant_id"], counter["year"], counter["month"])
+        counters[key] = counter
+        counts[key] = 0
+    
+    async for apt in db.appointments.find(query, {"_id": 0, "tenant_id": 1, "start_at": 1}):
+        key = (apt["tenant_id"], *usage_month(apt["start_at"]))
+        counts[key] = counts.get(key, 0) + 1
+    
+    staff_counts = {}
+    timezones = {}
+    async for staff_doc in db.staff.find(staff_query, {"_id": 0, "id": 1, "tenant_id": 1, "timezone": 1, "active": 1}):
+        timezones[staff_doc["id"]] = staff_timezone(staff_doc)
+        if staff_doc.get("active", True):
+            staff_counts[staff_doc["tenant_id"]] = staff_counts.get(staff_doc["tenant_id"], 0) + 1
+    
+    async for series_doc in db.appointment_series.find(
+        series_query, projection("tenant_id", "staff_id", "start_at", "duration_minutes", "rule", "occurrence_count", "exceptions")
+    ):
+        for _, start, _ in series_occurrences(series_doc, timezones.get(series_doc["staff_id"], DEFAULT_TIMEZONE), since):
+            key = (series_doc["tenant_id"], *usage_month(start))
+            counts[key] = counts.get(key, 0) + 1
+    
+    fixed = 0
+    for key, count in counts.items():
+        counter_tenant_id, year, month = key
+        staff_count = staff_counts.get(counter_tenant_id, 0)
+        counter = counters.get(key)
+        if counter is None:
+            # A counter created during the scan already counts its bookings: insert only
+            result = await db.usage_snapshots.update_one(
+                {"tenant_id": counter_tenant_id, "year": year, "month": month},
+                {"$setOnInsert": {"id": str(uuid.uuid4()), "monthly_appointment_count": count, "staff_count": staff_count, "created_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            fixed += result.upserted_id is not None
+            continue
+        read_count = counter.get("monthly_appointment_count", 0)
+        if count == read_count and staff_count == counter.get("staff_count"):
+            continue
+        result = await db.usage_snapshots.update_one(
+            {"tenant_id": counter_tenant_id, "year": year, "month": month, "monthly_appointment_count": read_count},
+            {"$inc": {"monthly_appointment_count": count - read_count}, "$set": {"staff_count": staff_count}}
+        )
+        fixed += result.modified_count
+    return fixed
+
+# Class sessions (services with capacity above 1 share one time slot)
+def class_session_id(staff_id: str, start_at) -> str:
+    return f"{staff_id}:{parse_datetime(start_at).isoformat()}"
+
+async def take_class_seat(tenant_id: str, staff_id: str, service: Service, start_at: datetime, end_at: datetime) -> str:
+    """Book one seat in the class session of a staff member and start time; returns its id.
+
+    Joining an existing session is a single $inc guarded by the capacity. The first
+    booking also blocks the staff member's time in the ledger: concurrent first
+    bookings each reserve their own entry (ignoring other entries of the same
+    session), and those whose upsert did not create the session give theirs back.
+    """
+    session_id = class_session_id(staff_id, start_at)
+    seat_filter = {"id": session_id, "service_id": service.id, "seats_taken": {"$lt": service.capacity}}
+    result = await db.class_sessions.update_one(seat_filter, {"$inc": {"seats_taken": 1}})
+    if result.modified_count:
+        return session_id
+    session_doc = await db.class_sessions.find_one({"id": session_id}, {"_id": 0, "service_id": 1})
+    if session_doc:
+        if session_doc["service_id"] != service.id:
+            raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+        raise HTTPException(status_code=400, detail="Kurs ausgebucht")
+    
+    ledger_id = f"{session_id}:{uuid.uuid4()}"
+    if not await reserve_interval(tenant_id, staff_id, start_at, end_at, ledger_id, ignore_prefix=session_id):
+        raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+    for upsert in (True, False):
+        try:
+            result = await db.class_sessions.update_one(
+                seat_filter,
+                {
+                    "$inc": {"seats_taken": 1},
+                    "$setOnInsert": {
+                        "tenant_id": tenant_id,
+                        "staff_id": staff_id,
+                        "start_at": start_at,
+                        "end_at": end_at,
+                        "ledger_id": ledger_id,
+                        "created_at": datetime.now(timezone.utc)
+                    }
+                },
+                upsert=upsert
+            )
+        except DuplicateKeyError:
+            # Created concurrently (or full): join it instead
+            continue
+        if result.upserted_id is not None:
+            return session_id
+        break
+    
+    await release_interval(tenant_id, staff_id, start_at, end_at, ledger_id)
+    if result.modified_count:
+        return session_id
+    raise HTTPException(status_code=400, detail="Kurs ausgebucht")
+
+async def release_class_seat(session_id: str):
+    session_doc = await db.class_sessions.find_one_and_update(
+        {"id": session_id, "seats_taken": {"$gt": 0}},
+        {"$inc": {"seats_taken": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    # The last seat closes the session and frees the staff member's time
+    if session_doc and session_doc["seats_taken"] == 0:
+        if (await db.class_sessions.delete_one({"id": session_id, "seats_taken": 0})).deleted_count:
+            await release_interval(session_doc["tenant_id"], session_doc["staff_id"], session_doc["start_at"], session_doc["end_at"], session_doc["ledger_id"])
+
+async def book_class_seat(tenant: Tenant, appointment_data: AppointmentCreate, service: Service) -> Appointment:
+    """Create an appointment holding one seat of a class"""
+    start_at = parse_datetime(appointment_data.start_at)
+    end_at = start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
+    
+    # Without a staff preference, fill an open session before starting a new one
+    if appointment_data.staff_id:
+        staff_ids = [appointment_data.staff_id]
+    else:
+        session_doc = await db.class_sessions.find_one(
+            {"tenant_id": tenant.id, "service_id": service.id, "start_at": start_at, "seats_taken": {"$lt": service.capacity}},
+            {"_id": 0, "staff_id": 1}
+        )
+        staff_ids = [session_doc["staff_id"]] if session_doc else await rank_available_staff(tenant.id, start_at, end_at)
+        if not staff_ids:
+            raise HTTPException(status_code=400, detail="Kein Mitarbeiter zu dieser Zeit verfügbar")
+    
+    # The ledger decides; a candidate it refuses passes the booking on to the next
+    for position, staff_id in enumerate(staff_ids):
+        try:
+            session_id = await take_class_seat(tenant.id, staff_id, service, start_at, end_at)
+            break
+        except HTTPException:
+            if position == len(staff_ids) - 1:
+                raise
+    appointment_data.staff_id = staff_id
+    if not await consume_appointment_quota(tenant.id, tenant.plan, start_at):
+        await release_class_seat(session_id)
+        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    
+    appointment = Appointment(
+        tenant_id=tenant.id,
+        **appointment_data.dict(exclude={"hold_id", "start_at"}),
+        start_at=start_at,
+        end_at=end_at,
+        session_id=session_id,
+        **await booking_display_fields(tenant.id, service, appointment_data.staff_id)
+    )
+    await insert_reserved_appointment(appointment)
+    on_appointment_booked(tenant.id, appointment.staff_id, appointment.id, appointment.start_at, appointment.end_at)
+    return appointment
+
+async def load_open_sessions(tenant_id: str, service: Service, staff_docs, first_day: date, last_day: date):
+    """Seats left keyed by (staff_id, day) and local start minute, for class sessions not yet full"""
+    timezones = {staff_doc["id"]: staff_timezone(staff_doc) for staff_doc in staff_docs}
+    window_start = max(min(get_day_bounds(first_day, tz_name)[0] for tz_name in timezones.values()), datetime.now(timezone.utc))
+    window_end = max(get_day_bounds(last_day, tz_name)[1] for tz_name in timezones.values())
+    sessions = {}
+    async for session_doc in db.class_sessions.find({
+        "tenant_id": tenant_id,
+        "service_id": service.id,
+        "staff_id": {"$in": list(timezones)},
+        "start_at": {"$gte": window_start, "$lt": window_end},
+        "seats_taken": {"$lt": service.capacity}
+    }, {"_id": 0, "staff_id": 1, "start_at": 1, "seats_taken": 1}):
+        tz_name = timezones[session_doc["staff_id"]]
+        start_at = parse_datetime(session_doc["start_at"])
+        day = start_at.astimezone(get_zone(tz_name)).date()
+        if first_day <= day <= last_day:
+            sessions.setdefault((session_doc["staff_id"], day), {})[to_local_minutes(start_at, day, tz_name)] = service.capacity - session_doc["seats_taken"]
+    return sessions
+
+async def load_service_slot_starts(tenant_id: str, service: Service, staff_docs, first_day: date, last_day: date, step: int):
+    """Bookable starts per (staff_id, day) plus seats left in open class sessions.
+
+    A class session blocks its staff member like an appointment, so its start is
+    added back as long as seats are left. Starts without a free required resource
+    are dropped.
+    """
+    slot_minutes = service.duration_minutes + service.buffer_minutes
+    slot_starts = await load_slot_starts(tenant_id, service.id, staff_docs, first_day, last_day, slot_minutes, step)
+    if service.required_resource_kinds and staff_docs:
+        slot_starts = await filter_slot_starts_by_resources(tenant_id, service, staff_docs, slot_starts, first_day, last_day)
+    if service.capacity <= 1 or not staff_docs:
+        return slot_starts, {}
+    sessions = await load_open_sessions(tenant_id, service, staff_docs, first_day, last_day)
+    for key, seats in sessions.items():
+        slot_starts[key] = sorted(set(slot_starts.get(key, [])) | seats.keys())
+    return slot_starts, sessions
+
+# Resources (rooms and equipment a service needs besides the staff member)
+# Resources are indexed and reserved like staff members: one StaffDay per resource and
+# local day in the occupancy index, one ledger document per resource and UTC day.
+ALWAYS_AVAILABLE = WeeklySchedule(**{
+    name: WorkingDay(is_working=True, start_time="00:00", end_time="24:00") for name in WEEKDAY_NAMES
+})
+
+async def load_resources(tenant_id: str, kinds):
+    """Active resources of the given kinds, keyed by kind"""
+    resources = {kind: [] for kind in kinds}
+    async for resource_doc in db.resources.find(
+        {"tenant_id": tenant_id, "active": True, "kind": {"$in": list(kinds)}}, {"_id": 0, "id": 1, "kind": 1}
+    ):
+        resources[resource_doc["kind"]].append(resource_doc)
+    return resources
+
+async def ensure_resource_days(tenant_id: str, resource_ids, first_day: date, last_day: date):
+    """Indexed days keyed by (resource_id, day), loading all missing ones with two queries.
+
+    Like ensure_staff_days, the number of queries does not grow with the number of
+    resources: appointments and active holds of every missing resource are fetched
+    at once and bucketed per resource in memory.
+    """
+    entries = {}
+    missing = set()
+    missing_days = []
+    for resource_id in resource_ids:
+        day = first_day
+        while day <= last_day:
+            entry = occupancy_index.get(tenant_id, resource_id, day)
+            if entry is None:
+                missing.add(resource_id)
+                missing_days.append(day)
+            else:
+                entries[(resource_id, day)] = entry
+            day += timedelta(days=1)
+    
+    if not missing:
+        return entries
+    
+    load_first, load_last = min(missing_days), max(missing_days)
+    window_start = get_day_bounds(load_first, DEFAULT_TIMEZONE)[0]
+    window_end = get_day_bounds(load_last, DEFAULT_TIMEZONE)[1]
+    time_filter = {"tenant_id": tenant_id, "resource_ids": {"$in": list(missing)}, "start_at": {"$lt": window_end}, "end_at": {"$gt": window_start}}
+    projection = {"_id": 0, "id": 1, "resource_ids": 1, "start_at": 1, "end_at": 1}
+    appointments = await db.appointments.find({**time_filter, "status": "confirmed"}, projection).to_list(None)
+    holds = await db.slot_holds.find({**time_filter, "expires_at": {"$gt": datetime.now(timezone.utc)}}, projection).to_list(None)
+    
+    # group_appointments_by_day buckets by staff_id, so each booking is listed once per resource
+    bookings = [
+        {**booking, "staff_id": resource_id}
+        for booking in appointments + holds
+        for resource_id in booking["resource_ids"] if resource_id in missing
+    ]
+    bookings_by_day = group_appointments_by_day(bookings, load_first, load_last, {resource_id: DEFAULT_TIMEZONE for resource_id in missing})
+    
+    for resource_id in missing:
+        day = first_day
+        while day <= last_day:
+            if (resource_id, day) not in entries:
+                entries[(resource_id, day)] = occupancy_index.load_day(
+                    tenant_id, resource_id, day, DEFAULT_TIMEZONE, ALWAYS_AVAILABLE, [], bookings_by_day.get((resource_id, day), [])
+                )
+            day += timedelta(days=1)
+    return entries
+
+def resources_free(entries, resources, kinds, start_at: datetime, end_at: datetime) -> bool:
+    """Whether each required kind has an indexed resource free for [start_at, end_at)"""
+    return all(
+        any(indexed_staff_free(entries, resource_doc, start_at, end_at) for resource_doc in resources[kind])
+        for kind in kinds
+    )
+
+async def filter_slot_starts_by_resources(tenant_id: str, service: Service, staff_docs, slot_starts, first_day: date, last_day: date):
+    """Drop staff slot starts for which a required resource kind is fully booked.
+
+    Resource occupancy is not part of the cached per-staff slots (it is shared by all
+    staff), so it is applied here on every read from the in-memory index.
+    """
+    kinds = service.required_resource_kinds
+    resources = await load_resources(tenant_id, kinds)
+    resource_ids = [resource_doc["id"] for docs in resources.values() for resource_doc in docs]
+    entries = await ensure_resource_days(tenant_id, resource_ids, first_day - timedelta(days=1), last_day + timedelta(days=1))
+    slot_minutes = service.duration_minutes + service.buffer_minutes
+    timezones = {staff_doc["id"]: staff_timezone(staff_doc) for staff_doc in staff_docs}
+    filtered = {}
+    for (staff_id, day), starts in slot_starts.items():
+        kept = []
+        for start in starts:
+            start_at = from_local_minutes(day, start, timezones[staff_id])
+            if resources_free(entries, resources, kinds, start_at, start_at + timedelta(minutes=slot_minutes)):
+                kept.append(start)
+        filtered[(staff_id, day)] = kept
+    return filtered
+
+async def reserve_resources(tenant_id: str, kinds, start_at, end_at, entry_id: str, expires_at=None, ignore_id: Optional[str] = None) -> List[str]:
+    """Reserve one free resource of each required kind under entry_id and return their ids.
+
+    Only resources the index shows as free are tried, so a booking usually costs one
+    ledger update per kind, however many resources there are. Raises 400 (giving
+    back what it took) when a kind is fully booked.
+    """
+    if not kinds:
+        return []
+    start_at = parse_datetime(start_at)
+    end_at = parse_datetime(end_at)
+    resources = await load_resources(tenant_id, kinds)
+    days = [day for day, _, _ in split_by_day(start_at, end_at, DEFAULT_TIMEZONE)]
+    entries = await ensure_resource_days(tenant_id, [resource_doc["id"] for docs in resources.values() for resource_doc in docs], min(days), max(days))
+    
+    reserved = []
+    for kind in kinds:
+        for resource_doc in resources[kind]:
+            if not indexed_staff_free(entries, resource_doc, start_at, end_at) and ignore_id is None:
+                continue
+            if await reserve_interval(tenant_id, resource_doc["id"], start_at, end_at, entry_id, expires_at, ignore_id):
+                reserved.append(resource_doc["id"])
+                break
+        else:
+            await release_resources(tenant_id, reserved, start_at, end_at, entry_id)
+            raise HTTPException(status_code=400, detail="Keine freie Ressource zu dieser Zeit")
+    return reserved
+
+async def reserve_resource_ids(tenant_id: str, resource_ids, start_at, end_at, entry_id: str) -> bool:
+    """Reserve exactly these resources again (re-confirming an appointment), all or none"""
+    reserved = await asyncio.gather(*[reserve_interval(tenant_id, resource_id, start_at, end_at, entry_id) for resource_id in resource_ids])
+    if all(reserved):
+        return True
+    await release_resources(tenant_id, [resource_id for resource_id, ok in zip(resource_ids, reserved) if ok], start_at, end_at, entry_id)
+    return False
+
+async def release_resources(tenant_id: str, resource_ids, start_at, end_at, entry_id: str):
+    await asyncio.gather(*[release_interval(tenant_id, resource_id, start_at, end_at, entry_id) for resource_id in resource_ids])
+
+async def release_booking(tenant_id: str, staff_id: str, resource_ids, start_at, end_at, entry_id: str):
+    """Give back the staff and resource time of a booking that is not stored"""
+    await release_interval(tenant_id, staff_id, start_at, end_at, entry_id)
+    await release_resources(tenant_id, resource_ids, start_at, end_at, entry_id)
+
+# Service chains (several services booked back to back in one visit)
+CHAIN_MAX_SERVICES = 5
+
+async def load_chain_services(tenant_id: str, service_ids) -> Optional[List[Service]]:
+    """Active services of a chain in booking order, or None if one is missing"""
+    if not 1 <= len(service_ids) <= CHAIN_MAX_SERVICES:
+        raise HTTPException(status_code=400, detail=f"Eine Kombination umfasst 1 bis {CHAIN_MAX_SERVICES} Dienstleistungen")
+    service_docs = await db.services.find(
+        {"id": {"$in": list(service_ids)}, "tenant_id": tenant_id, "active": True}, model_projection(Service)
+    ).to_list(None)
+    services = {service_doc["id"]: from_mongo(Service, service_doc) for service_doc in service_docs}
+    if any(service_id not in services for service_id in service_ids):
+        return None
+    if any(service.capacity > 1 for service in services.values()):
+        raise HTTPException(status_code=400, detail="Kurse können nicht kombiniert gebucht werden")
+    return [services[service_id] for service_id in service_ids]
+
+def chain_steps(services):
+    """(service, offset, minutes) per step, each starting when the previous one ends, plus the total minutes"""
+    steps = []
+    offset = 0
+    for service in services:
+        minutes = service.duration_minutes + service.buffer_minutes
+        steps.append((service, offset, minutes))
+        offset += minutes
+    return steps, offset
+
+def indexed_staff_free(entries, staff_doc, start_at: datetime, end_at: datetime) -> bool:
+    """Whether [start_at, end_at) lies in the free time of already loaded staff days"""
+    pieces = split_by_day(start_at, end_at, staff_timezone(staff_doc))
+    return bool(pieces) and all(
+        (staff_doc["id"], day) in entries and entries[(staff_doc["id"], day)].is_free(start, end)
+        for day, start, end in pieces
+    )
+
+def assign_chain_staff(entries, staff_docs, steps, start_at: datetime) -> Optional[List[str]]:
+    """Staff member per step of a chain starting at start_at, or None if a step fits nobody.
+
+    Steps never overlap in time, so each one goes to any staff member free for it
+    (preferring whoever took the previous step) and no combinations are tried.
+    """
+    assigned = []
+    for _, offset, minutes in steps:
+        step_start = start_at + timedelta(minutes=offset)
+        step_end = step_start + timedelta(minutes=minutes)
+        options = sorted(staff_docs, key=lambda staff_doc: not assigned or staff_doc["id"] != assigned[-1])
+        staff_doc = next((option for option in options if indexed_staff_free(entries, option, step_start, step_end)), None)
+        if staff_doc is None:
+            return None
+        assigned.append(staff_doc["id"])
+    return assigned
+
+def format_chain_steps(steps, start_at: datetime, staff_ids):
+    return [
+        {
+            "service_id": service.id,
+            "staff_id": staff_id,
+            "start_at": (start_at + timedelta(minutes=offset)).isoformat(),
+            "end_at": (start_at + timedelta(minutes=offset + minutes)).isoformat()
+        }
+        for (service, offset, minutes), staff_id in zip(steps, staff_ids)
+    ]
+
+async def find_chain_slots(tenant_id: str, services, staff_docs, day: date, step: int, mixed_staff: bool):
+    """Start times on a local day where the whole chain fits, with the staff member for each step.
+
+    With one staff member for everything the chain is a single block of its total
+    length, so the cached slot search answers it directly (cached by length, which
+    is all the result depends on). With mixed staff the starts where the first step
+    fits anyone are the candidates, and each later step prunes them with binary
+    searches in the indexed free intervals. Required resources are checked per step
+    the same way.
+    """
+    steps, total_minutes = chain_steps(services)
+    if mixed_staff:
+        slot_starts = await load_slot_starts(tenant_id, services[0].id, staff_docs, day, day, steps[0][2], step)
+        entries = await ensure_staff_days(tenant_id, staff_docs, day - timedelta(days=1), day + timedelta(days=1))
+    else:
+        slot_starts = await load_slot_starts(tenant_id, f"chain:{total_minutes}", staff_docs, day, day, total_minutes, step)
+    
+    kinds = sorted({kind for service in services for kind in service.required_resource_kinds})
+    resources = await load_resources(tenant_id, kinds)
+    resource_entries = await ensure_resource_days(
+        tenant_id, [resource_doc["id"] for docs in resources.values() for resource_doc in docs], day - timedelta(days=1), day + timedelta(days=1)
+    )
+    
+    slots = []
+    for slot in merge_staff_slots(day, staff_docs, slot_starts, total_minutes):
+        start_at = parse_datetime(slot["start_at"])
+        if not all(
+            resources_free(resource_entries, resources, service.required_resource_kinds, start_at + timedelta(minutes=offset), start_at + timedelta(minutes=offset + minutes))
+            for service, offset, minutes in steps
+        ):
+            continue
+        if mixed_staff:
+            staff_ids = assign_chain_staff(entries, staff_docs, steps, start_at)
+            if not staff_ids:
+                continue
+            del slot["staff_ids"]
+        else:
+            staff_ids = [slot["staff_ids"][0]] * len(steps)
+        slot["steps"] = format_chain_steps(steps, start_at, staff_ids)
+        slots.append(slot)
+    return slots
+
+async def book_service_chain(tenant: Tenant, appointment_data: AppointmentCreate, services) -> List[Appointment]:
+    """Book the services of a chain back to back as one appointment each, all or none.
+
+    The parts of each staff member are reserved with one bulk ledger write; if any
+    part conflicts, every part reserved so far is given back.
+    """
+    start_at = parse_datetime(appointment_data.start_at)
+    steps, total_minutes = chain_steps(services)
+    end_at = start_at + timedelta(minutes=total_minutes)
+    
+    # Candidate staff assignments, tried in order against the ledger
+    if appointment_data.staff_id:
+        assignments = [[appointment_data.staff_id] * len(steps)]
+    elif appointment_data.mixed_staff:
+        staff_docs = await db.staff.find(
+            {"tenant_id": tenant.id, "active": True}, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}
+        ).to_list(100)
+        days = [day for staff_doc in staff_docs for day, _, _ in split_by_day(start_at, end_at, staff_timezone(staff_doc))]
+        entries = await ensure_staff_days(tenant.id, staff_docs, min(days), max(days)) if days else {}
+        staff_ids = assign_chain_staff(entries, staff_docs, steps, start_at)
+        assignments = [staff_ids] if staff_ids else []
+    else:
+        assignments = [[staff_id] * len(steps) for staff_id in await rank_available_staff(tenant.id, start_at, end_at)]
+    if not assignments:
+        raise HTTPException(status_code=400, detail="Kein Mitarbeiter zu dieser Zeit verfügbar")
+    
+    chain_id = str(uuid.uuid4())
+    staff = await load_display_staff(tenant.id, [staff_id for staff_ids in assignments for staff_id in staff_ids])
+    
+    async def release_parts():
+        await asyncio.gather(*[release_intervals(tenant.id, staff_id, parts) for staff_id, parts in parts_by_staff.items()])
+        await asyncio.gather(*[release_resources(tenant.id, apt.resource_ids, apt.start_at, apt.end_at, apt.id) for apt in appointments])
+    
+    for staff_ids in assignments:
+        appointments = [
+            Appointment(
+                tenant_id=tenant.id,
+                **appointment_data.dict(exclude={"service_id", "service_ids", "staff_id", "mixed_staff", "hold_id", "start_at"}),
+                service_id=service.id,
+                staff_id=staff_id,
+                start_at=start_at + timedelta(minutes=offset),
+                end_at=start_at + timedelta(minutes=offset + minutes),
+                chain_id=chain_id,
+                **display_fields(service, staff.get(staff_id, {}))
+            )
+            for (service, offset, minutes), staff_id in zip(steps, staff_ids)
+        ]
+        parts_by_staff = {}
+        for apt in appointments:
+            parts_by_staff.setdefault(apt.staff_id, []).append((apt.id, apt.start_at, apt.end_at))
+        
+        failed = await asyncio.gather(*[reserve_intervals(tenant.id, staff_id, parts) for staff_id, parts in parts_by_staff.items()])
+        if not any(failed):
+            break
+        await release_parts()
+    else:
+        raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+    try:
+        for apt, (service, _, _) in zip(appointments, steps):
+            apt.resource_ids = await reserve_resources(tenant.id, service.required_resource_kinds, apt.start_at, apt.end_at, apt.id)
+    except HTTPException:
+        await release_parts()
+        raise
+    
+    occurrences = [(None, apt.start_at, apt.end_at) for apt in appointments]
+    if not await consume_series_quota(tenant.id, tenant.plan, occurrences):
+        await release_parts()
+        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    
+    try:
+        await db.appointments.insert_many([to_mongo(apt) for apt in appointments])
+    except Exception:
+        await db.appointments.delete_many({"chain_id": chain_id})
+        await release_parts()
+        await release_series_quota(tenant.id, occurrences)
+        raise
+    for apt in appointments:
+        on_appointment_booked(tenant.id, apt.staff_id, apt.id, apt.start_at, apt.end_at)
+        on_resources_booked(tenant.id, apt.resource_ids, apt.id, apt.start_at, apt.end_at)
+    return appointments
+
+# Appointment series (recurring bookings expanded on demand)
+SERIES_MAX_OCCURRENCES = 104
+SERIES_DEFAULT_WINDOW_DAYS = 180
+
+def series_occurrences(series, tz_name: str, window_start: Optional[datetime] = None, window_end: Optional[datetime] = None):
+    """(local date, start, end) of the non-skipped occurrences of a series overlapping a window.
+
+    Occurrences keep the first one's wall-clock time in the staff timezone, so they do
+    not shift across daylight saving changes. Only occurrences near the window are
+    computed, however long the series is.
+    """
+    zone = get_zone(tz_name)
+    first_local = parse_datetime(series["start_at"]).astimezone(zone).replace(tzinfo=None)
+    step = timedelta(weeks=series["rule"]["interval_weeks"])
+    duration = timedelta(minutes=series["duration_minutes"])
+    exceptions = set(series.get("exceptions", []))
+    
+    first_index = 0
+    if window_start is not None:
+        local_window_start = window_start.astimezone(zone).replace(tzinfo=None)
+        first_index = max(0, (local_window_start - duration - first_local) // step)
+    
+    occurrences = []
+    for index in range(first_index, series["occurrence_count"]):
+        local_start = first_local + index * step
+        start = local_start.replace(tzinfo=zone).astimezone(timezone.utc)
+        if window_end is not None and start >= window_end:
+            break
+        end = start + duration
+        if (window_start is not None and end <= window_start) or local_start.date().isoformat() in exceptions:
+            continue
+        occurrences.append((local_start.date(), start, end))
+    return occurrences
+
+def series_occurrence_id(series_id: str, day: date) -> str:
+    return f"{series_id}:{day.isoformat()}"
+
+def series_occurrence_doc(series, occurrence):
+    """An occurrence shaped like an appointment document (for the index and listings)"""
+    day, start, end = occurrence
+    return {"id": series_occurrence_id(series["id"], day), "series_id": series["id"], "staff_id": series["staff_id"], "start_at": start, "end_at": end}
+
+async def reserve_series(tenant_id: str, staff_id: str, series_id: str, occurrences):
+    """Reserve all occurrences of a series; returns the local dates that were taken"""
+    failed = set(await reserve_intervals(tenant_id, staff_id, [
+        (series_occurrence_id(series_id, day), start, end) for day, start, end in occurrences
+    ]))
+    return [day for day, _, _ in occurrences if series_occurrence_id(series_id, day) in failed]
+
+async def release_series_entries(tenant_id: str, staff_id: str, series_id: str, occurrences):
+    await release_intervals(tenant_id, staff_id, [
+        (series_occurrence_id(series_id, day), start, end) for day, start, end in occurrences
+    ])
+
+async def consume_series_quota(tenant_id: str, plan: str, occurrences) -> bool:
+    """Take plan quota for all occurrences with one conditional $inc per month (all or nothing)"""
+    per_month = {}
+    for _, start, _ in occurrences:
+        per_month.setdefault(usage_month(start), []).append(start)
+    months = list(per_month.values())
+    consumed = await asyncio.gather(*[consume_appointment_quota(tenant_id, plan, starts[0], len(starts)) for starts in months])
+    if all(consumed):
+        return True
+    await asyncio.gather(*[release_appointment_quota(tenant_id, starts[0], len(starts)) for starts, ok in zip(months, consumed) if ok])
+    return False
+
+async def release_series_quota(tenant_id: str, occurrences):
+    per_month = {}
+    for _, start, _ in occurrences:
+        per_month.setdefault(usage_month(start), []).append(start)
+    await asyncio.gather(*[release_appointment_quota(tenant_id, starts[0], len(starts)) for starts in per_month.values()])
+
+# Outgoing mail (SMTP; without SMTP_HOST messages are only logged, not delivered)
+SMTP_HOST = os.environ.get('SMTP_HOST')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_FROM = os.environ.get('SMTP_FROM', 'noreply@daylane.ch')
+BOOKING_BASE_URL = os.environ.get('BOOKING_BASE_URL', '').rstrip('/')  # Frontend origin for links in mails
+
+def deliver_mail(message: EmailMessage):
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        if SMTP_USERNAME:
+            smtp.starttls()
+            smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        smtp.send_message(message)
+
+async def send_mail(to: str, subject: str, body: str) -> bool:
+    """Send a plain text mail in a worker thread; returns whether it was handed to the SMTP server"""
+    if not SMTP_HOST:
+        logger.warning(f"SMTP_HOST not set, mail to {to} not sent: {subject}")
+        return False
+    message = EmailMessage()
+    message["From"] = SMTP_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    try:
+        await asyncio.to_thread(deliver_mail, message)
+    except (smtplib.SMTPException, OSError) as e:
+        logger.error(f"Mail to {to} failed: {str(e)}")
+        return False
+    return True
+
+# Waitlist (customers waiting for a freed slot in a time window)
+# Entries are bucketed by the UTC days their window touches (multikey window_days
+# index), so a freed slot only looks at entries of the days it touches instead of scanning.
+WAITLIST_OFFER_TTL_SECONDS = int(os.environ.get('WAITLIST_OFFER_TTL_SECONDS', '1800'))
+WAITLIST_MAX_WINDOW_DAYS = 31
+WAITLIST_MATCH_LIMIT = 50  # Candidates tried per freed slot
+
+background_tasks = set()
+
+def finish_background_task(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background task failed: {task.exception()!r}")
+
+def run_in_background(coro):
+    """Run a coroutine after the response without letting the task be garbage collected; failures are logged"""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(finish_background_task)
+    return task
+
+def waitlist_window_days(window_start: datetime, window_end: datetime) -> List[str]:
+    """UTC dates touched by [window_start, window_end), the bucket keys of an entry"""
+    days = []
+    day = window_start.date()
+    while datetime(day.year, day.month, day.day, tzinfo=timezone.utc) < window_end:
+        days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+async def offer_freed_slot(tenant_id: str, staff_id: str, start_at, end_at) -> Optional[str]:
+    """Hold a freed slot for the longest-waiting customer whose window and service fit.
+
+    Entries whose window overlaps the freed interval are read through the UTC day
+    buckets it touches; starts inside the overlap are tried on the slot step grid of
+    the freed start. The hold is placed
+    first; status, hold_id and offer_expires_at are then set in one conditional
+    update, so concurrent matchers never offer one entry twice and an interrupted
+    offer leaves the entry waiting. Returns the id of the entry that got the offer.
+    """
+    start_at = parse_datetime(start_at)
+    end_at = parse_datetime(end_at)
+    now = datetime.now(timezone.utc)
+    if end_at <= now:
+        return None
+    await expire_stale_waitlist_offers(tenant_id)
+    candidates = await db.waitlist.find({
+        "tenant_id": tenant_id,
+        "status": WaitlistStatus.WAITING,
+        "window_days": {"$in": waitlist_window_days(start_at, end_at)},
+        "staff_id": {"$in": [None, staff_id]},
+        "window_start": {"$lt": end_at},
+        "window_end": {"$gt": start_at}
+    }, model_projection(WaitlistEntry)).sort("created_at", 1).to_list(WAITLIST_MATCH_LIMIT)
+    if not candidates:
+        return None
+    
+    staff_doc = await db.staff.find_one(
+        {"id": staff_id, "tenant_id": tenant_id, "active": True},
+        {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}
+    )
+    if not staff_doc:
+        return None
+    services = {
+        doc["id"]: from_mongo(Service, doc)
+        async for doc in db.services.find(
+            {"tenant_id": tenant_id, "id": {"$in": list({entry["service_id"] for entry in candidates})}, "active": True},
+            model_projection(Service)
+        )
+    }
+    
+    step = timedelta(minutes=SLOT_STEP_MINUTES)
+    for entry in candidates:
+        service = services.get(entry["service_id"])
+        if not service or service.capacity > 1:
+            continue
+        window_end = parse_datetime(entry["window_end"])
+        overlap_start = max(start_at, parse_datetime(entry["window_start"]), now)
+        overlap_end = min(end_at, window_end)
+        duration = timedelta(minutes=service.duration_minutes + service.buffer_minutes)
+        
+        hold = None
+        slot_start = start_at - ((start_at - overlap_start) // step) * step  # First grid start inside the overlap
+        while hold is None and slot_start < overlap_end and slot_start + duration <= window_end:
+            slot_end = slot_start + duration
+            if await staff_is_free(tenant_id, staff_doc, slot_start, slot_end):
+                try:
+                    hold = await place_slot_hold(tenant_id, service, staff_id, slot_start, slot_end, WAITLIST_OFFER_TTL_SECONDS, entry["id"])
+                except HTTPException:
+                    pass  # Taken in the meantime (or no free resource)
+            slot_start += step
+        if hold is None:
+            continue
+        claimed = await db.waitlist.update_one(
+            {"id": entry["id"], "status": WaitlistStatus.WAITING},
+            {"$set": {
+                "status": WaitlistStatus.OFFERED,
+                "hold_id": hold.id,
+                "offer_staff_id": staff_id,
+                "offer_start_at": hold.start_at,
+                "offer_expires_at": hold.expires_at
+            }}
+        )
+        if claimed.modified_count == 0:
+            # Offered another slot concurrently (or left the waitlist)
+            await drop_slot_hold(tenant_id, hold.id)
+            continue
+        await notify_waitlist_offer(entry, service, hold, staff_timezone(staff_doc))
+        return entry["id"]
+    return None
+
+async def notify_waitlist_offer(entry, service: Service, hold: SlotHold, tz_name: str):
+    """Mail the offer with a link that opens the held slot on the booking page"""
+    logger.info(f"Waitlist entry {entry['id']} offered slot {hold.start_at.isoformat()} (hold {hold.id})")
+    tenant_doc = await db.tenants.find_one({"id": entry["tenant_id"]}, projection("name", "slug"))
+    zone = get_zone(tz_name)
+    body = (
+        f"Guten Tag {entry['customer_name']}\n\n"
+        f"Bei {tenant_doc['name']} ist ein Termin frei geworden, den wir für Sie reserviert haben:\n\n"
+        f"{service.name} am {hold.start_at.astimezone(zone):%d.%m.%Y um %H:%M} Uhr\n\n"
+        f"Die Reservierung gilt bis {hold.expires_at.astimezone(zone):%d.%m.%Y %H:%M} Uhr. Termin bestätigen:\n"
+        f"{BOOKING_BASE_URL}/{tenant_doc['slug']}/buchen?waitlist={entry['id']}\n"
+    )
+    await send_mail(entry["customer_email"], f"Freier Termin bei {tenant_doc['name']}", body)
+
+async def expire_stale_waitlist_offers(tenant_id: str):
+    """Expire offers whose hold ran out without the expiry being handled (e.g. the worker stopped)"""
+    await db.waitlist.update_many(
+        {
+            "tenant_id": tenant_id,
+            "status": WaitlistStatus.OFFERED,
+            "$or": [{"offer_expires_at": {"$lt": datetime.now(timezone.utc)}}, {"hold_id": None}]
+        },
+        {"$set": {"status": WaitlistStatus.EXPIRED}}
+    )
+
+async def pass_on_waitlist_offer(tenant_id: str, entry_id: str, hold_id: str, staff_id: str, start_at, end_at):
+    """Close an offer that was not booked and offer the slot to the next customer.
+
+    Only the caller that closes the offer passes the slot on; an offer that was
+    booked or already closed elsewhere (another worker's timer) is left alone.
+    """
+    result = await db.waitlist.update_one(
+        {"id": entry_id, "tenant_id": tenant_id, "status": WaitlistStatus.OFFERED, "hold_id": hold_id},
+        {"$set": {"status": WaitlistStatus.EXPIRED}}
+    )
+    if result.modified_count == 1:
+        await offer_freed_slot(tenant_id, staff_id, start_at, end_at)
+
+def on_slot_freed(tenant_id: str, staff_id: str, start_at, end_at):
+    """Offer a cancelled or deleted appointment's time to the waitlist without delaying the response"""
+    run_in_background(offer_freed_slot(tenant_id, staff_id, start_at, end_at))
+
+# Appointment display fields (service and staff details copied onto bookings)
+# Appointments and series carry the names, price and colour they are listed with, so
+# listings never look up services or staff per row. Renames and colour changes are
+# copied to existing bookings in the background; price and duration stay as booked.
+DEFAULT_STAFF_COLOR = "#3B82F6"
+DISPLAY_SERVICE_FIELDS = projection("id", "tenant_id", "name", "price_chf", "duration_minutes")
+DISPLAY_STAFF_FIELDS = projection("id", "tenant_id", "name", "color_tag")
+
+def display_fields(service, staff_doc) -> dict:
+    """Display fields of a booking for a Service and a staff document"""
+    return {
+        "service_name": service.name,
+        "price_chf": service.price_chf,
+        "duration_minutes": service.duration_minutes,
+        "staff_name": staff_doc.get("name"),
+        "staff_color": staff_doc.get("color_tag", DEFAULT_STAFF_COLOR)
+    }
+
+def series_display_fields(service, staff_doc) -> dict:
+    fields = display_fields(service, staff_doc)
+    fields["service_duration_minutes"] = fields.pop("duration_minutes")
+    return fields
+
+async def load_display_staff(tenant_id: str, staff_ids) -> dict:
+    """Name and colour of several staff members keyed by id, in one query"""
+    return {
+        doc["id"]: doc
+        async for doc in db.staff.find({"tenant_id": tenant_id, "id": {"$in": list(set(staff_ids))}}, DISPLAY_STAFF_FIELDS)
+    }
+
+async def booking_display_fields(tenant_id: str, service, staff_id: str) -> dict:
+    staff = await load_display_staff(tenant_id, [staff_id])
+    return display_fields(service, staff.get(staff_id, {}))
+
+async def copy_display_fields(tenant_id: str, owner_field: str, owner_id: str, fields: dict) -> int:
+    """Set changed display fields on every appointment and series of a service or staff member"""
+    changed = {"tenant_id": tenant_id, owner_field: owner_id, "$or": [{key: {"$ne": value}} for key, value in fields.items()]}
+    updated = 0
+    for collection in (db.appointments, db.appointment_series):
+        result = await collection.update_many(changed, {"$set": fields})
+        updated += result.modified_count
+    return updated
+
+def on_display_fields_changed(tenant_id: str, owner_field: str, owner_id: str, fields: dict):
+    """Fan a service or staff rename out to its bookings after the response"""
+    async def fan_out():
+        updated = await copy_display_fields(tenant_id, owner_field, owner_id, fields)
+        logger.info(f"Display fields of {owner_field} {owner_id} copied to {updated} bookings")
+    run_in_background(fan_out())
+
+async def backfill_display_fields():
+    """Fill display fields of bookings written before they existed (runs once)"""
+    if await db.migrations.find_one({"_id": "appointment_display_fields"}):
+        return 0
+    filled = 0
+    async for service_doc in db.services.find({}, DISPLAY_SERVICE_FIELDS):
+        owner = {"tenant_id": service_doc["tenant_id"], "service_id": service_doc["id"], "service_name": None}
+        fields = {"service_name": service_doc["name"], "price_chf": service_doc["price_chf"]}
+        result = await db.appointments.update_many(owner, {"$set": {**fields, "duration_minutes": service_doc["duration_minutes"]}})
+        filled += result.modified_count
+        await db.appointment_series.update_many(owner, {"$set": {**fields, "service_duration_minutes": service_doc["duration_minutes"]}})
+    async for staff_doc in db.staff.find({}, DISPLAY_STAFF_FIELDS):
+        fields = {"staff_name": staff_doc["name"], "staff_color": staff_doc.get("color_tag", DEFAULT_STAFF_COLOR)}
+        for collection in (db.appointments, db.appointment_series):
+            await collection.update_many({"tenant_id": staff_doc["tenant_id"], "staff_id": staff_doc["id"], "staff_name": None}, {"$set": fields})
+    await db.migrations.update_one({"_id": "appointment_display_fields"}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True)
+    return filled
+
+# Idempotency keys (retried POSTs get the stored first response)
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = 60  # A pending key is taken over after this long (crashed worker)
+IDEMPOTENCY_POLL_SECONDS = 0.1
+
+idempotency_inflight = {}  # key id -> asyncio.Future with the (status, body) of the running request
+
+def idempotent_response(status_code: int, body, replayed: bool = False):
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    if status_code >= 400:
+        raise HTTPException(status_code=status_code, detail=body, headers=headers)
+    return JSONResponse(content=body, status_code=status_code, headers=headers)
+
+async def wait_for_idempotent_result(key_id: str, fingerprint: str):
+    """Stored (status, body) of a key another worker is processing; None once its lock expired"""
+    while True:
+        doc = await db.idempotency_keys.find_one({"_id": key_id})
+        if not doc:
+            return None
+        if doc["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key wurde für eine andere Anfrage verwendet")
+        if doc["state"] == "done":
+            return doc["status_code"], doc["body"]
+        if parse_datetime(doc["locked_until"]) <= datetime.now(timezone.utc):
+            return None
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+async def run_idempotent(scope: str, key: Optional[str], payload, handler):
+    """Run handler once per idempotency key and replay its response to retries.
+
+    The first request claims the key with an insert into the TTL-indexed
+    idempotency_keys collection; concurrent requests with the same key wait for
+    its result (in-process via a shared future, across workers by polling) instead
+    of running the handler again. Client errors are stored and replayed like
+    successes; server errors release the key so a retry runs again.
+    """
+    if key is None:
+        return await handler()
+    if not 1 <= len(key) <= 255:
+        raise HTTPException(status_code=400, detail="Ungültiger Idempotency-Key")
+    
+    key_id = f"{scope}:{key}"
+    fingerprint = hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+    while True:
+        if key_id in idempotency_inflight:
+            status_code, body, request_fingerprint = await asyncio.shield(idempotency_inflight[key_id])
+            if request_fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key wurde für eine andere Anfrage verwendet")
+            return idempotent_response(status_code, body, replayed=True)
+        
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": key_id,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            })
+            break
+        except DuplicateKeyError:
+            if key_id in idempotency_inflight:
+                continue
+            result = await wait_for_idempotent_result(key_id, fingerprint)
+            if result:
+                return idempotent_response(*result, replayed=True)
+            # The claiming worker died: drop its stale lock and claim again
+            await db.idempotency_keys.delete_one({"_id": key_id, "state": "pending", "locked_until": {"$lte": datetime.now(timezone.utc)}})
+    
+    future = asyncio.get_running_loop().create_future()
+    idempotency_inflight[key_id] = future
+    try:
+        try:
+            status_code, body = 200, jsonable_encoder(await handler())
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            status_code, body = e.status_code, e.detail
+        await db.idempotency_keys.update_one({"_id": key_id}, {"$set": {"state": "done", "status_code": status_code, "body": body}})
+        future.set_result((status_code, body, fingerprint))
+    except BaseException as e:
+        await db.idempotency_keys.delete_one({"_id": key_id, "state": "pending"})
+        future.set_exception(e if isinstance(e, Exception) else HTTPException(status_code=500, detail="Anfrage abgebrochen"))
+        future.exception()  # Mark as retrieved when nobody is waiting
+        raise
+    finally:
+        idempotency_inflight.pop(key_id, None)
+    return idempotent_response(status_code, body)
+
+# Bulk appointment import (streamed CSV / NDJSON uploads)
+BULK_IMPORT_MAX_ROWS = int(os.environ.get('BULK_IMPORT_MAX_ROWS', '100000'))
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', '1000'))
+BULK_IMPORT_SPOOL_BYTES = 1024 * 1024  # Larger uploads are spooled to a temporary file
 
-# Swiss CHF Plan Packages (Fixed server-side pricing)
-PLAN_PACKAGES = {
-    "starter": {
-        "name": "Starter Plan",
-        "amount": 29.00,
-        "currency": "CHF",
-        "plan_type": PlanType.STARTER,
-        "limits": {
-            "max_staff": 2,
-            "max_appointments_per_month": 200
-        }
-    },
-    "pro": {
-        "name": "Pro Plan", 
-        "amount": 59.00,
-        "currency": "CHF",
-        "plan_type": PlanType.PRO,
-        "limits": {
-            "max_staff": 3,
-            "max_appointments_per_month": 400
-        }
-    }
-}
+async def spool_upload(request: Request):
+    """The request body, decoded chunk by chunk into a spooled temporary file and rewound"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    upload = tempfile.SpooledTemporaryFile(max_size=BULK_IMPORT_SPOOL_BYTES, mode="w+", newline="")
+    async for chunk in request.stream():
+        upload.write(decoder.decode(chunk))
+    upload.write(decoder.decode(b"", final=True))
+    upload.seek(0)
+    return upload
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def iter_upload_rows(request: Request, csv_format: bool):
+    """(line number, row dict) per non-empty record of a CSV (with header) or NDJSON upload.
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    CSV is read by csv.reader from the spooled body, so quoted fields may span lines;
+    a record is numbered by the line it starts on. Records that cannot be parsed
+    yield an error message instead of a dict.
+    """
+    upload = await spool_upload(request)
+    try:
+        if not csv_format:
+            for line_number, line in enumerate(upload, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError(line)
+                except ValueError:
+                    yield line_number, "Zeile konnte nicht gelesen werden"
+                    continue
+                yield line_number, row
+            return
+        
+        reader = csv.reader(upload)
+        header = None
+        line_number = 1
+        while True:
+            try:
+                values = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                yield line_number, "Zeile konnte nicht gelesen werden"
+                line_number = reader.line_num + 1
+                continue
+            row_line, line_number = line_number, reader.line_num + 1
+            if not any(value.strip() for value in values):
+                continue
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield row_line, {name: value.strip() or None for name, value in zip(header, values)}
+    finally:
+        upload.close()
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+def parse_import_row(tenant_id: str, row, services, staff) -> Appointment:
+    """Validate an uploaded row against the tenant's services and staff (raises ValueError)"""
+    try:
+        data = AppointmentImportRow(**{key: value for key, value in row.items() if value is not None})
+    except ValidationError as e:
+        raise ValueError(f"Ungültiges Feld: {'.'.join(str(part) for part in e.errors()[0]['loc'])}")
+    if data.service_id not in services:
+        raise ValueError("Service nicht gefunden")
+    if data.staff_id not in staff:
+        raise ValueError("Mitarbeiter nicht gefunden")
+    
+    service = services[data.service_id]
+    zone = get_zone(staff_timezone(staff[data.staff_id]))
+    start_at = data.start_at if data.start_at.tzinfo else data.start_at.replace(tzinfo=zone)
+    if data.end_at is None:
+        end_at = start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
     else:
-        expire = datetime.now(timezone.utc) + timedelta(hours=24)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+        end_at = data.end_at if data.end_at.tzinfo else data.end_at.replace(tzinfo=zone)
+    if end_at <= start_at:
+        raise ValueError("Endzeit muss nach der Startzeit liegen")
+    
+    return Appointment(
+        tenant_id=tenant_id,
+        **data.dict(exclude={"start_at", "end_at"}),
+        start_at=start_at.astimezone(timezone.utc),
+        end_at=end_at.astimezone(timezone.utc),
+        **display_fields(service, staff[data.staff_id])
+    )
 
-async def get_current_tenant(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        tenant_id: str = payload.get("sub")
-        if tenant_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+async def find_import_conflicts(tenant_id: str, staff_id: str, intervals):
+    """{line: reason} for uploaded (start, end, line) intervals of one staff member that overlap.
+
+    Stored occupancy over the upload's span is read with two queries: the staff
+    member's ledger days (live holds and recent bookings) and the confirmed
+    appointments, since the ledger was only backfilled for recent appointments.
+    Uploaded rows are sorted and swept once; of overlapping rows the earlier one is kept.
+    """
+    intervals.sort()
+    span_start = intervals[0][0]
+    span_end = max(end for _, end, _ in intervals)
+    first_day = datetime.fromtimestamp(span_start, timezone.utc).date()
+    last_day = datetime.fromtimestamp(span_end - 1, timezone.utc).date()
+    now = int(time.time())
+    stored = {
+        (entry["s"], entry["e"])
+        async for doc in db.reservations.find(
+            {"_id": {"$gte": f"{tenant_id}:{staff_id}:{first_day.isoformat()}", "$lte": f"{tenant_id}:{staff_id}:{last_day.isoformat()}"}},
+            {"_id": 0, "intervals": 1}
+        )
+        for entry in doc.get("intervals", [])
+        if entry.get("x") is None or entry["x"] > now
+    }
+    async for apt_doc in db.appointments.find({
+        "tenant_id": tenant_id,
+        "staff_id": staff_id,
+        "status": AppointmentStatus.CONFIRMED,
+        "start_at": {"$lt": datetime.fromtimestamp(span_end, timezone.utc)},
+        "end_at": {"$gt": datetime.fromtimestamp(span_start, timezone.utc)}
+    }, projection("start_at", "end_at")):
+        stored.add((int(parse_datetime(apt_doc["start_at"]).timestamp()), int(parse_datetime(apt_doc["end_at"]).timestamp())))
+    stored = sorted(stored)
+    stored_starts = [start for start, _ in stored]
+    stored_ends = list(accumulate((end for _, end in stored), max))  # Latest end among entries starting so far
     
-    tenant = await db.tenants.find_one({"id": tenant_id})
-    if tenant is None:
-        raise HTTPException(status_code=401, detail="Tenant not found")
-    return Tenant(**tenant)
-
-def prepare_for_mongo(data):
-    """Convert datetime objects to ISO strings for MongoDB storage"""
-    if isinstance(data, dict):
-        result = {}
-        for key, value in data.items():
-            if isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, dict):
-                result[key] = prepare_for_mongo(value)
-            elif isinstance(value, list):
-                result[key] = [prepare_for_mongo(item) if isinstance(item, dict) else item for item in value]
+    conflicts = {}
+    busy_until, busy_line = 0, None
+    for start, end, line in intervals:
+        position = bisect_left(stored_starts, end)
+        if position and stored_ends[position - 1] > start:
+            conflicts[line] = "Terminkonflikt mit bestehendem Termin"
+        elif start < busy_until:
+            conflicts[line] = f"Überschneidung mit Zeile {busy_line}"
+        else:
+            busy_until, busy_line = end, line
+    return conflicts
+
+async def consume_import_quota(tenant_id: str, plan: str, start_at, count: int) -> int:
+    """Take quota for up to count appointments of one month; returns how many fit"""
+    if await consume_appointment_quota(tenant_id, plan, start_at, count):
+        return count
+    # Over the limit: take what is left of the month in a second conditional $inc
+    year, month = usage_month(start_at)
+    usage_doc = await db.usage_snapshots.find_one({"tenant_id": tenant_id, "year": year, "month": month}, {"_id": 0, "monthly_appointment_count": 1})
+    remaining = min(count, APPOINTMENT_LIMITS[plan] - (usage_doc or {}).get("monthly_appointment_count", 0))
+    if remaining > 0 and await consume_appointment_quota(tenant_id, plan, start_at, remaining):
+        return remaining
+    return 0
+
+async def write_import_batch(tenant_id: str, plan: str, batch):
+    """Reserve, count and insert a batch of (line, appointment); returns {line: reason} of rows not stored"""
+    errors = {}
+    confirmed = [(line, appointment) for line, appointment in batch if appointment.status == AppointmentStatus.CONFIRMED]
+    
+    # Ledger: one unordered bulk write per staff member guards against concurrent bookings
+    by_staff = {}
+    for _, appointment in confirmed:
+        by_staff.setdefault(appointment.staff_id, []).append((appointment.id, appointment.start_at, appointment.end_at))
+    taken = set()
+    for failed in await asyncio.gather(*[reserve_intervals(tenant_id, staff_id, entries) for staff_id, entries in by_staff.items()]):
+        taken.update(failed)
+    for line, appointment in confirmed:
+        if appointment.id in taken:
+            errors[line] = "Terminkonflikt - Zeit bereits vergeben"
+    
+    # Plan limit: one conditional $inc per month; imported history before this month is not counted
+    current_month = usage_month(datetime.now(timezone.utc))
+    per_month = {}
+    for line, appointment in confirmed:
+        month = usage_month(appointment.start_at)
+        if line not in errors and month >= current_month:
+            per_month.setdefault(month, []).append((line, appointment))
+    counted = {}
+    for rows, fitting in zip(per_month.values(), await asyncio.gather(*[
+        consume_import_quota(tenant_id, plan, rows[0][1].start_at, len(rows)) for rows in per_month.values()
+    ])):
+        for position, (line, appointment) in enumerate(rows):
+            if position < fitting:
+                counted[line] = appointment
             else:
-                result[key] = value
-        return result
-    return data
-
-def parse_from_mongo(item):
-    """Convert ISO strings back to datetime objects from MongoDB"""
-    if isinstance(item, dict):
-        result = {}
-        for key, value in item.items():
-            # Skip MongoDB's _id field to avoid ObjectId serialization issues
-            if key == '_id':
-                continue
-            elif key in ['created_at', 'trial_start', 'trial_end', 'start_at', 'end_at'] and isinstance(value, str):
-                try:
-                    result[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                except:
-                    result[key] = value
-            elif isinstance(value, dict):
-                result[key] = parse_from_mongo(value)
-            elif isinstance(value, list):
-                result[key] = [parse_from_mongo(item) if isinstance(item, dict) else item for item in value]
+                errors[line] = "Monatliches Terminlimit erreicht"
+    
+    writes = [(line, appointment) for line, appointment in batch if line not in errors]
+    if writes:
+        try:
+            await db.appointments.bulk_write([InsertOne(to_mongo(appointment)) for _, appointment in writes], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                errors[writes[error["index"]][0]] = "Termin konnte nicht gespeichert werden"
+    
+    # Give back reservations and quota of rows that were not stored
+    undo = [(line, appointment) for line, appointment in confirmed if line in errors and appointment.id not in taken]
+    by_staff = {}
+    for _, appointment in undo:
+        by_staff.setdefault(appointment.staff_id, []).append((appointment.id, appointment.start_at, appointment.end_at))
+    per_month = {}
+    for line, appointment in undo:
+        if line in counted:
+            per_month.setdefault(usage_month(appointment.start_at), []).append(appointment.start_at)
+    await asyncio.gather(
+        *[release_intervals(tenant_id, staff_id, entries) for staff_id, entries in by_staff.items()],
+        *[release_appointment_quota(tenant_id, starts[0], len(starts)) for starts in per_month.values()]
+    )
+    return errors
+
+async def stream_import_results(tenant: Tenant, spool, conflicts, rows: int):
+    """Write spooled rows in batches and yield one NDJSON result line per row, then a summary"""
+    created = 0
+    staff_ids = set()
+    batch = []
+    pending = []  # (line, error, appointment id) in upload order, not yet reported
+    
+    async def flush():
+        nonlocal created
+        errors = await write_import_batch(tenant.id, tenant.plan, batch) if batch else {}
+        results = []
+        for line, error, appointment_id in pending:
+            error = error or errors.get(line)
+            if error:
+                results.append({"line": line, "status": "error", "detail": error})
+            else:
+                created += 1
+                results.append({"line": line, "status": "created", "appointment_id": appointment_id})
+        batch.clear()
+        pending.clear()
+        return "".join(json.dumps(result) + "\n" for result in results)
+    
+    try:
+        for record_line in spool:
+            record = json.loads(record_line)
+            line = record["line"]
+            error = record.get("error") or conflicts.get(line)
+            if error:
+                pending.append((line, error, None))
+            else:
+                appointment = Appointment(**record["appointment"])
+                staff_ids.add(appointment.staff_id)
+                batch.append((line, appointment))
+                pending.append((line, None, appointment.id))
+            if len(pending) >= BULK_IMPORT_BATCH_SIZE:
+                yield await flush()
+        yield await flush()
+    finally:
+        spool.close()
+        for staff_id in staff_ids:
+            on_appointments_imported(tenant.id, staff_id)
+    
+    yield json.dumps({"summary": {"rows": rows, "created": created, "failed": rows - created}}) + "\n"
+
+async def load_slot_starts(tenant_id: str, service_id: str, staff_docs, first_day: date, last_day: date, slot_minutes: int, step: int):
+    """Bookable start minutes keyed by (staff_id, day) for several staff over a date range"""
+    now = datetime.now(timezone.utc)
+    full_day_starts = {}
+    missing_staff = {}
+    missing_days = []
+    for staff_doc in staff_docs:
+        day = first_day
+        while day <= last_day:
+            starts = availability_cache.get((tenant_id, staff_doc["id"], service_id, day, step))
+            if starts is None:
+                missing_staff[staff_doc["id"]] = staff_doc
+                missing_days.append(day)
             else:
-                result[key] = value
-        return result
-    return item
+                full_day_starts[(staff_doc["id"], day)] = starts
+            day += timedelta(days=1)
+    
+    if missing_staff:
+        entries = await ensure_staff_days(tenant_id, list(missing_staff.values()), min(missing_days), max(missing_days))
+        for (staff_id, day), entry in entries.items():
+            if (staff_id, day) not in full_day_starts:
+                starts = compute_slot_starts(entry, slot_minutes, step)
+                availability_cache.put((tenant_id, staff_id, service_id, day, step), starts)
+                full_day_starts[(staff_id, day)] = starts
+    
+    # Drop start times that already lie in the past (in the staff member's local time)
+    timezones = {staff_doc["id"]: staff_timezone(staff_doc) for staff_doc in staff_docs}
+    slot_starts = {}
+    for (staff_id, day), starts in full_day_starts.items():
+        day_start, day_end = get_day_bounds(day, timezones[staff_id])
+        if now >= day_end:
+            starts = []
+        elif now > day_start:
+            not_before = to_local_minutes(now, day, timezones[staff_id], round_up=True)
+            starts = starts[bisect_left(starts, not_before):]
+        slot_starts[(staff_id, day)] = starts
+    return slot_starts
+
+async def rank_available_staff(tenant_id: str, start_at: datetime, end_at: datetime) -> List[str]:
+    """Active staff members free for [start_at, end_at) in the index, least-loaded first.
+
+    Load is the number of confirmed appointments on that day; ties are broken randomly
+    so that equally busy staff share new bookings fairly. The index may be stale, so
+    callers try the candidates in order against the ledger.
+    """
+    staff_docs = await db.staff.find(
+        {"tenant_id": tenant_id, "active": True}, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}
+    ).to_list(100)
+    
+    # Staff may live in different zones, so the local day is resolved per member
+    pieces_by_staff = {}
+    for staff_doc in staff_docs:
+        pieces = split_by_day(start_at, end_at, staff_timezone(staff_doc))
+        if len(pieces) == 1:
+            pieces_by_staff[staff_doc["id"]] = (staff_doc, pieces[0])
+    if not pieces_by_staff:
+        return []
+    
+    days = [piece[0] for _, piece in pieces_by_staff.values()]
+    entries = await ensure_staff_days(tenant_id, [staff_doc for staff_doc, _ in pieces_by_staff.values()], min(days), max(days))
+    
+    candidates = []
+    for staff_id, (staff_doc, (day, start_minute, end_minute)) in pieces_by_staff.items():
+        entry = entries[(staff_id, day)]
+        if entry.is_free(start_minute, end_minute):
+            candidates.append((len(entry.appointments), random.random(), staff_id))
+    return [staff_id for _, _, staff_id in sorted(candidates)]
+
+async def reserve_first_staff(tenant_id: str, staff_ids, start_at: datetime, end_at: datetime, entry_id: str) -> Optional[str]:
+    """Reserve [start_at, end_at) for the first candidate the ledger accepts; returns who got it"""
+    for staff_id in staff_ids:
+        if await reserve_interval(tenant_id, staff_id, start_at, end_at, entry_id):
+            return staff_id
+    return None
+
+async def staff_is_free(tenant_id: str, staff_doc, start_at: datetime, end_at: datetime) -> bool:
+    """Whether [start_at, end_at) lies in the indexed free time of one staff member"""
+    pieces = split_by_day(start_at, end_at, staff_timezone(staff_doc))
+    if not pieces:
+        return False
+    entries = await ensure_staff_days(tenant_id, [staff_doc], pieces[0][0], pieces[-1][0])
+    return indexed_staff_free(entries, staff_doc, start_at, end_at)
+
+def merge_staff_slots(day: date, staff_docs, slot_starts, slot_minutes: int, capacity: int = 1, sessions=None):
+    """Merge the free slots of several staff on a day, listing who could take each one.
+
+    Slots are merged by their UTC start so staff in different timezones never share
+    a slot just because their wall-clock times match. For classes the most seats any
+    one staff member has left are reported.
+    """
+    slots_by_start = {}
+    for staff_doc in staff_docs:
+        seats = (sessions or {}).get((staff_doc["id"], day))
+        for slot in format_slots(day, slot_starts[(staff_doc["id"], day)], slot_minutes, staff_timezone(staff_doc), capacity, seats):
+            merged = slots_by_start.setdefault(slot["start_at"], {**slot, "staff_ids": []})
+            merged["staff_ids"].append(staff_doc["id"])
+            if capacity > 1:
+                merged["seats_left"] = max(merged["seats_left"], slot["seats_left"])
+    return [slots_by_start[start_at] for start_at in sorted(slots_by_start)]
+
+async def rebuild_occupancy_index(days_ahead: int, tenant_id: Optional[str] = None) -> int:
+    """Reload the occupancy index from the database for the next days_ahead days"""
+    occupancy_index.clear(tenant_id)
+    availability_cache.clear(tenant_id)
+    staff_query = {"active": True}
+    if tenant_id:
+        staff_query["tenant_id"] = tenant_id
+    staff_docs = await db.staff.find(staff_query, {"_id": 0, "id": 1, "tenant_id": 1, "working_hours": 1, "timezone": 1}).to_list(None)
+    
+    staff_by_tenant = {}
+    for staff_doc in staff_docs:
+        staff_by_tenant.setdefault(staff_doc["tenant_id"], []).append(staff_doc)
+    
+    first_day = datetime.now(timezone.utc).date() - timedelta(days=1)  # covers zones still on yesterday
+    last_day = first_day + timedelta(days=max(days_ahead, 1))
+    loaded = 0
+    for current_tenant_id, tenant_staff in staff_by_tenant.items():
+        loaded += len(await ensure_staff_days(current_tenant_id, tenant_staff, first_day, last_day))
+    return loaded
 
 # Authentication endpoints
 @api_router.get("/")
@@ -293,7 +2873,7 @@ async def api_root():
 @api_router.post("/auth/register")
 async def register_tenant(tenant_data: TenantCreate):
     # Check if tenant already exists
-    existing = await db.tenants.find_one({"$or": [{"email": tenant_data.email}, {"slug": tenant_data.slug}]})
+    existing = await db.tenants.find_one({"$or": [{"email": tenant_data.email}, {"slug": tenant_data.slug}]}, {"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Email oder Slug bereits vergeben")
     
@@ -309,7 +2889,7 @@ async def register_tenant(tenant_data: TenantCreate):
         trial_end=trial_end
     )
     
-    tenant_dict = prepare_for_mongo(tenant.dict())
+    tenant_dict = to_mongo(tenant)
     await db.tenants.insert_one(tenant_dict)
     
     # Create access token
@@ -318,11 +2898,11 @@ async def register_tenant(tenant_data: TenantCreate):
 
 @api_router.post("/auth/login")
 async def login_tenant(login_data: TenantLogin):
-    tenant_doc = await db.tenants.find_one({"email": login_data.email})
+    tenant_doc = await db.tenants.find_one({"email": login_data.email}, model_projection(Tenant))
     if not tenant_doc or not verify_password(login_data.password, tenant_doc["password_hash"]):
         raise HTTPException(status_code=401, detail="Ungültige Anmeldedaten")
     
-    tenant = Tenant(**parse_from_mongo(tenant_doc))
+    tenant = from_mongo(Tenant, tenant_doc)
     access_token = create_access_token(data={"sub": tenant.id})
     return {"access_token": access_token, "token_type": "bearer", "tenant": tenant}
 
@@ -344,8 +2924,8 @@ async def cancel_subscription(current_tenant: Tenant = Depends(get_current_tenan
             {"id": current_tenant.id},
             {"$set": {
                 "plan": PlanType.TRIAL,
-                "trial_start": trial_start.isoformat(),
-                "trial_end": trial_end.isoformat()
+                "trial_start": trial_start,
+                "trial_end": trial_end
             }}
         )
         
@@ -354,7 +2934,7 @@ async def cancel_subscription(current_tenant: Tenant = Depends(get_current_tenan
             "id": str(uuid.uuid4()),
             "tenant_id": current_tenant.id,
             "previous_plan": current_tenant.plan,
-            "cancelled_at": trial_start.isoformat(),
+            "cancelled_at": trial_start,
             "reason": "user_requested"
         }
         
@@ -378,20 +2958,19 @@ async def get_dashboard_overview(current_tenant: Tenant = Depends(get_current_te
     # Get current date/time
     now = datetime.now(timezone.utc)
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
+    today_start, today_end = get_day_bounds(get_local_today(DEFAULT_TIMEZONE), DEFAULT_TIMEZONE)
     
     # Count appointments this month
     appointments_count = await db.appointments.count_documents({
         "tenant_id": current_tenant.id,
-        "start_at": {"$gte": month_start.isoformat()},
+        "start_at": {"$gte": month_start},
         "status": "confirmed"
     })
     
     # Count appointments today
     appointments_today = await db.appointments.count_documents({
         "tenant_id": current_tenant.id,
-        "start_at": {"$gte": today_start.isoformat(), "$lt": today_end.isoformat()},
+        "start_at": {"$gte": today_start, "$lt": today_end},
         "status": "confirmed"
     })
     
@@ -411,27 +2990,12 @@ async def get_dashboard_overview(current_tenant: Tenant = Depends(get_current_te
     customers_count = customers_result[0]["total"] if customers_result else 0
     
     # Get all appointments for today (from start of day, not just future)
-    today_end = today_start + timedelta(days=1)
-    next_appointments_cursor = db.appointments.find({
+    # Service and staff names are stored on the appointments themselves
+    next_appointments = await db.appointments.find({
         "tenant_id": current_tenant.id,
-        "start_at": {"$gte": today_start.isoformat(), "$lt": today_end.isoformat()},
+        "start_at": {"$gte": today_start, "$lt": today_end},
         "status": "confirmed"
-    }).sort("start_at", 1).limit(10)
-    
-    next_appointments = []
-    async for apt_doc in next_appointments_cursor:
-        apt = parse_from_mongo(apt_doc)
-        
-        # Get service and staff info
-        service_doc = await db.services.find_one({"id": apt["service_id"]})
-        staff_doc = await db.staff.find_one({"id": apt["staff_id"]})
-        
-        if service_doc:
-            apt["service_name"] = service_doc["name"]
-        if staff_doc:
-            apt["staff_name"] = staff_doc["name"]
-        
-        next_appointments.append(apt)
+    }, model_projection(Appointment)).sort("start_at", 1).to_list(10)
     
     return {
         "termine_heute": appointments_today,
@@ -448,8 +3012,8 @@ async def get_dashboard_overview(current_tenant: Tenant = Depends(get_current_te
 # Staff endpoints
 @api_router.get("/staff", response_model=List[Staff])
 async def get_staff(current_tenant: Tenant = Depends(get_current_tenant)):
-    staff_docs = await db.staff.find({"tenant_id": current_tenant.id}).to_list(100)
-    return [Staff(**parse_from_mongo(staff)) for staff in staff_docs]
+    staff_docs = await db.staff.find({"tenant_id": current_tenant.id}, model_projection(Staff)).to_list(100)
+    return [from_mongo(Staff, staff) for staff in staff_docs]
 
 @api_router.post("/staff", response_model=Staff)
 async def create_staff(staff_data: StaffCreate, current_tenant: Tenant = Depends(get_current_tenant)):
@@ -479,14 +3043,18 @@ async def create_staff(staff_data: StaffCreate, current_tenant: Tenant = Depends
         sunday=WorkingDay(is_working=False)
     )
     
+    if staff_data.timezone:
+        validate_timezone(staff_data.timezone)
+    
     staff = Staff(
         tenant_id=current_tenant.id,
         name=staff_data.name,
         working_hours=staff_data.working_hours or default_working_hours,
+        timezone=staff_data.timezone or DEFAULT_TIMEZONE,
         color_tag=staff_data.color_tag or "#3B82F6"
     )
     
-    staff_dict = prepare_for_mongo(staff.dict())
+    staff_dict = to_mongo(staff)
     await db.staff.insert_one(staff_dict)
     return staff
 
@@ -494,25 +3062,26 @@ async def create_staff(staff_data: StaffCreate, current_tenant: Tenant = Depends
 @api_router.put("/staff/{staff_id}/working-hours", response_model=Staff)
 async def update_staff_working_hours(staff_id: str, working_hours: WeeklySchedule, current_tenant: Tenant = Depends(get_current_tenant)):
     # Verify staff belongs to current tenant
-    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
+    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, {"_id": 1})
     if not staff_doc:
         raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
     
     # Update working hours
-    update_data = {"working_hours": prepare_for_mongo(working_hours.dict())}
+    update_data = {"working_hours": to_mongo(working_hours)}
     await db.staff.update_one(
         {"id": staff_id, "tenant_id": current_tenant.id}, 
         {"$set": update_data}
     )
+    on_working_hours_changed(current_tenant.id, staff_id, working_hours)
     
     # Return updated staff
-    updated_staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
-    return Staff(**parse_from_mongo(updated_staff_doc))
+    updated_staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, model_projection(Staff))
+    return from_mongo(Staff, updated_staff_doc)
 
 @api_router.put("/staff/{staff_id}", response_model=Staff)
 async def update_staff(staff_id: str, staff_update: StaffUpdate, current_tenant: Tenant = Depends(get_current_tenant)):
     # Verify staff belongs to current tenant
-    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
+    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, projection("timezone"))
     if not staff_doc:
         raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
     
@@ -521,7 +3090,10 @@ async def update_staff(staff_id: str, staff_update: StaffUpdate, current_tenant:
     if staff_update.name is not None:
         update_data["name"] = staff_update.name
     if staff_update.working_hours is not None:
-        update_data["working_hours"] = prepare_for_mongo(staff_update.working_hours.dict())
+        update_data["working_hours"] = to_mongo(staff_update.working_hours)
+    if staff_update.timezone is not None:
+        validate_timezone(staff_update.timezone)
+        update_data["timezone"] = staff_update.timezone
     if staff_update.color_tag is not None:
         update_data["color_tag"] = staff_update.color_tag
     if staff_update.active is not None:
@@ -535,30 +3107,39 @@ async def update_staff(staff_id: str, staff_update: StaffUpdate, current_tenant:
         {"id": staff_id, "tenant_id": current_tenant.id}, 
         {"$set": update_data}
     )
+    if staff_update.working_hours is not None:
+        on_working_hours_changed(current_tenant.id, staff_id, staff_update.working_hours)
+    if staff_update.timezone is not None and staff_update.timezone != staff_timezone(staff_doc):
+        on_timezone_changed(current_tenant.id, staff_id, staff_update.timezone)
+    renamed = {
+        field: update_data[key] for key, field in (("name", "staff_name"), ("color_tag", "staff_color")) if key in update_data
+    }
+    if renamed:
+        on_display_fields_changed(current_tenant.id, "staff_id", staff_id, renamed)
     
     # Return updated staff
-    updated_staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
-    return Staff(**parse_from_mongo(updated_staff_doc))
+    updated_staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, model_projection(Staff))
+    return from_mongo(Staff, updated_staff_doc)
 
 # Special closure dates management endpoints
 @api_router.get("/staff/{staff_id}/closures", response_model=List[SpecialClosure])
 async def get_staff_closures(staff_id: str, current_tenant: Tenant = Depends(get_current_tenant)):
     # Verify staff belongs to current tenant
-    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
+    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, {"_id": 1})
     if not staff_doc:
         raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
     
     closures_docs = await db.special_closures.find({
         "staff_id": staff_id, 
         "tenant_id": current_tenant.id
-    }).to_list(100)
+    }, model_projection(SpecialClosure)).to_list(100)
     
-    return [SpecialClosure(**parse_from_mongo(closure)) for closure in closures_docs]
+    return [from_mongo(SpecialClosure, closure) for closure in closures_docs]
 
 @api_router.post("/staff/{staff_id}/closures", response_model=SpecialClosure)
 async def create_staff_closure(staff_id: str, closure_data: SpecialClosureCreate, current_tenant: Tenant = Depends(get_current_tenant)):
     # Verify staff belongs to current tenant
-    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
+    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, {"_id": 1})
     if not staff_doc:
         raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
     
@@ -575,255 +3156,776 @@ async def create_staff_closure(staff_id: str, closure_data: SpecialClosureCreate
         **closure_data.dict()
     )
     
-    closure_dict = prepare_for_mongo(closure.dict())
+    closure_dict = to_mongo(closure)
     await db.special_closures.insert_one(closure_dict)
+    on_closure_added(current_tenant.id, staff_id, closure_dict)
     return closure
 
 @api_router.delete("/staff/{staff_id}/closures/{closure_id}")
 async def delete_staff_closure(staff_id: str, closure_id: str, current_tenant: Tenant = Depends(get_current_tenant)):
     # Verify staff belongs to current tenant
-    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id})
+    staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": current_tenant.id}, {"_id": 1})
     if not staff_doc:
         raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
     
     # Delete the closure
-    result = await db.special_closures.delete_one({
+    deleted_closure = await db.special_closures.find_one_and_delete({
         "id": closure_id,
         "staff_id": staff_id,
         "tenant_id": current_tenant.id
-    })
+    }, {"_id": 0})
+    
+    if not deleted_closure:
+        raise HTTPException(status_code=404, detail="Schließungsdatum nicht gefunden")
+    
+    on_closure_removed(current_tenant.id, staff_id, deleted_closure)
+    
+    return {"message": "Schließungsdatum gelöscht"}
+
+# Get all closures for tenant (useful for calendar display)
+@api_router.get("/closures", response_model=List[SpecialClosure])
+async def get_all_closures(current_tenant: Tenant = Depends(get_current_tenant)):
+    closures_docs = await db.special_closures.find({
+        "tenant_id": current_tenant.id
+    }, model_projection(SpecialClosure)).to_list(200)
+    
+    return [from_mongo(SpecialClosure, closure) for closure in closures_docs]
+
+# Services endpoints
+@api_router.get("/services", response_model=List[Service])
+async def get_services(current_tenant: Tenant = Depends(get_current_tenant)):
+    services_docs = await db.services.find({"tenant_id": current_tenant.id}, model_projection(Service)).to_list(100)
+    return [from_mongo(Service, service) for service in services_docs]
+
+@api_router.post("/services", response_model=Service)
+async def create_service(service_data: ServiceCreate, current_tenant: Tenant = Depends(get_current_tenant)):
+    if service_data.capacity < 1:
+        raise HTTPException(status_code=400, detail="Kapazität muss mindestens 1 sein")
+    if service_data.capacity > 1 and service_data.required_resource_kinds:
+        raise HTTPException(status_code=400, detail="Kurse können keine Ressourcen belegen")
+    service_data.required_resource_kinds = sorted(set(service_data.required_resource_kinds))
+    service = Service(tenant_id=current_tenant.id, **service_data.dict())
+    service_dict = to_mongo(service)
+    await db.services.insert_one(service_dict)
+    return service
+
+@api_router.put("/services/{service_id}", response_model=Service)
+async def update_service(service_id: str, service_update: ServiceUpdate, current_tenant: Tenant = Depends(get_current_tenant)):
+    # Verify service belongs to current tenant
+    service_doc = await db.services.find_one({"id": service_id, "tenant_id": current_tenant.id}, projection("capacity", "required_resource_kinds"))
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    
+    # Prepare update data (only include non-None fields)
+    update_data = {key: value for key, value in service_update.dict().items() if value is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Keine Aktualisierungsdaten bereitgestellt")
+    if update_data.get("capacity", 1) < 1:
+        raise HTTPException(status_code=400, detail="Kapazität muss mindestens 1 sein")
+    if "required_resource_kinds" in update_data:
+        update_data["required_resource_kinds"] = sorted(set(update_data["required_resource_kinds"]))
+    if update_data.get("capacity", service_doc.get("capacity", 1)) > 1 and update_data.get("required_resource_kinds", service_doc.get("required_resource_kinds")):
+        raise HTTPException(status_code=400, detail="Kurse können keine Ressourcen belegen")
+    
+    await db.services.update_one(
+        {"id": service_id, "tenant_id": current_tenant.id},
+        {"$set": update_data}
+    )
+    if {"duration_minutes", "buffer_minutes", "capacity", "required_resource_kinds", "active"} & update_data.keys():
+        on_service_changed(current_tenant.id, service_id)
+    if "name" in update_data:
+        on_display_fields_changed(current_tenant.id, "service_id", service_id, {"service_name": update_data["name"]})
+    
+    updated_service_doc = await db.services.find_one({"id": service_id, "tenant_id": current_tenant.id}, model_projection(Service))
+    return from_mongo(Service, updated_service_doc)
+
+# Resources endpoints
+@api_router.get("/resources", response_model=List[Resource])
+async def get_resources(current_tenant: Tenant = Depends(get_current_tenant)):
+    resource_docs = await db.resources.find({"tenant_id": current_tenant.id}, model_projection(Resource)).to_list(100)
+    return [from_mongo(Resource, resource_doc) for resource_doc in resource_docs]
+
+@api_router.post("/resources", response_model=Resource)
+async def create_resource(resource_data: ResourceCreate, current_tenant: Tenant = Depends(get_current_tenant)):
+    resource = Resource(tenant_id=current_tenant.id, **resource_data.dict())
+    await db.resources.insert_one(to_mongo(resource))
+    # Services needing this kind of resource may gain slots on any day
+    slot_event_broker.publish(current_tenant.id, {"type": "resync"})
+    return resource
+
+@api_router.put("/resources/{resource_id}", response_model=Resource)
+async def update_resource(resource_id: str, resource_update: ResourceUpdate, current_tenant: Tenant = Depends(get_current_tenant)):
+    resource_doc = await db.resources.find_one({"id": resource_id, "tenant_id": current_tenant.id}, {"_id": 1})
+    if not resource_doc:
+        raise HTTPException(status_code=404, detail="Ressource nicht gefunden")
+    
+    update_data = {key: value for key, value in resource_update.dict().items() if value is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Keine Aktualisierungsdaten bereitgestellt")
+    
+    await db.resources.update_one({"id": resource_id, "tenant_id": current_tenant.id}, {"$set": update_data})
+    if {"kind", "active"} & update_data.keys():
+        slot_event_broker.publish(current_tenant.id, {"type": "resync"})
+    
+    updated_resource_doc = await db.resources.find_one({"id": resource_id, "tenant_id": current_tenant.id}, model_projection(Resource))
+    return from_mongo(Resource, updated_resource_doc)
+
+# Public booking endpoints
+@api_router.get("/public/{tenant_slug}/appointments")
+async def get_public_appointments(tenant_slug: str, date: str, staff_id: str = None):
+    """Get appointments for a specific date and optionally staff member (for conflict checking)"""
+    try:
+        # Find tenant by slug
+        tenant_doc = await db.tenants.find_one({"slug": tenant_slug}, projection("id"))
+        if not tenant_doc:
+            raise HTTPException(status_code=404, detail="Salon nicht gefunden")
+        
+        # Parse the date
+        try:
+            appointment_date = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Ungültiges Datumsformat")
+        
+        # The date is a local calendar day of the staff member (or the business default)
+        tz_name = DEFAULT_TIMEZONE
+        if staff_id:
+            staff_doc = await db.staff.find_one({"id": staff_id, "tenant_id": tenant_doc["id"]}, {"_id": 0, "timezone": 1})
+            if staff_doc:
+                tz_name = staff_timezone(staff_doc)
+        day_start, day_end = get_day_bounds(appointment_date, tz_name)
+        
+        # Only confirmed appointments occupy time
+        query = {
+            "tenant_id": tenant_doc["id"],
+            "status": AppointmentStatus.CONFIRMED,
+            "start_at": {"$lt": day_end},
+            "end_at": {"$gt": day_start}
+        }
+        
+        # Add staff filter if provided
+        if staff_id:
+            query["staff_id"] = staff_id
+        
+        # Find appointments for the date
+        appointments_docs = await db.appointments.find(
+            query, projection("id", "staff_id", "start_at", "end_at", "service_name")
+        ).to_list(None)
+        
+        # Filter appointments for the specific date
+        appointments_for_date = []
+        for apt_doc in appointments_docs:
+            apt_start = parse_datetime(apt_doc["start_at"])
+            
+            # Check if appointment starts on the requested local date
+            if apt_start.astimezone(get_zone(tz_name)).date() == appointment_date:
+                appointments_for_date.append({
+                    "id": apt_doc["id"],
+                    "staff_id": apt_doc["staff_id"],
+                    "start_at": apt_start.isoformat(),
+                    "end_at": parse_datetime(apt_doc["end_at"]).isoformat(),
+                    "service_name": apt_doc.get("service_name", "")
+                })
+        
+        return appointments_for_date
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching public appointments: {str(e)}")
+        raise HTTPException(status_code=500, detail="Fehler beim Laden der Termine")
+
+@api_router.get("/public/{tenant_slug}/availability")
+async def get_public_availability(tenant_slug: str, service_id: str, date: str, staff_id: Optional[str] = None, step: int = SLOT_STEP_MINUTES):
+    """Get bookable start times for a service on a specific date.
+
+    Without staff_id the free times of all active staff are merged and each slot
+    lists the staff members who could take it.
+    """
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, projection("id"))
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+    
+    if step < 5 or step > 120:
+        raise HTTPException(status_code=400, detail="Ungültiges Zeitraster")
+    
+    service_doc = await db.services.find_one({"id": service_id, "tenant_id": tenant_doc["id"], "active": True}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    
+    staff_query = {"tenant_id": tenant_doc["id"], "active": True}
+    if staff_id:
+        staff_query["id"] = staff_id
+    staff_docs = await db.staff.find(staff_query, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}).to_list(100)
+    if staff_id and not staff_docs:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    service = from_mongo(Service, service_doc)
+    slot_minutes = service.duration_minutes + service.buffer_minutes
+    slot_starts, sessions = await load_service_slot_starts(tenant_doc["id"], service, staff_docs, day, day, step)
+    
+    if staff_id:
+        slots = format_slots(day, slot_starts[(staff_id, day)], slot_minutes, staff_timezone(staff_docs[0]), service.capacity, sessions.get((staff_id, day)))
+    else:
+        slots = merge_staff_slots(day, staff_docs, slot_starts, slot_minutes, service.capacity, sessions)
+    
+    return {
+        "date": date,
+        "service_id": service_id,
+        "staff_id": staff_id,
+        "slot_minutes": slot_minutes,
+        "slots": slots
+    }
+
+@api_router.get("/public/{tenant_slug}/availability/range")
+async def get_public_availability_range(
+    tenant_slug: str,
+    service_id: str,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    staff_id: Optional[str] = None,
+    counts_only: bool = False,
+    step: int = SLOT_STEP_MINUTES
+):
+    """Get bookable slots (or slot counts) per day for one or all staff over a date range"""
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, projection("id"))
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    try:
+        first_day = datetime.strptime(from_date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+    
+    if last_day < first_day or (last_day - first_day).days >= MAX_AVAILABILITY_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Zeitraum muss zwischen 1 und {MAX_AVAILABILITY_RANGE_DAYS} Tagen liegen")
+    
+    if step < 5 or step > 120:
+        raise HTTPException(status_code=400, detail="Ungültiges Zeitraster")
+    
+    service_doc = await db.services.find_one({"id": service_id, "tenant_id": tenant_doc["id"], "active": True}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    
+    staff_query = {"tenant_id": tenant_doc["id"], "active": True}
+    if staff_id:
+        staff_query["id"] = staff_id
+    staff_docs = await db.staff.find(staff_query, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}).to_list(100)
+    if staff_id and not staff_docs:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    service = from_mongo(Service, service_doc)
+    slot_minutes = service.duration_minutes + service.buffer_minutes
+    slot_starts, sessions = await load_service_slot_starts(tenant_doc["id"], service, staff_docs, first_day, last_day, step)
+    
+    days = []
+    day = first_day
+    while day <= last_day:
+        staff_results = {}
+        total = 0
+        for staff_doc in staff_docs:
+            starts = slot_starts[(staff_doc["id"], day)]
+            total += len(starts)
+            staff_result = {"count": len(starts)}
+            if not counts_only:
+                staff_result["slots"] = format_slots(day, starts, slot_minutes, staff_timezone(staff_doc), service.capacity, sessions.get((staff_doc["id"], day)))
+            staff_results[staff_doc["id"]] = staff_result
+        days.append({"date": day.isoformat(), "count": total, "staff": staff_results})
+        day += timedelta(days=1)
+    
+    return {
+        "service_id": service_id,
+        "from": from_date,
+        "to": to_date,
+        "slot_minutes": slot_minutes,
+        "days": days
+    }
+
+@api_router.get("/public/{tenant_slug}/availability/chain")
+async def get_public_chain_availability(
+    tenant_slug: str,
+    date: str,
+    service_ids: List[str] = Query(...),
+    staff_id: Optional[str] = None,
+    mixed_staff: bool = False,
+    step: int = SLOT_STEP_MINUTES
+):
+    """Get start times on a date where several services fit back to back.
+
+    Each slot lists its steps with the staff member who takes them; with mixed_staff
+    the steps may go to different staff members.
+    """
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, projection("id"))
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+    
+    if step < 5 or step > 120:
+        raise HTTPException(status_code=400, detail="Ungültiges Zeitraster")
+    
+    services = await load_chain_services(tenant_doc["id"], service_ids)
+    if services is None:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    
+    staff_query = {"tenant_id": tenant_doc["id"], "active": True}
+    if staff_id:
+        staff_query["id"] = staff_id
+    staff_docs = await db.staff.find(staff_query, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}).to_list(100)
+    if staff_id and not staff_docs:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    _, total_minutes = chain_steps(services)
+    slots = await find_chain_slots(tenant_doc["id"], services, staff_docs, day, step, mixed_staff and not staff_id)
+    
+    return {
+        "date": date,
+        "service_ids": service_ids,
+        "staff_id": staff_id,
+        "slot_minutes": total_minutes,
+        "slots": slots
+    }
+
+@api_router.get("/public/{tenant_slug}/next-available")
+async def get_next_available_slots(
+    tenant_slug: str,
+    service_id: str,
+    staff_id: Optional[str] = None,
+    limit: int = 5,
+    horizon_days: int = 90,
+    step: int = SLOT_STEP_MINUTES
+):
+    """Get the earliest bookable slots within a horizon, scanning forward in growing chunks"""
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, projection("id"))
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    if limit < 1 or limit > 50:
+        raise HTTPException(status_code=400, detail="Anzahl muss zwischen 1 und 50 liegen")
+    
+    if horizon_days < 1 or horizon_days > MAX_NEXT_AVAILABLE_HORIZON_DAYS:
+        raise HTTPException(status_code=400, detail=f"Zeithorizont muss zwischen 1 und {MAX_NEXT_AVAILABLE_HORIZON_DAYS} Tagen liegen")
+    
+    if step < 5 or step > 120:
+        raise HTTPException(status_code=400, detail="Ungültiges Zeitraster")
+    
+    service_doc = await db.services.find_one({"id": service_id, "tenant_id": tenant_doc["id"], "active": True}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    
+    staff_query = {"tenant_id": tenant_doc["id"], "active": True}
+    if staff_id:
+        staff_query["id"] = staff_id
+    staff_docs = await db.staff.find(staff_query, {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}).to_list(100)
+    if staff_id and not staff_docs:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    service = from_mongo(Service, service_doc)
+    slot_minutes = service.duration_minutes + service.buffer_minutes
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Schließungsdatum nicht gefunden")
+    first_day = min((get_local_today(staff_timezone(staff_doc)) for staff_doc in staff_docs), default=date.today())
+    horizon_end = first_day + timedelta(days=horizon_days - 1)
+    chunk_days = NEXT_AVAILABLE_FIRST_CHUNK_DAYS
+    chunk_start = first_day
+    slots = []
     
-    return {"message": "Schließungsdatum gelöscht"}
-
-# Get all closures for tenant (useful for calendar display)
-@api_router.get("/closures", response_model=List[SpecialClosure])
-async def get_all_closures(current_tenant: Tenant = Depends(get_current_tenant)):
-    closures_docs = await db.special_closures.find({
-        "tenant_id": current_tenant.id
-    }).to_list(200)
+    # Fetch appointments chunk by chunk (7, 14, 28, ... days) and stop as soon as enough slots are found
+    while staff_docs and chunk_start <= horizon_end and len(slots) < limit:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), horizon_end)
+        slot_starts, sessions = await load_service_slot_starts(tenant_doc["id"], service, staff_docs, chunk_start, chunk_end, step)
+        
+        day = chunk_start
+        while day <= chunk_end and len(slots) < limit:
+            for slot in merge_staff_slots(day, staff_docs, slot_starts, slot_minutes, service.capacity, sessions)[:limit - len(slots)]:
+                slot["date"] = day.isoformat()
+                slots.append(slot)
+            day += timedelta(days=1)
+        
+        chunk_start = chunk_end + timedelta(days=1)
+        chunk_days *= 2
     
-    return [SpecialClosure(**parse_from_mongo(closure)) for closure in closures_docs]
-
-# Services endpoints
-@api_router.get("/services", response_model=List[Service])
-async def get_services(current_tenant: Tenant = Depends(get_current_tenant)):
-    services_docs = await db.services.find({"tenant_id": current_tenant.id}).to_list(100)
-    return [Service(**parse_from_mongo(service)) for service in services_docs]
+    return {
+        "service_id": service_id,
+        "staff_id": staff_id,
+        "slot_minutes": slot_minutes,
+        "slots": slots
+    }
 
-@api_router.post("/services", response_model=Service)
-async def create_service(service_data: ServiceCreate, current_tenant: Tenant = Depends(get_current_tenant)):
-    service = Service(tenant_id=current_tenant.id, **service_data.dict())
-    service_dict = prepare_for_mongo(service.dict())
-    await db.services.insert_one(service_dict)
-    return service
+@api_router.get("/public/{tenant_slug}/events")
+async def stream_slot_events(tenant_slug: str):
+    """Server-sent events telling open booking pages which slots to reload.
 
-# Public booking endpoints
-@api_router.get("/public/{tenant_slug}/appointments")
-async def get_public_appointments(tenant_slug: str, date: str, staff_id: str = None):
-    """Get appointments for a specific date and optionally staff member (for conflict checking)"""
-    try:
-        # Find tenant by slug
-        tenant_doc = await db.tenants.find_one({"slug": tenant_slug})
-        if not tenant_doc:
-            raise HTTPException(status_code=404, detail="Salon nicht gefunden")
-        
-        # Parse the date
+    Events: "slots" (staff_id, dates), "staff" (staff_id, all dates), "service"
+    (service_id), "resources" (resource_ids, dates; services that need resources)
+    and "resync" (reload everything). Idle connections only wait on
+    their queue; a comment line is sent periodically to keep proxies from closing them.
+    """
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    if slot_event_broker.subscriber_count >= SLOT_EVENTS_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Zu viele offene Verbindungen")
+    
+    tenant_id = tenant_doc["id"]
+    queue = slot_event_broker.subscribe(tenant_id)
+    
+    async def event_stream():
         try:
-            appointment_date = datetime.strptime(date, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Ungültiges Datumsformat")
-        
-        # Build query for appointments on the specific date
-        query = {"tenant_id": tenant_doc["id"]}
-        
-        # Add staff filter if provided
-        if staff_id:
-            query["staff_id"] = staff_id
-        
-        # Find appointments for the date
-        appointments_docs = await db.appointments.find(query).to_list(100)
-        
-        # Filter appointments for the specific date
-        appointments_for_date = []
-        for apt_doc in appointments_docs:
-            apt_start = apt_doc["start_at"]
-            if isinstance(apt_start, str):
-                apt_start = datetime.fromisoformat(apt_start.replace('Z', '+00:00'))
-            
-            # Check if appointment is on the requested date
-            if apt_start.date() == appointment_date:
-                appointments_for_date.append({
-                    "id": apt_doc["id"],
-                    "staff_id": apt_doc["staff_id"],
-                    "start_at": apt_start.isoformat(),
-                    "end_at": apt_doc["end_at"] if isinstance(apt_doc["end_at"], str) else apt_doc["end_at"].isoformat(),
-                    "service_name": apt_doc.get("service_name", ""),
-                    "customer_name": apt_doc.get("customer_name", "")
-                })
-        
-        return appointments_for_date
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error fetching public appointments: {e}")
-        raise HTTPException(status_code=500, detail="Fehler beim Laden der Termine")
+            yield "retry: 5000\n: connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SLOT_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # Send everything queued in the meantime as one chunk
+                events = [event]
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+                yield format_slot_events(events)
+        finally:
+            slot_event_broker.unsubscribe(tenant_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.get("/public/{tenant_slug}/info")
 async def get_tenant_booking_info(tenant_slug: str):
-    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True})
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, projection("id", "name"))
     if not tenant_doc:
         raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
     
-    tenant = Tenant(**parse_from_mongo(tenant_doc))
-    
     # Get services and staff
-    services = await db.services.find({"tenant_id": tenant.id, "active": True}).to_list(100)
-    staff = await db.staff.find({"tenant_id": tenant.id, "active": True}).to_list(100)
+    services = await db.services.find({"tenant_id": tenant_doc["id"], "active": True}, model_projection(Service)).to_list(100)
+    staff = await db.staff.find({"tenant_id": tenant_doc["id"], "active": True}, model_projection(Staff)).to_list(100)
     
     return {
         "tenant": {
-            "name": tenant.name,
-            "id": tenant.id
+            "name": tenant_doc["name"],
+            "id": tenant_doc["id"]
         },
-        "services": [Service(**parse_from_mongo(s)) for s in services],
-        "staff": [Staff(**parse_from_mongo(s)) for s in staff]
+        "services": [from_mongo(Service, s) for s in services],
+        "staff": [from_mongo(Staff, s) for s in staff]
     }
 
-@api_router.post("/public/{tenant_slug}/appointments")
-async def create_public_appointment(tenant_slug: str, appointment_data: AppointmentCreate):
-    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True})
+@api_router.post("/public/{tenant_slug}/holds", response_model=SlotHold)
+async def create_slot_hold(tenant_slug: str, hold_data: SlotHoldCreate):
+    """Reserve a slot for SLOT_HOLD_TTL_SECONDS while the customer enters their details.
+
+    Pass the returned id as hold_id when booking. Availability and conflict checks
+    treat active holds like appointments until they expire or are released.
+    """
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
     if not tenant_doc:
         raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    tenant_id = tenant_doc["id"]
     
-    tenant = Tenant(**parse_from_mongo(tenant_doc))
+    service_doc = await db.services.find_one({"id": hold_data.service_id, "tenant_id": tenant_id, "active": True}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
     
-    # Check plan limits for current month
+    service = from_mongo(Service, service_doc)
+    if service.capacity > 1:
+        raise HTTPException(status_code=400, detail="Für Kurse sind keine Reservierungen möglich")
     now = datetime.now(timezone.utc)
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    start_at = parse_datetime(hold_data.start_at)
+    end_at = start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
+    if start_at < now:
+        raise HTTPException(status_code=400, detail="Zeitpunkt liegt in der Vergangenheit")
     
-    appointments_this_month = await db.appointments.count_documents({
-        "tenant_id": tenant.id,
-        "start_at": {"$gte": month_start.isoformat()},
-        "status": "confirmed"
-    })
+    # Losers of a race for a popular slot are rejected here from the index, without a query
+    if hold_data.staff_id:
+        staff_doc = await db.staff.find_one(
+            {"id": hold_data.staff_id, "tenant_id": tenant_id, "active": True},
+            {"_id": 0, "id": 1, "working_hours": 1, "timezone": 1}
+        )
+        if not staff_doc:
+            raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+        if not await staff_is_free(tenant_id, staff_doc, start_at, end_at):
+            raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+        return await place_slot_hold(tenant_id, service, staff_doc["id"], start_at, end_at, SLOT_HOLD_TTL_SECONDS)
     
-    plan_limits = {"trial": 30, "starter": 200, "pro": 400}
-    if appointments_this_month >= plan_limits[tenant.plan]:
-        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    # The index may be stale: a candidate the ledger refuses passes the hold on to the next
+    staff_ids = await rank_available_staff(tenant_id, start_at, end_at)
+    if not staff_ids:
+        raise HTTPException(status_code=400, detail="Kein Mitarbeiter zu dieser Zeit verfügbar")
+    for position, staff_id in enumerate(staff_ids):
+        try:
+            return await place_slot_hold(tenant_id, service, staff_id, start_at, end_at, SLOT_HOLD_TTL_SECONDS)
+        except HTTPException:
+            if position == len(staff_ids) - 1:
+                raise
+
+@api_router.delete("/public/{tenant_slug}/holds/{hold_id}")
+async def release_slot_hold(tenant_slug: str, hold_id: str):
+    """Give a held slot back before it expires (e.g. the customer picks another time)"""
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    hold_doc = await drop_slot_hold(tenant_doc["id"], hold_id)
+    if not hold_doc:
+        raise HTTPException(status_code=404, detail="Reservierung nicht gefunden")
+    
+    if hold_doc.get("waitlist_entry_id"):
+        # A declined waitlist offer goes to the next customer
+        run_in_background(pass_on_waitlist_offer(tenant_doc["id"], hold_doc["waitlist_entry_id"], hold_id, hold_doc["staff_id"], hold_doc["start_at"], hold_doc["end_at"]))
+    return {"message": "Reservierung aufgehoben"}
+
+@api_router.post("/public/{tenant_slug}/appointments")
+async def create_public_appointment(
+    tenant_slug: str,
+    appointment_data: AppointmentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        f"public:{tenant_slug}", idempotency_key, appointment_data,
+        lambda: book_public_appointment(tenant_slug, appointment_data)
+    )
+
+async def book_public_appointment(tenant_slug: str, appointment_data: AppointmentCreate):
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, model_projection(Tenant))
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    tenant = from_mongo(Tenant, tenant_doc)
+    now = datetime.now(timezone.utc)
     
     # Check trial expiry
     if tenant.plan == PlanType.TRIAL and tenant.trial_end and now > tenant.trial_end:
         raise HTTPException(status_code=400, detail="Probezeitraum abgelaufen")
     
+    if appointment_data.service_ids:
+        if appointment_data.hold_id:
+            raise HTTPException(status_code=400, detail="Reservierungen gelten nur für einzelne Dienstleistungen")
+        services = await load_chain_services(tenant.id, appointment_data.service_ids)
+        if services is None:
+            raise HTTPException(status_code=400, detail="Service nicht gefunden")
+        appointments = await book_service_chain(tenant, appointment_data, services)
+        return {"message": "Termin erfolgreich gebucht!", "appointment": appointments[0], "appointments": appointments}
+    
     # Get service to calculate end time
-    service_doc = await db.services.find_one({"id": appointment_data.service_id, "tenant_id": tenant.id})
+    service_doc = await db.services.find_one({"id": appointment_data.service_id, "tenant_id": tenant.id}, model_projection(Service))
     if not service_doc:
         raise HTTPException(status_code=400, detail="Service nicht gefunden")
     
-    service = Service(**parse_from_mongo(service_doc))
-    end_time = appointment_data.start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
-    
-    # Check for conflicts
-    conflicts = await db.appointments.find({
-        "tenant_id": tenant.id,
-        "staff_id": appointment_data.staff_id,
-        "status": "confirmed",
-        "$or": [
-            {"start_at": {"$lt": end_time.isoformat()}, "end_at": {"$gt": appointment_data.start_at.isoformat()}}
-        ]
-    }).to_list(1)
+    service = from_mongo(Service, service_doc)
+    if service.capacity > 1:
+        appointment = await book_class_seat(tenant, appointment_data, service)
+        return {"message": "Termin erfolgreich gebucht!", "appointment": appointment}
+    appointment_id = str(uuid.uuid4())
     
-    if conflicts:
-        raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+    hold = None
+    if appointment_data.hold_id:
+        # The held time is already reserved; claiming converts the reservation atomically
+        hold = await claim_slot_hold(tenant.id, appointment_data.hold_id, service.id, appointment_id)
+        appointment_data.staff_id = hold.staff_id
+        appointment_data.start_at = hold.start_at
+        end_time = hold.end_at
+        resource_ids = hold.resource_ids
+        
+        if not await consume_appointment_quota(tenant.id, tenant.plan, hold.start_at):
+            await release_booking(tenant.id, hold.staff_id, resource_ids, hold.start_at, hold.end_at, appointment_id)
+            raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    else:
+        end_time = appointment_data.start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
+        
+        # Without a preference the free staff are tried in order; the ledger decides atomically
+        if appointment_data.staff_id:
+            staff_ids = [appointment_data.staff_id]
+        else:
+            staff_ids = await rank_available_staff(tenant.id, appointment_data.start_at, end_time)
+            if not staff_ids:
+                raise HTTPException(status_code=400, detail="Kein Mitarbeiter zu dieser Zeit verfügbar")
+        
+        appointment_data.staff_id = await reserve_first_staff(tenant.id, staff_ids, appointment_data.start_at, end_time, appointment_id)
+        if not appointment_data.staff_id:
+            raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+        try:
+            resource_ids = await reserve_resources(tenant.id, service.required_resource_kinds, appointment_data.start_at, end_time, appointment_id)
+        except HTTPException:
+            await release_interval(tenant.id, appointment_data.staff_id, appointment_data.start_at, end_time, appointment_id)
+            raise
+        
+        # Plan limit: conditional $inc on the month's usage counter
+        if not await consume_appointment_quota(tenant.id, tenant.plan, appointment_data.start_at):
+            await release_booking(tenant.id, appointment_data.staff_id, resource_ids, appointment_data.start_at, end_time, appointment_id)
+            raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
     
     appointment = Appointment(
+        id=appointment_id,
         tenant_id=tenant.id,
-        **appointment_data.dict(),
-        end_at=end_time
+        **appointment_data.dict(exclude={"hold_id"}),
+        end_at=end_time,
+        resource_ids=resource_ids,
+        **await booking_display_fields(tenant.id, service, appointment_data.staff_id)
     )
     
-    appointment_dict = prepare_for_mongo(appointment.dict())
-    await db.appointments.insert_one(appointment_dict)
+    await insert_reserved_appointment(appointment)
+    if hold:
+        await db.slot_holds.delete_one({"id": hold.id})
+        untrack_hold(hold.id)
+        occupancy_index.remove_appointment(tenant.id, hold.staff_id, hold.id, hold.start_at, hold.end_at)
+        on_resources_released(tenant.id, hold.resource_ids, hold.id, hold.start_at, hold.end_at)
+        if hold.waitlist_entry_id:
+            await db.waitlist.update_one(
+                {"id": hold.waitlist_entry_id},
+                {"$set": {"status": WaitlistStatus.BOOKED, "appointment_id": appointment.id}}
+            )
+    on_appointment_booked(tenant.id, appointment.staff_id, appointment.id, appointment.start_at, appointment.end_at)
+    on_resources_booked(tenant.id, appointment.resource_ids, appointment.id, appointment.start_at, appointment.end_at)
     
     return {"message": "Termin erfolgreich gebucht!", "appointment": appointment}
 
 # Appointments endpoints
 @api_router.get("/appointments")
 async def get_appointments(current_tenant: Tenant = Depends(get_current_tenant)):
-    appointments_docs = await db.appointments.find({"tenant_id": current_tenant.id}).to_list(1000)
-    appointments = []
+    # Service and staff display fields are stored on the appointments themselves
+    appointments = await db.appointments.find({"tenant_id": current_tenant.id}, model_projection(Appointment)).to_list(1000)
     
-    for apt_doc in appointments_docs:
-        # Get service and staff info for display
-        service_doc = await db.services.find_one({"id": apt_doc["service_id"]})
-        staff_doc = await db.staff.find_one({"id": apt_doc["staff_id"]})
-        
-        apt = parse_from_mongo(apt_doc)
-        # Add display information
-        if service_doc:
-            apt["service_name"] = service_doc["name"]
-            apt["price_chf"] = service_doc["price_chf"]
-            apt["duration_minutes"] = service_doc["duration_minutes"]
-        if staff_doc:
-            apt["staff_name"] = staff_doc["name"]
-            apt["staff_color"] = staff_doc.get("color_tag", "#3B82F6")
-        
-        appointments.append(apt)
+    # Series occurrences are expanded for the default window around today
+    window_start = datetime.now(timezone.utc) - timedelta(days=SERIES_DEFAULT_WINDOW_DAYS)
+    window_end = datetime.now(timezone.utc) + timedelta(days=SERIES_DEFAULT_WINDOW_DAYS)
+    series_docs = await db.appointment_series.find({
+        "tenant_id": current_tenant.id,
+        "start_at": {"$lt": window_end},
+        "last_end_at": {"$gt": window_start}
+    }, model_projection(AppointmentSeries)).to_list(1000)
+    timezones = {
+        doc["id"]: staff_timezone(doc)
+        async for doc in db.staff.find({"tenant_id": current_tenant.id, "id": {"$in": list({series_doc["staff_id"] for series_doc in series_docs})}}, projection("id", "timezone"))
+    } if series_docs else {}
+    for series_doc in series_docs:
+        for occurrence in series_occurrences(series_doc, timezones.get(series_doc["staff_id"], DEFAULT_TIMEZONE), window_start, window_end):
+            appointments.append({
+                **{key: series_doc.get(key) for key in (
+                    "tenant_id", "service_id", "customer_name", "customer_email", "customer_phone", "notes", "status", "created_at",
+                    "service_name", "price_chf", "staff_name", "staff_color"
+                )},
+                "duration_minutes": series_doc.get("service_duration_minutes"),
+                **series_occurrence_doc(series_doc, occurrence)
+            })
     
     return appointments
 
-@api_router.post("/appointments", response_model=Appointment)
+@api_router.post("/appointments", response_model=Union[Appointment, AppointmentChain])
 async def create_appointment(appointment_data: AppointmentCreate, current_tenant: Tenant = Depends(get_current_tenant)):
+    if appointment_data.service_ids:
+        services = await load_chain_services(current_tenant.id, appointment_data.service_ids)
+        if services is None:
+            raise HTTPException(status_code=400, detail="Service nicht gefunden")
+        appointments = await book_service_chain(current_tenant, appointment_data, services)
+        return AppointmentChain(chain_id=appointments[0].chain_id, appointments=appointments)
+    
     # Get service to calculate end time
-    service_doc = await db.services.find_one({"id": appointment_data.service_id, "tenant_id": current_tenant.id})
+    service_doc = await db.services.find_one({"id": appointment_data.service_id, "tenant_id": current_tenant.id}, model_projection(Service))
     if not service_doc:
         raise HTTPException(status_code=400, detail="Service nicht gefunden")
     
-    service = Service(**parse_from_mongo(service_doc))
+    service = from_mongo(Service, service_doc)
+    if service.capacity > 1:
+        return await book_class_seat(current_tenant, appointment_data, service)
     end_time = appointment_data.start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
     
-    # Check for conflicts
-    conflicts = await db.appointments.find({
-        "tenant_id": current_tenant.id,
-        "staff_id": appointment_data.staff_id,
-        "status": "confirmed",
-        "$or": [
-            {"start_at": {"$lt": end_time.isoformat()}, "end_at": {"$gt": appointment_data.start_at.isoformat()}}
-        ]
-    }).to_list(1)
+    # Without a preference the free staff are tried in order
+    if appointment_data.staff_id:
+        staff_ids = [appointment_data.staff_id]
+    else:
+        staff_ids = await rank_available_staff(current_tenant.id, appointment_data.start_at, end_time)
+        if not staff_ids:
+            raise HTTPException(status_code=400, detail="Kein Mitarbeiter zu dieser Zeit verfügbar")
     
-    if conflicts:
+    # Conflict check and reservation are one atomic ledger update
+    appointment_id = str(uuid.uuid4())
+    appointment_data.staff_id = await reserve_first_staff(current_tenant.id, staff_ids, appointment_data.start_at, end_time, appointment_id)
+    if not appointment_data.staff_id:
         raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
     
-    # Check plan limits for current month
-    now = datetime.now(timezone.utc)
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    appointments_this_month = await db.appointments.count_documents({
-        "tenant_id": current_tenant.id,
-        "start_at": {"$gte": month_start.isoformat()},
-        "status": "confirmed"
-    })
-    
-    plan_limits = {"trial": 30, "starter": 200, "pro": 400}
-    if appointments_this_month >= plan_limits[current_tenant.plan]:
-        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
-    
     appointment = Appointment(
+        id=appointment_id,
         tenant_id=current_tenant.id,
-        **appointment_data.dict(),
-        end_at=end_time
+        **appointment_data.dict(exclude={"hold_id"}),
+        end_at=end_time,
+        **await booking_display_fields(current_tenant.id, service, appointment_data.staff_id)
     )
+    try:
+        appointment.resource_ids = await reserve_resources(current_tenant.id, service.required_resource_kinds, appointment.start_at, appointment.end_at, appointment.id)
+    except HTTPException:
+        await release_interval(current_tenant.id, appointment.staff_id, appointment.start_at, appointment.end_at, appointment.id)
+        raise
+    
+    # Plan limit: conditional $inc on the month's usage counter
+    if not await consume_appointment_quota(current_tenant.id, current_tenant.plan, appointment.start_at):
+        await release_booking(current_tenant.id, appointment.staff_id, appointment.resource_ids, appointment.start_at, appointment.end_at, appointment.id)
+        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
     
-    appointment_dict = prepare_for_mongo(appointment.dict())
-    await db.appointments.insert_one(appointment_dict)
+    await insert_reserved_appointment(appointment)
+    on_appointment_booked(current_tenant.id, appointment.staff_id, appointment.id, appointment.start_at, appointment.end_at)
+    on_resources_booked(current_tenant.id, appointment.resource_ids, appointment.id, appointment.start_at, appointment.end_at)
     
     return appointment
 
+@api_router.post("/appointments/bulk")
+async def import_appointments(request: Request, current_tenant: Tenant = Depends(get_current_tenant)):
+    """Import appointments from a CSV (with header row) or NDJSON upload.
+
+    The upload is read as a stream into a spool file; only (start, end, line) tuples
+    stay in memory for the per-staff overlap sweep. The response streams one NDJSON
+    result per row, followed by a summary line.
+    """
+    csv_format = "csv" in request.headers.get("content-type", "")
+    # Class seats and resources are booked individually, so those services are not importable
+    services = {
+        doc["id"]: from_mongo(Service, doc)
+        async for doc in db.services.find(
+            {"tenant_id": current_tenant.id, "capacity": {"$not": {"$gt": 1}}, "required_resource_kinds.0": {"$exists": False}},
+            model_projection(Service)
+        )
+    }
+    staff = {
+        doc["id"]: doc
+        async for doc in db.staff.find({"tenant_id": current_tenant.id}, projection("id", "name", "color_tag", "timezone"))
+    }
+    
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_IMPORT_SPOOL_BYTES, mode="w+")
+    intervals = {}  # staff_id -> [(start, end, line)] of confirmed rows
+    rows = 0
+    async for line, row in iter_upload_rows(request, csv_format):
+        rows += 1
+        if rows > BULK_IMPORT_MAX_ROWS:
+            spool.close()
+            raise HTTPException(status_code=413, detail=f"Maximal {BULK_IMPORT_MAX_ROWS} Zeilen pro Import")
+        try:
+            if isinstance(row, str):
+                raise ValueError(row)
+            appointment = parse_import_row(current_tenant.id, row, services, staff)
+        except ValueError as e:
+            spool.write(json.dumps({"line": line, "error": str(e)}) + "\n")
+            continue
+        spool.write(json.dumps({"line": line, "appointment": jsonable_encoder(appointment)}) + "\n")
+        if appointment.status == AppointmentStatus.CONFIRMED:
+            intervals.setdefault(appointment.staff_id, []).append((int(appointment.start_at.timestamp()), int(appointment.end_at.timestamp()), line))
+    
+    conflicts = {}
+    for staff_id, staff_intervals in intervals.items():
+        conflicts.update(await find_import_conflicts(current_tenant.id, staff_id, staff_intervals))
+    intervals.clear()
+    
+    spool.seek(0)
+    return StreamingResponse(stream_import_results(current_tenant, spool, conflicts, rows), media_type="application/x-ndjson")
+
 class AppointmentUpdate(BaseModel):
     customer_name: Optional[str] = None
     customer_email: Optional[EmailStr] = None
@@ -831,13 +3933,18 @@ class AppointmentUpdate(BaseModel):
     notes: Optional[str] = None
     status: Optional[AppointmentStatus] = None
 
+class AppointmentReschedule(BaseModel):
+    start_at: datetime
+    staff_id: Optional[str] = None  # None keeps the current staff member
+    service_id: Optional[str] = None  # None keeps the current service
+
 @api_router.put("/appointments/{appointment_id}", response_model=Appointment)
 async def update_appointment(appointment_id: str, appointment_data: AppointmentUpdate, current_tenant: Tenant = Depends(get_current_tenant)):
     # Find the appointment
     appointment_doc = await db.appointments.find_one({
         "id": appointment_id,
         "tenant_id": current_tenant.id
-    })
+    }, projection("service_id", "staff_id", "start_at", "end_at", "status", "session_id", "resource_ids"))
     
     if not appointment_doc:
         raise HTTPException(status_code=404, detail="Termin nicht gefunden")
@@ -858,37 +3965,462 @@ async def update_appointment(appointment_id: str, appointment_data: AppointmentU
     if not update_data:
         raise HTTPException(status_code=400, detail="Keine Aktualisierungsdaten bereitgestellt")
     
-    # Update appointment
-    await db.appointments.update_one(
-        {"id": appointment_id, "tenant_id": current_tenant.id},
+    was_confirmed = appointment_doc["status"] == AppointmentStatus.CONFIRMED
+    reconfirming = appointment_data.status == AppointmentStatus.CONFIRMED and not was_confirmed
+    releasing = appointment_data.status not in (None, AppointmentStatus.CONFIRMED) and was_confirmed
+    
+    async def give_back():
+        if appointment_doc.get("session_id"):
+            await release_class_seat(appointment_doc["session_id"])
+        else:
+            await release_booking(current_tenant.id, appointment_doc["staff_id"], appointment_doc.get("resource_ids", []), appointment_doc["start_at"], appointment_doc["end_at"], appointment_id)
+    
+    # Re-confirming a cancelled appointment needs its time and quota back
+    if reconfirming:
+        if appointment_doc.get("session_id"):
+            service_doc = await db.services.find_one({"id": appointment_doc["service_id"], "tenant_id": current_tenant.id}, model_projection(Service))
+            if not service_doc:
+                raise HTTPException(status_code=400, detail="Service nicht gefunden")
+            await take_class_seat(current_tenant.id, appointment_doc["staff_id"], from_mongo(Service, service_doc), parse_datetime(appointment_doc["start_at"]), parse_datetime(appointment_doc["end_at"]))
+        else:
+            if not await reserve_interval(current_tenant.id, appointment_doc["staff_id"], appointment_doc["start_at"], appointment_doc["end_at"], appointment_id):
+                raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+            if not await reserve_resource_ids(current_tenant.id, appointment_doc.get("resource_ids", []), appointment_doc["start_at"], appointment_doc["end_at"], appointment_id):
+                await release_interval(current_tenant.id, appointment_doc["staff_id"], appointment_doc["start_at"], appointment_doc["end_at"], appointment_id)
+                raise HTTPException(status_code=400, detail="Keine freie Ressource zu dieser Zeit")
+        if not await consume_appointment_quota(current_tenant.id, current_tenant.plan, appointment_doc["start_at"]):
+            await give_back()
+            raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    
+    # Conditional on the status read above, so concurrent changes release time and quota once
+    result = await db.appointments.update_one(
+        {"id": appointment_id, "tenant_id": current_tenant.id, "status": appointment_doc["status"]},
         {"$set": update_data}
     )
+    if result.matched_count == 0:
+        if reconfirming:
+            await give_back()
+            await release_appointment_quota(current_tenant.id, appointment_doc["start_at"])
+        raise HTTPException(status_code=409, detail="Termin wurde zwischenzeitlich geändert")
     
     # Get updated appointment
     updated_doc = await db.appointments.find_one({
         "id": appointment_id,
         "tenant_id": current_tenant.id
-    })
+    }, model_projection(Appointment))
+    
+    # Keep the occupancy index in sync with status changes
+    resource_ids = updated_doc.get("resource_ids", [])
+    if reconfirming:
+        on_appointment_booked(current_tenant.id, updated_doc["staff_id"], appointment_id, updated_doc["start_at"], updated_doc["end_at"])
+        on_resources_booked(current_tenant.id, resource_ids, appointment_id, updated_doc["start_at"], updated_doc["end_at"])
+    elif releasing:
+        await give_back()
+        await release_appointment_quota(current_tenant.id, updated_doc["start_at"])
+        on_appointment_released(current_tenant.id, updated_doc["staff_id"], appointment_id, updated_doc["start_at"], updated_doc["end_at"])
+        on_resources_released(current_tenant.id, resource_ids, appointment_id, updated_doc["start_at"], updated_doc["end_at"])
+        if not updated_doc.get("session_id"):
+            on_slot_freed(current_tenant.id, updated_doc["staff_id"], updated_doc["start_at"], updated_doc["end_at"])
+    
+    return from_mongo(Appointment, updated_doc)
+
+@api_router.put("/appointments/{appointment_id}/reschedule", response_model=Appointment)
+async def reschedule_appointment(appointment_id: str, reschedule_data: AppointmentReschedule, current_tenant: Tenant = Depends(get_current_tenant)):
+    """Move an appointment to a new time, staff member or service in one step.
+
+    The new time is reserved before the old one is released, so the slot is never
+    free to other customers in between. The monthly quota is unchanged; only a move
+    to another month transfers the count.
+    """
+    appointment_doc = await db.appointments.find_one({"id": appointment_id, "tenant_id": current_tenant.id}, model_projection(Appointment))
+    if not appointment_doc:
+        raise HTTPException(status_code=404, detail="Termin nicht gefunden")
+    if appointment_doc["status"] != AppointmentStatus.CONFIRMED:
+        raise HTTPException(status_code=400, detail="Nur bestätigte Termine können verschoben werden")
+    if appointment_doc.get("session_id"):
+        raise HTTPException(status_code=400, detail="Kursplätze können nicht verschoben werden")
+    
+    service_id = reschedule_data.service_id or appointment_doc["service_id"]
+    staff_id = reschedule_data.staff_id or appointment_doc["staff_id"]
+    service_doc = await db.services.find_one({"id": service_id, "tenant_id": current_tenant.id}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=400, detail="Service nicht gefunden")
+    staff = await load_display_staff(current_tenant.id, [staff_id])
+    if staff_id not in staff:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    service = from_mongo(Service, service_doc)
+    if service.capacity > 1:
+        raise HTTPException(status_code=400, detail="Kursplätze können nicht verschoben werden")
+    old_start = parse_datetime(appointment_doc["start_at"])
+    old_end = parse_datetime(appointment_doc["end_at"])
+    start_at = parse_datetime(reschedule_data.start_at)
+    end_at = start_at + timedelta(minutes=service.duration_minutes + service.buffer_minutes)
+    
+    # The appointment's own interval does not count as a conflict
+    moving_id = f"{appointment_id}:reschedule"
+    if not await reserve_interval(current_tenant.id, staff_id, start_at, end_at, moving_id, ignore_id=appointment_id):
+        raise HTTPException(status_code=400, detail="Terminkonflikt - Zeit bereits vergeben")
+    try:
+        resource_ids = await reserve_resources(current_tenant.id, service.required_resource_kinds, start_at, end_at, moving_id, ignore_id=appointment_id)
+    except HTTPException:
+        await release_interval(current_tenant.id, staff_id, start_at, end_at, moving_id)
+        raise
+    
+    # A move to another month transfers the count
+    month_changed = usage_month(start_at) != usage_month(old_start)
+    if month_changed and not await consume_appointment_quota(current_tenant.id, current_tenant.plan, start_at):
+        await release_booking(current_tenant.id, staff_id, resource_ids, start_at, end_at, moving_id)
+        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    
+    # Single conditional update: fails if the appointment changed since it was read
+    result = await db.appointments.update_one(
+        {
+            "id": appointment_id,
+            "tenant_id": current_tenant.id,
+            "status": AppointmentStatus.CONFIRMED,
+            "staff_id": appointment_doc["staff_id"],
+            "start_at": appointment_doc["start_at"]
+        },
+        {"$set": {
+            "staff_id": staff_id,
+            "service_id": service_id,
+            "start_at": start_at,
+            "end_at": end_at,
+            "resource_ids": resource_ids,
+            **display_fields(service, staff[staff_id])
+        }}
+    )
+    if result.matched_count == 0:
+        await release_booking(current_tenant.id, staff_id, resource_ids, start_at, end_at, moving_id)
+        if month_changed:
+            await release_appointment_quota(current_tenant.id, start_at)
+        raise HTTPException(status_code=409, detail="Termin wurde zwischenzeitlich geändert")
+    
+    old_resource_ids = appointment_doc.get("resource_ids", [])
+    await release_booking(current_tenant.id, appointment_doc["staff_id"], old_resource_ids, old_start, old_end, appointment_id)
+    for owner_id in [staff_id, *resource_ids]:
+        await relabel_reservation(current_tenant.id, owner_id, start_at, end_at, moving_id, appointment_id)
+    if month_changed:
+        await release_appointment_quota(current_tenant.id, old_start)
+    on_appointment_released(current_tenant.id, appointment_doc["staff_id"], appointment_id, old_start, old_end)
+    on_resources_released(current_tenant.id, old_resource_ids, appointment_id, old_start, old_end)
+    on_appointment_booked(current_tenant.id, staff_id, appointment_id, start_at, end_at)
+    on_resources_booked(current_tenant.id, resource_ids, appointment_id, start_at, end_at)
     
-    return Appointment(**parse_from_mongo(updated_doc))
+    return from_mongo(Appointment, {
+        **appointment_doc,
+        "staff_id": staff_id,
+        "service_id": service_id,
+        "start_at": start_at,
+        "end_at": end_at,
+        "resource_ids": resource_ids,
+        **display_fields(service, staff[staff_id])
+    })
 
 @api_router.delete("/appointments/{appointment_id}")
 async def delete_appointment(appointment_id: str, current_tenant: Tenant = Depends(get_current_tenant)):
     # Find and delete the appointment
-    result = await db.appointments.delete_one({
+    deleted_doc = await db.appointments.find_one_and_delete({
         "id": appointment_id,
         "tenant_id": current_tenant.id
-    })
+    }, {"_id": 0, "staff_id": 1, "start_at": 1, "end_at": 1, "status": 1, "session_id": 1, "resource_ids": 1})
     
-    if result.deleted_count == 0:
+    if not deleted_doc:
         raise HTTPException(status_code=404, detail="Termin nicht gefunden")
     
+    resource_ids = deleted_doc.get("resource_ids", [])
+    if not deleted_doc.get("session_id"):
+        await release_booking(current_tenant.id, deleted_doc["staff_id"], resource_ids, deleted_doc["start_at"], deleted_doc["end_at"], appointment_id)
+    if deleted_doc.get("status") == AppointmentStatus.CONFIRMED:
+        if deleted_doc.get("session_id"):
+            await release_class_seat(deleted_doc["session_id"])
+        await release_appointment_quota(current_tenant.id, deleted_doc["start_at"])
+    on_appointment_released(current_tenant.id, deleted_doc["staff_id"], appointment_id, deleted_doc["start_at"], deleted_doc["end_at"])
+    on_resources_released(current_tenant.id, resource_ids, appointment_id, deleted_doc["start_at"], deleted_doc["end_at"])
+    if deleted_doc.get("status") == AppointmentStatus.CONFIRMED and not deleted_doc.get("session_id"):
+        on_slot_freed(current_tenant.id, deleted_doc["staff_id"], deleted_doc["start_at"], deleted_doc["end_at"])
+    
     return {"message": "Termin erfolgreich gelöscht", "appointment_id": appointment_id}
 
+# Appointment series endpoints
+async def load_series(tenant_id: str, series_id: str):
+    """Series document and its staff timezone"""
+    series_doc = await db.appointment_series.find_one({"id": series_id, "tenant_id": tenant_id}, model_projection(AppointmentSeries))
+    if not series_doc:
+        raise HTTPException(status_code=404, detail="Terminserie nicht gefunden")
+    staff_doc = await db.staff.find_one({"id": series_doc["staff_id"], "tenant_id": tenant_id}, {"_id": 0, "timezone": 1})
+    return series_doc, staff_timezone(staff_doc or {})
+
+@api_router.post("/appointment-series", response_model=AppointmentSeries)
+async def create_appointment_series(series_data: AppointmentSeriesCreate, current_tenant: Tenant = Depends(get_current_tenant)):
+    """Book a recurring appointment; all occurrences are reserved in one bulk ledger write"""
+    service_doc = await db.services.find_one({"id": series_data.service_id, "tenant_id": current_tenant.id}, model_projection(Service))
+    if not service_doc:
+        raise HTTPException(status_code=400, detail="Service nicht gefunden")
+    staff_doc = await db.staff.find_one({"id": series_data.staff_id, "tenant_id": current_tenant.id}, projection("name", "color_tag", "timezone"))
+    if not staff_doc:
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    tz_name = staff_timezone(staff_doc)
+    
+    rule = series_data.rule
+    if not 1 <= rule.interval_weeks <= 52:
+        raise HTTPException(status_code=400, detail="Ungültiges Wiederholungsintervall")
+    if (rule.count is None) == (rule.until is None):
+        raise HTTPException(status_code=400, detail="Anzahl oder Enddatum der Serie angeben")
+    if rule.count is not None:
+        occurrence_count = rule.count
+    else:
+        try:
+            until = datetime.strptime(rule.until, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+        first_day = series_data.start_at.astimezone(get_zone(tz_name)).date()
+        occurrence_count = (until - first_day).days // (7 * rule.interval_weeks) + 1
+    if not 1 <= occurrence_count <= SERIES_MAX_OCCURRENCES:
+        raise HTTPException(status_code=400, detail=f"Eine Terminserie umfasst 1 bis {SERIES_MAX_OCCURRENCES} Termine")
+    
+    service = from_mongo(Service, service_doc)
+    if service.capacity > 1:
+        raise HTTPException(status_code=400, detail="Für Kurse sind keine Terminserien möglich")
+    if service.required_resource_kinds:
+        raise HTTPException(status_code=400, detail="Für Dienstleistungen mit Ressourcen sind keine Terminserien möglich")
+    series = AppointmentSeries(
+        tenant_id=current_tenant.id,
+        duration_minutes=service.duration_minutes + service.buffer_minutes,
+        occurrence_count=occurrence_count,
+        last_end_at=series_data.start_at,
+        **series_data.dict(exclude={"skip_conflicts"}),
+        **series_display_fields(service, staff_doc)
+    )
+    occurrences = series_occurrences(series.dict(), tz_name)
+    
+    # One unordered bulk write checks and reserves every occurrence
+    conflicts = await reserve_series(current_tenant.id, series.staff_id, series.id, occurrences)
+    if conflicts:
+        conflict_days = set(conflicts)
+        occurrences = [occurrence for occurrence in occurrences if occurrence[0] not in conflict_days]
+        if not series_data.skip_conflicts or not occurrences:
+            await release_series_entries(current_tenant.id, series.staff_id, series.id, occurrences)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Terminkonflikt an folgenden Tagen: {', '.join(day.isoformat() for day in conflicts)}"
+            )
+        series.exceptions = [day.isoformat() for day in conflicts]
+    
+    # Plan limit: one conditional $inc per affected month
+    if not await consume_series_quota(current_tenant.id, current_tenant.plan, occurrences):
+        await release_series_entries(current_tenant.id, series.staff_id, series.id, occurrences)
+        raise HTTPException(status_code=400, detail="Monatliches Terminlimit erreicht")
+    
+    series.last_end_at = occurrences[-1][2]
+    try:
+        await db.appointment_series.insert_one(to_mongo(series))
+    except Exception:
+        await release_series_entries(current_tenant.id, series.staff_id, series.id, occurrences)
+        await release_series_quota(current_tenant.id, occurrences)
+        raise
+    on_series_booked(current_tenant.id, series.staff_id, series.id, occurrences)
+    
+    return series
+
+@api_router.get("/appointment-series", response_model=List[AppointmentSeries])
+async def get_appointment_series(current_tenant: Tenant = Depends(get_current_tenant)):
+    series_docs = await db.appointment_series.find({"tenant_id": current_tenant.id}, model_projection(AppointmentSeries)).to_list(1000)
+    return [from_mongo(AppointmentSeries, series_doc) for series_doc in series_docs]
+
+@api_router.get("/appointment-series/{series_id}/occurrences")
+async def get_series_occurrences(
+    series_id: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    current_tenant: Tenant = Depends(get_current_tenant)
+):
+    """Occurrences of a series within a window of local dates (default: the next 180 days)"""
+    series_doc, tz_name = await load_series(current_tenant.id, series_id)
+    try:
+        first_day = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else get_local_today(tz_name)
+        last_day = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else first_day + timedelta(days=SERIES_DEFAULT_WINDOW_DAYS)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+    
+    window_start = get_day_bounds(first_day, tz_name)[0]
+    window_end = get_day_bounds(last_day, tz_name)[1]
+    return [
+        {**series_occurrence_doc(series_doc, occurrence), "date": occurrence[0].isoformat()}
+        for occurrence in series_occurrences(series_doc, tz_name, window_start, window_end)
+    ]
+
+@api_router.post("/appointment-series/{series_id}/skip")
+async def skip_series_occurrence(series_id: str, skip_data: SeriesOccurrenceSkip, current_tenant: Tenant = Depends(get_current_tenant)):
+    """Cancel a single occurrence by adding its date to the series exceptions"""
+    series_doc, tz_name = await load_series(current_tenant.id, series_id)
+    try:
+        day = datetime.strptime(skip_data.date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges Datumsformat. Verwenden Sie YYYY-MM-DD")
+    
+    occurrences = [occurrence for occurrence in series_occurrences(series_doc, tz_name, *get_day_bounds(day, tz_name)) if occurrence[0] == day]
+    if not occurrences:
+        raise HTTPException(status_code=404, detail="Termin nicht gefunden")
+    
+    # The exceptions filter makes concurrent skips of the same date release only once
+    result = await db.appointment_series.update_one(
+        {"id": series_id, "tenant_id": current_tenant.id, "exceptions": {"$ne": skip_data.date}},
+        {"$addToSet": {"exceptions": skip_data.date}}
+    )
+    if result.modified_count and series_doc["status"] == AppointmentStatus.CONFIRMED:
+        await release_series_entries(current_tenant.id, series_doc["staff_id"], series_id, occurrences)
+        await release_series_quota(current_tenant.id, occurrences)
+        on_series_released(current_tenant.id, series_doc["staff_id"], series_id, occurrences)
+    
+    return {"message": "Termin aus der Serie entfernt", "series_id": series_id, "date": skip_data.date}
+
+@api_router.delete("/appointment-series/{series_id}")
+async def delete_appointment_series(series_id: str, current_tenant: Tenant = Depends(get_current_tenant)):
+    series_doc, tz_name = await load_series(current_tenant.id, series_id)
+    deleted_doc = await db.appointment_series.find_one_and_delete({"id": series_id, "tenant_id": current_tenant.id}, {"_id": 0, "status": 1})
+    if not deleted_doc:
+        raise HTTPException(status_code=404, detail="Terminserie nicht gefunden")
+    
+    occurrences = series_occurrences(series_doc, tz_name)
+    await release_series_entries(current_tenant.id, series_doc["staff_id"], series_id, occurrences)
+    if deleted_doc.get("status") == AppointmentStatus.CONFIRMED:
+        await release_series_quota(current_tenant.id, occurrences)
+    on_series_released(current_tenant.id, series_doc["staff_id"], series_id, occurrences)
+    
+    return {"message": "Terminserie erfolgreich gelöscht", "series_id": series_id}
+
+@api_router.get("/usage")
+async def get_usage(current_tenant: Tenant = Depends(get_current_tenant)):
+    """Confirmed appointments counted against the current month's plan limit"""
+    year, month = usage_month(datetime.now(timezone.utc))
+    usage_doc = await db.usage_snapshots.find_one({"tenant_id": current_tenant.id, "year": year, "month": month}, model_projection(UsageSnapshot))
+    usage = from_mongo(UsageSnapshot, usage_doc) if usage_doc else UsageSnapshot(tenant_id=current_tenant.id, year=year, month=month)
+    return {
+        "year": year,
+        "month": month,
+        "appointments": usage.monthly_appointment_count,
+        "limit": APPOINTMENT_LIMITS[current_tenant.plan]
+    }
+
+@api_router.post("/usage/reconcile")
+async def reconcile_usage(current_tenant: Tenant = Depends(get_current_tenant)):
+    """Recount the tenant's monthly usage counters from its appointments"""
+    updated = await reconcile_usage_snapshots(current_tenant.id)
+    return {"message": "Nutzungszähler abgeglichen", "updated_counters": updated}
+
+@api_router.post("/availability/index/rebuild")
+async def rebuild_availability_index(days_ahead: int = 60, current_tenant: Tenant = Depends(get_current_tenant)):
+    """Reload the tenant's occupancy index from the database"""
+    if days_ahead < 1 or days_ahead > MAX_NEXT_AVAILABLE_HORIZON_DAYS:
+        raise HTTPException(status_code=400, detail=f"Zeitraum muss zwischen 1 und {MAX_NEXT_AVAILABLE_HORIZON_DAYS} Tagen liegen")
+    
+    loaded_days = await rebuild_occupancy_index(days_ahead, current_tenant.id)
+    return {"message": "Verfügbarkeitsindex neu aufgebaut", "staff_days": loaded_days}
+
+@api_router.get("/availability/cache/stats")
+async def get_availability_cache_stats(current_tenant: Tenant = Depends(get_current_tenant)):
+    """Hit, miss and eviction counters of this worker's availability cache and its event subscribers"""
+    return {**availability_cache.stats(), "events": slot_event_broker.stats()}
+
+# Waitlist endpoints
+@api_router.post("/public/{tenant_slug}/waitlist", response_model=WaitlistEntry)
+async def join_waitlist(tenant_slug: str, entry_data: WaitlistEntryCreate):
+    """Wait for a slot of a service between window_start and window_end.
+
+    When an appointment in the window is cancelled, the slot is held for the customer
+    for WAITLIST_OFFER_TTL_SECONDS; the entry then shows status "offered" and the
+    hold_id to book with.
+    """
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    tenant_id = tenant_doc["id"]
+    
+    service_doc = await db.services.find_one({"id": entry_data.service_id, "tenant_id": tenant_id, "active": True}, {"_id": 0, "capacity": 1})
+    if not service_doc:
+        raise HTTPException(status_code=404, detail="Service nicht gefunden")
+    if service_doc.get("capacity", 1) > 1:
+        raise HTTPException(status_code=400, detail="Für Kurse gibt es keine Warteliste")
+    if entry_data.staff_id and not await db.staff.find_one({"id": entry_data.staff_id, "tenant_id": tenant_id, "active": True}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Mitarbeiter nicht gefunden")
+    
+    window_start = parse_datetime(entry_data.window_start)
+    window_end = parse_datetime(entry_data.window_end)
+    if window_end <= window_start:
+        raise HTTPException(status_code=400, detail="Das Zeitfenster muss nach seinem Beginn enden")
+    if window_end - window_start > timedelta(days=WAITLIST_MAX_WINDOW_DAYS):
+        raise HTTPException(status_code=400, detail=f"Das Zeitfenster darf höchstens {WAITLIST_MAX_WINDOW_DAYS} Tage umfassen")
+    if window_end <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Zeitpunkt liegt in der Vergangenheit")
+    
+    entry = WaitlistEntry(
+        tenant_id=tenant_id,
+        **entry_data.dict(exclude={"window_start", "window_end"}),
+        window_start=window_start,
+        window_end=window_end,
+        window_days=waitlist_window_days(window_start, window_end)
+    )
+    await db.waitlist.insert_one(to_mongo(entry))
+    return entry
+
+@api_router.get("/public/{tenant_slug}/waitlist/{entry_id}", response_model=WaitlistEntry)
+async def get_waitlist_entry(tenant_slug: str, entry_id: str):
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    
+    await expire_stale_waitlist_offers(tenant_doc["id"])
+    entry_doc = await db.waitlist.find_one({"id": entry_id, "tenant_id": tenant_doc["id"]}, model_projection(WaitlistEntry))
+    if not entry_doc:
+        raise HTTPException(status_code=404, detail="Wartelisteneintrag nicht gefunden")
+    return from_mongo(WaitlistEntry, entry_doc)
+
+@api_router.delete("/public/{tenant_slug}/waitlist/{entry_id}")
+async def leave_waitlist(tenant_slug: str, entry_id: str):
+    """Leave the waitlist; a slot currently offered is passed on to the next customer"""
+    tenant_doc = await db.tenants.find_one({"slug": tenant_slug, "active": True}, {"_id": 0, "id": 1})
+    if not tenant_doc:
+        raise HTTPException(status_code=404, detail="Geschäft nicht gefunden")
+    tenant_id = tenant_doc["id"]
+    
+    entry_doc = await db.waitlist.find_one_and_update(
+        {"id": entry_id, "tenant_id": tenant_id, "status": {"$in": [WaitlistStatus.WAITING, WaitlistStatus.OFFERED]}},
+        {"$set": {"status": WaitlistStatus.CANCELLED}}
+    )
+    if not entry_doc:
+        raise HTTPException(status_code=404, detail="Wartelisteneintrag nicht gefunden")
+    
+    if entry_doc["status"] == WaitlistStatus.OFFERED and entry_doc.get("hold_id"):
+        hold_doc = await drop_slot_hold(tenant_id, entry_doc["hold_id"])
+        if hold_doc:
+            on_slot_freed(tenant_id, hold_doc["staff_id"], hold_doc["start_at"], hold_doc["end_at"])
+    return {"message": "Von der Warteliste entfernt"}
+
+@api_router.get("/waitlist", response_model=List[WaitlistEntry])
+async def get_waitlist(status: Optional[WaitlistStatus] = None, current_tenant: Tenant = Depends(get_current_tenant)):
+    await expire_stale_waitlist_offers(current_tenant.id)
+    query = {"tenant_id": current_tenant.id}
+    if status:
+        query["status"] = status
+    entries = await db.waitlist.find(query, model_projection(WaitlistEntry)).sort("created_at", 1).to_list(1000)
+    return [from_mongo(WaitlistEntry, entry) for entry in entries]
+
 # Stripe Payment Endpoints
 @api_router.post("/payments/checkout/session")
-async def create_checkout_session(checkout_data: CheckoutRequest, current_tenant: Tenant = Depends(get_current_tenant)):
+async def create_checkout_session(
+    checkout_data: CheckoutRequest,
+    current_tenant: Tenant = Depends(get_current_tenant),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Create a Stripe checkout session for plan upgrades"""
+    return await run_idempotent(
+        f"checkout:{current_tenant.id}", idempotency_key, checkout_data,
+        lambda: start_checkout_session(checkout_data, current_tenant)
+    )
+
+async def start_checkout_session(checkout_data: CheckoutRequest, current_tenant: Tenant):
     
     # Validate package exists
     if checkout_data.package_id not in PLAN_PACKAGES:
@@ -954,7 +4486,7 @@ async def create_checkout_session(checkout_data: CheckoutRequest, current_tenant
         )
         
         # Store in database
-        transaction_dict = prepare_for_mongo(payment_transaction.dict())
+        transaction_dict = to_mongo(payment_transaction)
         await db.payment_transactions.insert_one(transaction_dict)
         
         return {
@@ -974,12 +4506,12 @@ async def get_checkout_status(session_id: str, current_tenant: Tenant = Depends(
     transaction_doc = await db.payment_transactions.find_one({
         "session_id": session_id,
         "tenant_id": current_tenant.id
-    })
+    }, model_projection(PaymentTransaction))
     
     if not transaction_doc:
         raise HTTPException(status_code=404, detail="Zahlungssession nicht gefunden")
     
-    transaction = PaymentTransaction(**parse_from_mongo(transaction_doc))
+    transaction = from_mongo(PaymentTransaction, transaction_doc)
     
     # Don't check again if already processed successfully
     if transaction.payment_status == "paid" and transaction.status == "completed":
@@ -1007,7 +4539,7 @@ async def get_checkout_status(session_id: str, current_tenant: Tenant = Depends(
             update_data = {
                 "payment_status": checkout_status.payment_status,
                 "status": checkout_status.status,
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "updated_at": datetime.now(timezone.utc)
             }
             
             await db.payment_transactions.update_one(
@@ -1066,15 +4598,15 @@ async def handle_stripe_webhook(request: Request):
             session_id = webhook_response.session_id
             
             # Find transaction
-            transaction_doc = await db.payment_transactions.find_one({"session_id": session_id})
+            transaction_doc = await db.payment_transactions.find_one({"session_id": session_id}, model_projection(PaymentTransaction))
             
             if transaction_doc:
-                transaction = PaymentTransaction(**parse_from_mongo(transaction_doc))
+                transaction = from_mongo(PaymentTransaction, transaction_doc)
                 
                 # Update transaction status
                 update_data = {
                     "payment_status": webhook_response.payment_status,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
+                    "updated_at": datetime.now(timezone.utc)
                 }
                 
                 await db.payment_transactions.update_one(
@@ -1100,6 +4632,106 @@ async def handle_stripe_webhook(request: Request):
         logger.error(f"Webhook error: {str(e)}")
         raise HTTPException(status_code=500, detail="Webhook processing error")
 
+# Indexes (declared here, created idempotently at startup or with manage_indexes.py)
+DECLARED_INDEXES = {
+    "tenants": [
+        IndexModel("id", unique=True),
+        IndexModel("slug", unique=True),
+        IndexModel("email", unique=True),
+    ],
+    "staff": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("active", 1)]),
+    ],
+    "services": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("active", 1)]),
+    ],
+    "special_closures": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("staff_id", 1), ("date", 1)]),
+    ],
+    "appointments": [
+        IndexModel("id", unique=True),
+        # Occupancy loads and conflict checks per staff member
+        IndexModel([("tenant_id", 1), ("staff_id", 1), ("status", 1), ("start_at", 1)]),
+        # Listings, dashboard counts and day views over all staff
+        IndexModel([("tenant_id", 1), ("start_at", 1)]),
+        # Loads the bookings of several resources over a window in one query
+        IndexModel([("tenant_id", 1), ("resource_ids", 1), ("start_at", 1)]),
+    ],
+    "appointment_series": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("staff_id", 1), ("status", 1), ("start_at", 1)]),
+    ],
+    "class_sessions": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("service_id", 1), ("start_at", 1)]),
+    ],
+    "resources": [
+        IndexModel("id", unique=True),
+        IndexModel([("tenant_id", 1), ("kind", 1)]),
+    ],
+    "slot_holds": [
+        IndexModel("id", unique=True),
+        # MongoDB removes holds once expires_at has passed
+        IndexModel("expires_at", expireAfterSeconds=0),
+        IndexModel([("tenant_id", 1), ("staff_id", 1), ("start_at", 1)]),
+    ],
+    "waitlist": [
+        IndexModel("id", unique=True),
+        # One key per window day: a freed slot reads only the entries of its own day
+        IndexModel([("tenant_id", 1), ("status", 1), ("window_days", 1), ("created_at", 1)]),
+    ],
+    "usage_snapshots": [
+        IndexModel([("tenant_id", 1), ("year", 1), ("month", 1)], unique=True),
+    ],
+    "idempotency_keys": [
+        # MongoDB removes stored responses once expires_at has passed
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "payment_transactions": [
+        IndexModel("session_id"),
+    ],
+}
+
+def index_keys(keys) -> tuple:
+    """Comparable form of an index key specification"""
+    return tuple((field, direction) for field, direction in dict(keys).items())
+
+async def ensure_indexes() -> List[str]:
+    """Create every declared index (existing ones are left alone); returns the collections that failed.
+
+    A failure (e.g. duplicate slugs blocking a unique index) is logged and does not stop
+    the other collections.
+    """
+    failed = []
+    for collection_name, models in DECLARED_INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            logger.error(f"Indexes on {collection_name} could not be created: {e}")
+            failed.append(collection_name)
+    return failed
+
+async def check_indexes():
+    """Compare declared and existing indexes and report usage since the last server restart.
+
+    missing: declared but not present; undeclared: present but not declared;
+    unused: present with no recorded operations ($indexStats).
+    """
+    report = {"missing": [], "undeclared": [], "unused": []}
+    for collection_name, models in DECLARED_INDEXES.items():
+        collection = db[collection_name]
+        existing = {name: index_keys(info["key"]) for name, info in (await collection.index_information()).items() if name != "_id_"}
+        declared = {index_keys(model.document["key"]) for model in models}
+        report["missing"] += [{"collection": collection_name, "keys": list(keys)} for keys in declared - set(existing.values())]
+        report["undeclared"] += [{"collection": collection_name, "name": name} for name, keys in existing.items() if keys not in declared]
+        async for stats in collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                report["unused"].append({"collection": collection_name, "name": stats["name"], "since": stats["accesses"]["since"]})
+    return report
+
 # Include router
 app.include_router(api_router)
 
@@ -1116,6 +4748,43 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def migrate_stored_datetimes():
+    # Registered first: everything below queries by time. Collections already migrated
+    # are skipped; later rescans are left to migrate_datetimes.py
+    converted = await migrate_datetimes(rescan=False)
+    if any(converted.values()):
+        logger.info(f"Datetime migration converted {sum(converted.values())} documents")
+
+@app.on_event("startup")
+async def create_declared_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def warm_occupancy_index():
+    if OCCUPANCY_INDEX_WARMUP_DAYS > 0:
+        loaded_days = await rebuild_occupancy_index(OCCUPANCY_INDEX_WARMUP_DAYS)
+        logger.info(f"Occupancy index warmed with {loaded_days} staff days")
+
+@app.on_event("startup")
+async def prepare_usage_counters():
+    # Counters start from the real appointment numbers on first deploy
+    if not await db.migrations.find_one({"_id": "usage_snapshots"}):
+        await reconcile_usage_snapshots()
+        await db.migrations.update_one({"_id": "usage_snapshots"}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True)
+
+@app.on_event("startup")
+async def prepare_reservation_ledger():
+    recorded = await backfill_reservation_ledger()
+    if recorded:
+        logger.info(f"Reservation ledger backfilled with {recorded} appointments")
+
+@app.on_event("startup")
+async def prepare_display_fields():
+    filled = await backfill_display_fields()
+    if filled:
+        logger.info(f"Display fields backfilled on {filled} appointments")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
@@ -2,6 +2,7 @@ import requests
 import json
 from datetime import datetime, timedelta, timezone
 import uuid
+import time
 
 class FocusedAppointmentTester:
     def __init__(self, base_url="https://daylane-booking.preview.emergentagent.com"):
@@ -74,6 +75,7 @@ class FocusedAppointmentTester:
         if success and 'access_token' in response:
             self.token = response['access_token']
             self.tenant_id = response['tenant']['id']
+            self.test_data['slug'] = tenant_data['slug']
             print(f"   ✅ Tenant registered: {response['tenant']['name']}")
         else:
             return False
@@ -428,6 +430,191 @@ class FocusedAppointmentTester:
         
         return final_count_correct
 
+    def test_bulk_import(self):
+        """Import CSV rows and check the per-row report"""
+        print("\n📥 Testing Bulk Appointment Import...")
+        
+        day = (datetime.now() + timedelta(days=40)).strftime('%Y-%m-%d')
+        service_id = self.test_data['service_id']
+        staff_id = self.test_data['staff_id']
+        upload = "\n".join([
+            "service_id,staff_id,start_at,customer_name,customer_email",
+            f"{service_id},{staff_id},{day}T09:00:00,Import Kunde 1,import1@example.com",
+            f"{service_id},{staff_id},{day}T09:15:00,Import Kunde 2,",
+            f"{service_id},{staff_id},{day}T10:00:00,\"Muster, Anna\",",
+            f"unknown-service,{staff_id},{day}T11:00:00,Import Kunde 4,"
+        ])
+        
+        url = f"{self.api_url}/appointments/bulk"
+        print(f"\n🔍 Import CSV")
+        print(f"   POST {url}")
+        try:
+            response = requests.post(url, data=upload.encode("utf-8"), headers={
+                'Content-Type': 'text/csv',
+                'Authorization': f'Bearer {self.token}'
+            }, timeout=30)
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+            return False
+        if response.status_code != 200:
+            print(f"   ❌ Expected 200, got {response.status_code}")
+            return False
+        
+        report = [json.loads(line) for line in response.text.splitlines() if line]
+        results = {result['line']: result for result in report if 'line' in result}
+        expected = {2: "created", 3: "error", 4: "created", 5: "error"}
+        if {line: result['status'] for line, result in results.items()} != expected:
+            print(f"   ❌ Unexpected report: {report}")
+            return False
+        if report[-1].get('summary') != {"rows": 4, "created": 2, "failed": 2}:
+            print(f"   ❌ Unexpected summary: {report[-1]}")
+            return False
+        print(f"   ✅ Overlapping and invalid rows reported: {results[3]['detail']}, {results[5]['detail']}")
+        
+        success, appointments = self.run_test(
+            "Get Appointments After Import", "GET", "appointments", 200)
+        imported = [apt for apt in appointments if apt['id'] in (results[2]['appointment_id'], results[4]['appointment_id'])]
+        if not success or len(imported) != 2:
+            print("   ❌ Imported appointments not found in list")
+            return False
+        print("   ✅ Imported appointments listed")
+        return True
+
+    def test_reschedule(self):
+        """Move an appointment, including a move that overlaps its old time"""
+        print("\n🕑 Testing Appointment Reschedule...")
+        
+        start = (datetime.now(timezone.utc) + timedelta(days=45)).replace(hour=8, minute=0, second=0, microsecond=0)
+        appointment_data = {
+            "service_id": self.test_data['service_id'],
+            "staff_id": self.test_data['staff_id'],
+            "start_at": start.isoformat(),
+            "customer_name": "Verschiebe Kunde"
+        }
+        success, first = self.run_test(
+            "Create Appointment to Move", "POST", "appointments", 200, appointment_data)
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "Create Blocking Appointment", "POST", "appointments", 200,
+            {**appointment_data, "start_at": (start + timedelta(hours=2)).isoformat(), "customer_name": "Blocker"})
+        if not success:
+            return False
+        
+        success, moved = self.run_test(
+            "Move by 15 Minutes", "PUT", f"appointments/{first['id']}/reschedule", 200,
+            {"start_at": (start + timedelta(minutes=15)).isoformat()})
+        if not success:
+            return False
+        moved_start = datetime.fromisoformat(moved['start_at'].replace('Z', '+00:00'))
+        moved_end = datetime.fromisoformat(moved['end_at'].replace('Z', '+00:00'))
+        # Test service: 30 minutes plus 5 minutes buffer
+        if moved_start != start + timedelta(minutes=15) or moved_end - moved_start != timedelta(minutes=35):
+            print(f"   ❌ Unexpected times: {moved['start_at']} - {moved['end_at']}")
+            return False
+        print("   ✅ Appointment moved, end time recomputed")
+        
+        success, _ = self.run_test(
+            "Move onto Blocking Appointment", "PUT", f"appointments/{first['id']}/reschedule", 400,
+            {"start_at": (start + timedelta(hours=2)).isoformat()})
+        if not success:
+            return False
+        
+        success, _ = self.run_test(
+            "Book Freed Time", "POST", "appointments", 200,
+            {**appointment_data, "start_at": (start - timedelta(minutes=30)).isoformat(), "customer_name": "Nachrücker"})
+        return success
+
+    def test_waitlist(self):
+        """A cancelled appointment is held for the first customer on the waitlist"""
+        print("\n⏳ Testing Waitlist...")
+        
+        day = datetime.now(timezone.utc) + timedelta(days=47)
+        day += timedelta(days=(1 - day.weekday()) % 7)  # A Tuesday, inside the default working hours
+        start = day.replace(hour=9, minute=0, second=0, microsecond=0)
+        slug = self.test_data['slug']
+        success, appointment = self.run_test(
+            "Book Slot", "POST", "appointments", 200,
+            {"service_id": self.test_data['service_id'], "staff_id": self.test_data['staff_id'],
+             "start_at": start.isoformat(), "customer_name": "Erstkunde"})
+        if not success:
+            return False
+        
+        window = {"service_id": self.test_data['service_id'], "staff_id": self.test_data['staff_id'],
+                  "window_start": (start - timedelta(hours=1)).isoformat(), "window_end": (start + timedelta(hours=2)).isoformat()}
+        success, entry = self.run_test(
+            "Join Waitlist", "POST", f"public/{slug}/waitlist", 200,
+            {**window, "customer_name": "Warteliste Kunde", "customer_email": "warte@example.com"})
+        if not success or entry['status'] != 'waiting':
+            return False
+        success, _ = self.run_test(
+            "Reject Reversed Window", "POST", f"public/{slug}/waitlist", 400,
+            {**window, "window_start": window['window_end'], "window_end": window['window_start'],
+             "customer_name": "Falsch", "customer_email": "falsch@example.com"})
+        if not success:
+            return False
+        
+        success, _ = self.run_test(
+            "Cancel Appointment", "PUT", f"appointments/{appointment['id']}", 200, {"status": "cancelled"})
+        if not success:
+            return False
+        
+        # The offer is made in the background after the cancellation response
+        for _ in range(20):
+            success, entry = self.run_test("Poll Waitlist Entry", "GET", f"public/{slug}/waitlist/{entry['id']}", 200)
+            if not success or entry['status'] == 'offered':
+                break
+            time.sleep(0.25)
+        if entry.get('status') != 'offered' or not entry.get('hold_id'):
+            print(f"   ❌ Freed slot not offered: {entry}")
+            return False
+        print("   ✅ Freed slot held for the waiting customer")
+        
+        success, _ = self.run_test(
+            "Book Offered Slot", "POST", f"public/{slug}/appointments", 200,
+            {"service_id": self.test_data['service_id'], "hold_id": entry['hold_id'], "start_at": start.isoformat(),
+             "customer_name": "Warteliste Kunde", "customer_email": "warte@example.com"})
+        if not success:
+            return False
+        success, entry = self.run_test("Check Entry Booked", "GET", f"public/{slug}/waitlist/{entry['id']}", 200)
+        return success and entry['status'] == 'booked'
+
+    def test_display_fields(self):
+        """Service and staff renames reach existing appointments without a lookup on read"""
+        print("\n🏷️ Testing Appointment Display Fields...")
+        
+        start = (datetime.now(timezone.utc) + timedelta(days=50)).replace(hour=8, minute=0, second=0, microsecond=0)
+        success, appointment = self.run_test(
+            "Create Appointment", "POST", "appointments", 200,
+            {"service_id": self.test_data['service_id'], "staff_id": self.test_data['staff_id'],
+             "start_at": start.isoformat(), "customer_name": "Anzeige Kunde"})
+        if not success:
+            return False
+        if appointment.get('service_name') != self.test_data['service_name'] or appointment.get('staff_name') != self.test_data['staff_name']:
+            print(f"   ❌ Display fields not stored: {appointment}")
+            return False
+        
+        self.test_data['service_name'] += " (neu)"
+        success, _ = self.run_test(
+            "Rename Service", "PUT", f"services/{self.test_data['service_id']}", 200, {"name": self.test_data['service_name']})
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "Recolour Staff", "PUT", f"staff/{self.test_data['staff_id']}", 200, {"color_tag": "#10B981"})
+        if not success:
+            return False
+        
+        # Renames are copied to the appointments in the background
+        for _ in range(20):
+            success, appointments = self.run_test("Poll Appointments", "GET", "appointments", 200)
+            listed = next((apt for apt in appointments if apt['id'] == appointment['id']), {}) if success else {}
+            if listed.get('service_name') == self.test_data['service_name'] and listed.get('staff_color') == "#10B981":
+                print("   ✅ Rename and colour change copied to the appointment")
+                return True
+            time.sleep(0.25)
+        print(f"   ❌ Display fields not updated: {listed}")
+        return False
+
     def run_all_tests(self):
         """Run all focused tests"""
         print("🎯 FOCUSED APPOINTMENT MANAGEMENT & DASHBOARD TESTING")
@@ -440,7 +627,11 @@ class FocusedAppointmentTester:
         tests = [
             ("Appointment CRUD Operations", self.test_appointment_crud_operations),
             ("Dashboard with Real Data", self.test_dashboard_with_real_data),
-            ("End-to-End Workflow", self.test_end_to_end_workflow)
+            ("End-to-End Workflow", self.test_end_to_end_workflow),
+            ("Bulk Import", self.test_bulk_import),
+            ("Reschedule", self.test_reschedule),
+            ("Waitlist", self.test_waitlist),
+            ("Display Fields", self.test_display_fields)
         ]
         
         results = {}
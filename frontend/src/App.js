@@ -16,6 +16,19 @@ import { Calendar, Clock, Users, Settings, CreditCard, BarChart3, ExternalLink,
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// POST with an Idempotency-Key, retried on network errors; the server answers retries with the first response
+const postIdempotent = async (url, data, config = {}, attempts = 3) => {
+  const key = crypto.randomUUID();
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await axios.post(url, data, { ...config, headers: { ...config.headers, 'Idempotency-Key': key } });
+    } catch (error) {
+      if (error.response || attempt >= attempts) throw error;
+      await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+  }
+};
+
 // Auth Context
 const AuthContext = React.createContext();
 
@@ -1498,6 +1511,7 @@ const ServiceEditModal = ({ isOpen, onClose, service, onServiceUpdated }) => {
     duration_minutes: service?.duration_minutes || 30,
     price_chf: service?.price_chf || 0,
     buffer_minutes: service?.buffer_minutes || 5,
+    capacity: service?.capacity || 1,
     active: service?.active !== false
   });
   const [loading, setLoading] = useState(false);
@@ -1510,6 +1524,7 @@ const ServiceEditModal = ({ isOpen, onClose, service, onServiceUpdated }) => {
         duration_minutes: service.duration_minutes,
         price_chf: service.price_chf,
         buffer_minutes: service.buffer_minutes || 5,
+        capacity: service.capacity || 1,
         active: service.active !== false
       });
     }
@@ -1589,6 +1604,15 @@ const ServiceEditModal = ({ isOpen, onClose, service, onServiceUpdated }) => {
                 onChange={(e) => setFormData({...formData, buffer_minutes: parseInt(e.target.value) || 0})}
               />
             </div>
+            <div>
+              <label className="block text-sm font-medium mb-1">Plätze pro Termin</label>
+              <Input
+                type="number"
+                min="1"
+                value={formData.capacity}
+                onChange={(e) => setFormData({...formData, capacity: parseInt(e.target.value) || 1})}
+              />
+            </div>
             <div className="flex items-center space-x-2">
               <input
                 type="checkbox"
@@ -1994,12 +2018,17 @@ const ServiceCreateForm = ({ onSubmit, onCancel, loading }) => {
     description: '',
     duration_minutes: 30,
     price_chf: 0,
-    buffer_minutes: 5
+    buffer_minutes: 5,
+    capacity: 1,
+    required_resource_kinds: ''
   });
 
   const handleSubmit = (e) => {
     e.preventDefault();
-    onSubmit(formData);
+    onSubmit({
+      ...formData,
+      required_resource_kinds: formData.required_resource_kinds.split(',').map(kind => kind.trim()).filter(Boolean)
+    });
   };
 
   return (
@@ -2059,6 +2088,25 @@ const ServiceCreateForm = ({ onSubmit, onCancel, loading }) => {
             />
             <p className="text-sm text-gray-500 mt-1">Zeit zwischen Terminen für Reinigung, Vorbereitung etc.</p>
           </div>
+          <div>
+            <label className="block text-sm font-medium mb-1">Plätze pro Termin</label>
+            <Input
+              type="number"
+              min="1"
+              value={formData.capacity}
+              onChange={(e) => setFormData({...formData, capacity: parseInt(e.target.value) || 1})}
+            />
+            <p className="text-sm text-gray-500 mt-1">Mehr als 1 Platz macht die Dienstleistung zu einem Kurs</p>
+          </div>
+          <div>
+            <label className="block text-sm font-medium mb-1">Benötigte Ressourcen</label>
+            <Input
+              value={formData.required_resource_kinds}
+              onChange={(e) => setFormData({...formData, required_resource_kinds: e.target.value})}
+              placeholder="z.B. room, laser"
+            />
+            <p className="text-sm text-gray-500 mt-1">Pro Art wird eine freie Ressource mitgebucht (kommagetrennt)</p>
+          </div>
           <div className="flex space-x-2">
             <Button type="submit" disabled={loading}>
               {loading ? 'Wird erstellt...' : 'Dienstleistung hinzufügen'}
@@ -2172,7 +2220,7 @@ const Dashboard = () => {
     setPaymentStatus(null);
     
     try {
-      const response = await axios.post(`${API}/payments/checkout/session`, {
+      const response = await postIdempotent(`${API}/payments/checkout/session`, {
         package_id: packageId,
         origin_url: window.location.origin
       }, {
@@ -3160,6 +3208,9 @@ const PublicBookingPage = () => {
     notes: ''
   });
   const [availableSlots, setAvailableSlots] = useState([]);
+  const [slotStartTimes, setSlotStartTimes] = useState({});
+  const [slotSeatsLeft, setSlotSeatsLeft] = useState({});
+  const [holdId, setHoldId] = useState(null);
   const [submitting, setSubmitting] = useState(false);
   const [bookingComplete, setBookingComplete] = useState(false);
 
@@ -3180,6 +3231,7 @@ const PublicBookingPage = () => {
       setServices(infoResponse.data.services);
       setStaff(infoResponse.data.staff);
       setSpecialClosures(closuresResponse.data);
+      await openWaitlistOffer();
     } catch (error) {
       console.error('Error fetching tenant info:', error);
     } finally {
@@ -3187,19 +3239,35 @@ const PublicBookingPage = () => {
     }
   };
 
-  const fetchAppointmentsForDate = async (date, staffId) => {
+  // Link from the waitlist offer mail: open the held slot directly in the booking form
+  const openWaitlistOffer = async () => {
+    const entryId = new URLSearchParams(window.location.search).get('waitlist');
+    if (!entryId) return;
     try {
-      // Fetch appointments for the specific date and staff
-      const response = await axios.get(`${API}/public/${tenantSlug}/appointments`, {
-        params: {
-          date: date,
-          staff_id: staffId
-        }
-      });
-      return response.data || [];
+      const response = await axios.get(`${API}/public/${tenantSlug}/waitlist/${entryId}`);
+      const entry = response.data;
+      if (entry.status !== 'offered') {
+        alert('Dieses Angebot ist nicht mehr gültig');
+        return;
+      }
+      const start = new Date(entry.offer_start_at);
+      const pad = (n) => String(n).padStart(2, '0');
+      const time = `${pad(start.getHours())}:${pad(start.getMinutes())}`;
+      setBooking(prev => ({
+        ...prev,
+        serviceId: entry.service_id,
+        staffId: entry.offer_staff_id,
+        date: `${start.getFullYear()}-${pad(start.getMonth() + 1)}-${pad(start.getDate())}`,
+        time,
+        customerName: entry.customer_name,
+        customerEmail: entry.customer_email,
+        customerPhone: entry.customer_phone || ''
+      }));
+      setSlotStartTimes({ [time]: entry.offer_start_at });
+      setHoldId(entry.hold_id);
+      setCurrentStep(5);
     } catch (error) {
-      console.error('Error fetching appointments:', error);
-      return [];
+      console.error('Error fetching waitlist offer:', error);
     }
   };
 
@@ -3240,95 +3308,65 @@ const PublicBookingPage = () => {
 
   const generateTimeSlots = async (selectedDate, staffId = null) => {
     const actualStaffId = staffId || booking.staffId;
-    if (!actualStaffId) {
+    if (!actualStaffId || !booking.serviceId) {
       setAvailableSlots([]);
       return;
     }
 
-    const selectedStaff = staff.find(s => s.id === actualStaffId);
-    if (!selectedStaff) {
-      setAvailableSlots([]);
-      return;
-    }
-
-    const bookingDate = new Date(selectedDate);
-    
-    // Check if staff is working on this day
-    if (!isStaffWorkingOnDay(selectedStaff, bookingDate)) {
+    try {
+      // The server computes bookable slots from working hours, closures and existing appointments
+      const response = await axios.get(`${API}/public/${tenantSlug}/availability`, {
+        params: {
+          service_id: booking.serviceId,
+          staff_id: actualStaffId,
+          date: selectedDate
+        }
+      });
+      const slots = response.data.slots || [];
+      setSlotStartTimes(Object.fromEntries(slots.map(slot => [slot.time, slot.start_at])));
+      setSlotSeatsLeft(Object.fromEntries(slots.map(slot => [slot.time, slot.seats_left])));
+      setAvailableSlots(slots.map(slot => slot.time));
+    } catch (error) {
+      console.error('Error fetching availability:', error);
       setAvailableSlots([]);
-      return;
     }
+  };
 
-    // Check if there's a special closure
-    if (hasSpecialClosure(actualStaffId, bookingDate)) {
-      setAvailableSlots([]);
-      return;
+  // Reload the shown slots when another booking or a closure changes them
+  useEffect(() => {
+    if (!booking.serviceId || !booking.staffId || !booking.date || typeof EventSource === 'undefined') {
+      return undefined;
     }
 
-    // Get working hours for the day
-    const workingHours = getStaffWorkingHours(selectedStaff, bookingDate);
-    if (!workingHours) {
-      setAvailableSlots([]);
-      return;
-    }
+    const events = new EventSource(`${API}/public/${tenantSlug}/events`);
+    const refresh = () => generateTimeSlots(booking.date, booking.staffId);
 
-    // Fetch existing appointments for conflict checking
-    const existingAppointments = await fetchAppointmentsForDate(selectedDate, actualStaffId);
-    
-    // Get selected service duration
-    const selectedService = services.find(s => s.id === booking.serviceId);
-    const serviceDuration = selectedService ? selectedService.duration_minutes : 30;
-    const bufferTime = selectedService ? selectedService.buffer_minutes || 0 : 0;
-    const totalSlotDuration = serviceDuration + bufferTime;
-
-    // Generate time slots within working hours
-    const allSlots = [];
-    const startHour = parseInt(workingHours.start_time.split(':')[0]);
-    const startMinute = parseInt(workingHours.start_time.split(':')[1]);
-    const endHour = parseInt(workingHours.end_time.split(':')[0]);
-    const endMinute = parseInt(workingHours.end_time.split(':')[1]);
-    
-    let currentHour = startHour;
-    let currentMinute = startMinute;
-    
-    while (currentHour < endHour || (currentHour === endHour && currentMinute < endMinute)) {
-      const timeString = `${currentHour.toString().padStart(2, '0')}:${currentMinute.toString().padStart(2, '0')}`;
-      allSlots.push(timeString);
-      
-      // Add 30 minutes
-      currentMinute += 30;
-      if (currentMinute >= 60) {
-        currentMinute = 0;
-        currentHour += 1;
+    events.addEventListener('slots', (event) => {
+      const change = JSON.parse(event.data);
+      if (change.staff_id === booking.staffId && change.dates.includes(booking.date)) {
+        refresh();
       }
-    }
-    
-    // Filter out slots that conflict with existing appointments
-    const availableSlots = allSlots.filter(timeSlot => {
-      // Check if this slot conflicts with any existing appointment
-      return !hasConflict(timeSlot, selectedDate, existingAppointments, totalSlotDuration);
     });
-    
-    setAvailableSlots(availableSlots);
-  };
-
-  // Helper function to check if a time slot conflicts with existing appointments
-  const hasConflict = (timeSlot, date, existingAppointments, duration) => {
-    const [hours, minutes] = timeSlot.split(':').map(Number);
-    const slotStart = new Date(date);
-    slotStart.setHours(hours, minutes, 0, 0);
-    
-    const slotEnd = new Date(slotStart.getTime() + duration * 60000); // Add duration in milliseconds
-    
-    return existingAppointments.some(appointment => {
-      const appointmentStart = new Date(appointment.start_at);
-      const appointmentEnd = new Date(appointment.end_at);
-      
-      // Check if the new slot overlaps with existing appointment
-      // Overlap occurs if: slot_start < appointment_end AND slot_end > appointment_start
-      return slotStart < appointmentEnd && slotEnd > appointmentStart;
+    events.addEventListener('staff', (event) => {
+      if (JSON.parse(event.data).staff_id === booking.staffId) {
+        refresh();
+      }
     });
-  };
+    events.addEventListener('service', (event) => {
+      if (JSON.parse(event.data).service_id === booking.serviceId) {
+        refresh();
+      }
+    });
+    events.addEventListener('resources', (event) => {
+      const selectedService = services.find(s => s.id === booking.serviceId);
+      if (selectedService?.required_resource_kinds?.length && JSON.parse(event.data).dates.includes(booking.date)) {
+        refresh();
+      }
+    });
+    events.addEventListener('resync', refresh);
+
+    return () => events.close();
+  }, [tenantSlug, booking.serviceId, booking.staffId, booking.date, services]);
 
   // Filter staff based on service and working hours
   const getAvailableStaff = () => {
@@ -3369,7 +3407,38 @@ const PublicBookingPage = () => {
     setCurrentStep(4);
   };
 
-  const handleTimeSelect = (time) => {
+  const releaseHold = async () => {
+    if (!holdId) return;
+    setHoldId(null);
+    try {
+      await axios.delete(`${API}/public/${tenantSlug}/holds/${holdId}`);
+    } catch (error) {
+      // Expired holds are already gone
+    }
+  };
+
+  const handleTimeSelect = async (time) => {
+    await releaseHold();
+    const selectedService = services.find(s => s.id === booking.serviceId);
+    if (selectedService?.capacity > 1) {
+      // Class seats are taken on booking; there is no hold for a shared slot
+      setBooking({...booking, time});
+      setCurrentStep(5);
+      return;
+    }
+    try {
+      // Reserve the slot for a few minutes while the customer enters their details
+      const response = await axios.post(`${API}/public/${tenantSlug}/holds`, {
+        service_id: booking.serviceId,
+        staff_id: booking.staffId,
+        start_at: slotStartTimes[time]
+      });
+      setHoldId(response.data.id);
+    } catch (error) {
+      alert(error.response?.data?.detail || 'Dieser Termin ist nicht mehr verfügbar');
+      await generateTimeSlots(booking.date, booking.staffId);
+      return;
+    }
     setBooking({...booking, time});
     setCurrentStep(5);
   };
@@ -3385,14 +3454,15 @@ const PublicBookingPage = () => {
       const appointmentData = {
         service_id: booking.serviceId,
         staff_id: booking.staffId,
-        start_at: bookingDateTime.toISOString(),
+        start_at: slotStartTimes[booking.time] || bookingDateTime.toISOString(),
         customer_name: booking.customerName,
         customer_email: booking.customerEmail,
         customer_phone: booking.customerPhone,
-        notes: booking.notes
+        notes: booking.notes,
+        hold_id: holdId
       };
 
-      await axios.post(`${API}/public/${tenantSlug}/appointments`, appointmentData);
+      await postIdempotent(`${API}/public/${tenantSlug}/appointments`, appointmentData);
       setBookingComplete(true);
     } catch (error) {
       console.error('Error creating appointment:', error);
@@ -3612,6 +3682,9 @@ const PublicBookingPage = () => {
                       className="p-3 border border-gray-200 rounded-lg hover:border-blue-500 hover:bg-blue-50 text-center transition-colors"
                     >
                       <span className="font-medium">{time}</span>
+                      {slotSeatsLeft[time] !== undefined && (
+                        <span className="block text-xs text-gray-500">{slotSeatsLeft[time]} Plätze frei</span>
+                      )}
                     </button>
                   ))}
                 </div>
@@ -3714,6 +3787,14 @@ const AppointmentDetailsModal = ({ isOpen, onClose, appointment, staff, services
     notes: '',
     status: 'confirmed'
   });
+  const [moveData, setMoveData] = useState({ start: '', staff_id: '' });
+
+  // datetime-local value in the browser's timezone
+  const toLocalInput = (iso) => {
+    const value = new Date(iso);
+    const pad = (n) => String(n).padStart(2, '0');
+    return `${value.getFullYear()}-${pad(value.getMonth() + 1)}-${pad(value.getDate())}T${pad(value.getHours())}:${pad(value.getMinutes())}`;
+  };
 
   useEffect(() => {
     if (appointment) {
@@ -3724,6 +3805,7 @@ const AppointmentDetailsModal = ({ isOpen, onClose, appointment, staff, services
         notes: appointment.notes || '',
         status: appointment.status || 'confirmed'
       });
+      setMoveData({ start: toLocalInput(appointment.start_at), staff_id: appointment.staff_id });
       setIsEditing(false);
     }
   }, [appointment]);
@@ -3731,6 +3813,20 @@ const AppointmentDetailsModal = ({ isOpen, onClose, appointment, staff, services
   const handleUpdate = async () => {
     setLoading(true);
     try {
+      // Moving is a single server-side step; the old slot stays taken until the new one is reserved
+      if (moveData.start !== toLocalInput(appointment.start_at) || moveData.staff_id !== appointment.staff_id) {
+        await axios.put(
+          `${API}/appointments/${appointment.id}/reschedule`,
+          {
+            start_at: new Date(moveData.start).toISOString(),
+            staff_id: moveData.staff_id
+          },
+          {
+            headers: { Authorization: `Bearer ${token}` }
+          }
+        );
+      }
+
       const updateData = {
         customer_name: formData.customer_name,
         customer_email: formData.customer_email,
@@ -3867,6 +3963,34 @@ const AppointmentDetailsModal = ({ isOpen, onClose, appointment, staff, services
             </div>
           </div>
 
+          {isEditing && appointment.status === 'confirmed' && (
+            <div>
+              <h4 className="font-semibold mb-3">Termin verschieben</h4>
+              <div className="grid grid-cols-2 gap-3">
+                <div>
+                  <label className="block text-sm text-gray-500 mb-1">Beginn</label>
+                  <Input
+                    type="datetime-local"
+                    value={moveData.start}
+                    onChange={(e) => setMoveData({...moveData, start: e.target.value})}
+                  />
+                </div>
+                <div>
+                  <label className="block text-sm text-gray-500 mb-1">Mitarbeiter</label>
+                  <select
+                    value={moveData.staff_id}
+                    onChange={(e) => setMoveData({...moveData, staff_id: e.target.value})}
+                    className="w-full p-3 border border-gray-200 rounded-lg"
+                  >
+                    {staff.map(member => (
+                      <option key={member.id} value={member.id}>{member.name}</option>
+                    ))}
+                  </select>
+                </div>
+              </div>
+            </div>
+          )}
+
           {/* Customer Details */}
           <div>
             <h4 className="font-semibold mb-3">Kundendaten</h4>